@@ -0,0 +1,12 @@
+from mahjong_calculator.awards import compute_awards, load_awards
+from mahjong_calculator.database import open_database
+from mahjong_calculator.payouts import get_payouts, settle_up
+from mahjong_calculator.rollups import get_leaderboard, get_standings
+from mahjong_calculator.schema import migrate
+from mahjong_calculator.settlement import DEFAULT_SCORING, PayoffTable, hand_points, settle, settle_points
+from mahjong_calculator.simulation import get_simulation, simulate
+from mahjong_calculator.storage import Storage
+
+__all__ = ['DEFAULT_SCORING', 'PayoffTable', 'Storage', 'compute_awards', 'get_leaderboard', 'get_payouts', 'get_standings',
+           'get_simulation', 'hand_points', 'load_awards', 'migrate', 'open_database', 'settle', 'settle_points', 'settle_up',
+           'simulate']
@@ -0,0 +1,5 @@
+import sys
+
+from mahjong_calculator.cli import main
+
+sys.exit(main())
@@ -0,0 +1,77 @@
+# The five awards. load_awards reads the per-player counts from player_stats
+# and the arch nemesis from the head-to-head matrix; compute_awards derives the same awards from raw game_log rows in one pass
+# and is kept as the reference they are checked against.
+from collections import Counter
+
+from mahjong_calculator.rivalry import arch_nemesis, load_head_to_head
+from mahjong_calculator.schema import PLAYER_TABLE, STATS_TABLE
+from mahjong_calculator.settlement import SELF_DRAW
+
+AWARD_NAMES = ['innocent_bystander', 'arch_nemesis', 'big', 'charity', 'selfdraw']
+
+
+def leaders(counter):
+    # Highest value and every name that ties for it, in name order.
+    if len(counter) == 0:
+        return None, None
+    best = max(counter.values())
+    return best, sorted(name for name, value in counter.items() if value == best)
+
+
+def compute_awards(rows):
+    """rows yields (Winner, Loser1, Loser2, Loser3, WinType, Points) tuples."""
+    self_draw_losses = Counter()
+    pair_counts = Counter()
+    point_sums = Counter()
+    win_counts = Counter()
+    charity_counts = Counter()
+    self_draw_wins = Counter()
+
+    for winner, loser1, loser2, loser3, win_type, points in rows:
+        if winner is not None and points is not None:
+            point_sums[winner] += points
+            win_counts[winner] += 1
+        if win_type == SELF_DRAW:
+            for loser in (loser1, loser2, loser3):
+                if loser is not None:
+                    self_draw_losses[loser] += 1
+            if winner is not None:
+                self_draw_wins[winner] += 1
+        elif win_type is not None and loser1 is not None:
+            charity_counts[loser1] += 1
+            if winner is not None:
+                pair_counts[f'{winner}-{loser1}' if winner < loser1 else f'{loser1}-{winner}'] += 1
+
+    average_points = Counter({winner: point_sums[winner]/win_counts[winner] for winner in win_counts})
+    return {
+        'innocent_bystander': leaders(self_draw_losses),
+        'arch_nemesis': leaders(pair_counts),
+        'big': leaders(average_points),
+        'charity': leaders(charity_counts),
+        'selfdraw': leaders(self_draw_wins),
+    }
+
+
+def load_awards(db, session_id):
+    with db.read() as conn:
+        stats = conn.execute(
+            f'''SELECT p.Name, s.SelfDrawLosses, s.Wins, s.WinPoints, s.FullSelfDrawLosses + s.OutRightLosses, s.SelfDrawWins
+                FROM {STATS_TABLE} s JOIN {PLAYER_TABLE} p ON p.ID = s.PlayerID WHERE s.SessionID = ?''',
+            (session_id,)
+        ).fetchall()
+        matrix = load_head_to_head(conn, session_id)
+    awards = {'arch_nemesis': arch_nemesis(matrix), **stat_awards(stats)}
+    return {name: awards[name] for name in AWARD_NAMES}
+
+
+def stat_awards(stats):
+    """The awards that come from per-player counts alone.
+
+    stats yields (Player, SelfDrawLosses, Wins, WinPoints, FullSelfDrawLosses + OutRightLosses, SelfDrawWins).
+    """
+    return {
+        'innocent_bystander': leaders(Counter({x[0]: x[1] for x in stats if x[1] > 0})),
+        'big': leaders(Counter({x[0]: x[3]/x[2] for x in stats if x[2] > 0})),
+        'charity': leaders(Counter({x[0]: x[4] for x in stats if x[4] > 0})),
+        'selfdraw': leaders(Counter({x[0]: x[5] for x in stats if x[5] > 0})),
+    }
@@ -0,0 +1,76 @@
+# Statistics computed off the render path.
+#
+# refresh() hands back whatever was last computed for a key straight away and,
+# when that was computed for an older log version, has a worker thread compute
+# it again. A key is only ever being computed once at a time: versions asked
+# for while it runs are folded into the next run, so a burst of hands costs at
+# most one extra recompute rather than one per hand.
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+WORKERS = 2
+
+
+class Background:
+    def __init__(self, workers=WORKERS):
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='mahjong-background')
+        self.lock = threading.Lock()
+        self.done = threading.Condition(self.lock)
+        self.entries = {}
+        self.runs = 0
+
+    def refresh(self, key, version, compute, first_wait=0):
+        """(last value or None, whether it is for version); recomputes it in the background if not.
+
+        When nothing has been computed for key yet, waits up to first_wait seconds for it.
+        """
+        with self.lock:
+            entry = self.entries.setdefault(key, {'version': None, 'value': None, 'wanted': None,
+                                                  'running': False, 'error': None})
+            if entry['version'] == version:
+                return entry['value'], True
+            if entry['error'] is not None and entry['wanted'] == version:
+                error, entry['error'] = entry['error'], None
+                raise error
+            entry['wanted'] = version
+            if not entry['running']:
+                entry['running'] = True
+                self.pool.submit(self.run, entry, compute)
+            if entry['value'] is None and first_wait > 0:
+                self.done.wait_for(lambda: not entry['running'], first_wait)
+                if entry['error'] is not None:
+                    error, entry['error'] = entry['error'], None
+                    raise error
+            return entry['value'], entry['version'] == version
+
+    def busy(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            return entry is not None and entry['running']
+
+    def run(self, entry, compute):
+        while True:
+            with self.lock:
+                version = entry['wanted']
+                self.runs += 1
+            try:
+                value = compute()
+            except Exception as e:
+                with self.lock:
+                    entry['error'] = e
+                    entry['running'] = False
+                    self.done.notify_all()
+                return
+            with self.lock:
+                entry['version'] = version
+                entry['value'] = value
+                entry['error'] = None
+                # The data read was at least as new as version; go again only
+                # if a newer version was asked for in the meantime.
+                if entry['wanted'] == version:
+                    entry['running'] = False
+                    self.done.notify_all()
+                    return
+
+    def close(self):
+        self.pool.shutdown(wait=True)
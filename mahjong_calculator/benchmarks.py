@@ -0,0 +1,323 @@
+# Benchmark suite for the scoring, awards and storage paths.
+#
+#   python -m mahjong_calculator.benchmarks --sizes 1000 100000 1000000 --output bench.json
+#
+# Each size gets a seeded synthetic log (see workload.py) loaded into a fresh
+# temporary database. The results leaderboard is timed separately for a few
+# league sizes (--tile-players), against the old one-markdown-call-per-tile HTML,
+# the payout solver as the player count grows (--payout-players), and date-range
+# leaderboards from the rollups against a scan of game_log (--rollup-sizes), and
+# the scoring simulator in one process and across the pool (--sim-sessions).
+# Results are printed and, with --output, saved as JSON together with the commit
+# and interpreter so runs can be compared.
+import argparse
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+from datetime import date, datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+
+from mahjong_calculator.awards import load_awards
+from mahjong_calculator.database import add_game, create_session, get_games, get_history_page, open_database, remove_last_game
+from mahjong_calculator.leaderboard import leaderboard_html, tile_html
+from mahjong_calculator.ledger import get_balances
+from mahjong_calculator.payouts import EXACT_MAX, settle_up
+from mahjong_calculator.rollups import get_leaderboard
+from mahjong_calculator.schema import GAME_TABLE, PLAYER_TABLE, rollup_seats
+from mahjong_calculator.settlement import DEFAULT_SCORING, FULL_SELF_DRAW, SELF_DRAW, settle
+from mahjong_calculator.simulation import simulate
+from mahjong_calculator.transfer import import_records
+from mahjong_calculator.workload import generate_games, player_names
+
+SINGLE_WRITES = 200
+LEGACY_MAX_HANDS = 100_000
+RENDERS = 200
+ROLLUP_DAYS = 730
+ROLLUP_END = date(2026, 9, 30)
+SIM_HANDS = 40
+
+
+def legacy_calculator(games, multiplier, scoring):
+    # The loop mahjong_calculator() used to run on every rerun.
+    calculator_master = []
+    game_master = games.to_dict(orient='records')
+    for x in range(len(game_master)):
+        winner_x = game_master[x]['Winner']
+        loser1_x = game_master[x]['Loser1']
+        loser2_x = game_master[x]['Loser2']
+        loser3_x = game_master[x]['Loser3']
+        win_type_x = game_master[x]['WinType']
+        points_x = game_master[x]['Points']
+        if win_type_x == SELF_DRAW:
+            calculator_master.append({'Player': winner_x, 'Amount': scoring.iloc[points_x-3]['SelfDraw']*multiplier*3.00})
+            calculator_master.append({'Player': loser1_x, 'Amount': scoring.iloc[points_x-3]['SelfDraw']*multiplier*-1.00})
+            calculator_master.append({'Player': loser2_x, 'Amount': scoring.iloc[points_x-3]['SelfDraw']*multiplier*-1.00})
+            calculator_master.append({'Player': loser3_x, 'Amount': scoring.iloc[points_x-3]['SelfDraw']*multiplier*-1.00})
+        elif win_type_x == FULL_SELF_DRAW:
+            calculator_master.append({'Player': winner_x, 'Amount': scoring.iloc[points_x-3]['SelfDraw']*multiplier*3.00})
+            calculator_master.append({'Player': loser1_x, 'Amount': scoring.iloc[points_x-3]['SelfDraw']*multiplier*-3.00})
+        else:
+            calculator_master.append({'Player': winner_x, 'Amount': scoring.iloc[points_x-3]['OutRight']*multiplier*1.00})
+            calculator_master.append({'Player': loser1_x, 'Amount': scoring.iloc[points_x-3]['OutRight']*multiplier*-1.00})
+    return pd.DataFrame(calculator_master).groupby('Player')['Amount'].sum().round(2).reset_index()
+
+
+def legacy_tile(name, amount):
+    # The markdown body results_tile() used to send for each player.
+    if amount > 0:
+        color = "#10b981"  # Green
+    elif amount == 0:
+        color = "#808080"  #Grey
+    else:
+        color = "#ef4444"  # Red
+    formatted_amount = f"${abs(amount):,.2f}"
+    sign = "+" if amount > 0 else "-" if amount < 0 else ""
+    return f"""
+        <div style="
+            background: linear-gradient(135deg, #f8fafc 0%, #f1f5f9 100%);
+            border-left: 4px solid {color};
+            border-radius: 8px;
+            padding: 20px;
+            margin: 10px 0;
+            box-shadow: 0 2px 4px rgba(0,0,0,0.1);
+            max-width: 180;
+        ">
+            <div style="
+                font-size: 14px;
+                color: #64748b;
+                font-weight: 500;
+                margin-bottom: 8px;
+            ">{name}</div>
+            <div style="
+                font-size: 32px;
+                color: {color};
+                font-weight: 700;
+            ">{sign}{formatted_amount}</div>
+        </div>
+    """
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def per_call(func, calls):
+    start = time.perf_counter()
+    for x in range(calls):
+        func(x)
+    return (time.perf_counter() - start) / calls
+
+
+def run_size(hands, players, multiplier, legacy_max, seed=0):
+    games = generate_games(hands, players=players, seed=seed)
+    records = games.drop(columns='ID').astype(object).where(games.notna(), None).to_dict('records')
+    timings = {}
+    with tempfile.TemporaryDirectory() as directory:
+        db = open_database(os.path.join(directory, 'bench.db'))
+        try:
+            session_id = create_session(db, 'bench')
+            _, timings['insert_bulk_s'] = timed(import_records, db, session_id, records, DEFAULT_SCORING)
+
+            loaded, timings['get_games_s'] = timed(get_games, db, session_id)
+            batch, timings['settle_batch_s'] = timed(settle, loaded, multiplier, DEFAULT_SCORING)
+            if hands <= legacy_max:
+                legacy, timings['settle_loop_s'] = timed(legacy_calculator, loaded, multiplier, DEFAULT_SCORING)
+                timings['settle_match'] = bool(legacy['Player'].tolist() == batch['Player'].tolist()
+                                               and np.allclose(legacy['Amount'], batch['Amount']))
+            _, timings['balances_s'] = timed(get_balances, db, session_id, multiplier)
+            _, timings['awards_s'] = timed(load_awards, db, session_id)
+            _, timings['history_page_s'] = timed(get_history_page, db, session_id, 25)
+
+            sample = records[:SINGLE_WRITES]
+            timings['insert_single_s'] = per_call(
+                lambda x: add_game(db, session_id, *sample[x % len(sample)].values()), SINGLE_WRITES)
+            timings['undo_s'] = per_call(lambda x: remove_last_game(db, session_id), SINGLE_WRITES)
+        finally:
+            db.close()
+    return {'hands': hands, 'players': players, 'timings': timings}
+
+
+def run_leaderboard(players, seed=0):
+    rng = np.random.default_rng(seed)
+    amounts = np.round(rng.normal(0, 50, size=players), 2)
+    balances = [{'Player': name, 'Amount': float(amount)} for name, amount in zip(player_names(players), amounts)]
+    # Each render after a hand: two balances moved by an amount not seen before.
+    moved = []
+    for x in range(RENDERS):
+        after = [dict(y) for y in balances]
+        after[0]['Amount'] = round(after[0]['Amount'] + 0.15 * (x + 1), 2)
+        after[1]['Amount'] = round(after[1]['Amount'] - 0.15 * (x + 1), 2)
+        moved.append(after)
+    previous = {x['Player']: x['Amount'] for x in balances}
+
+    legacy = [legacy_tile(x['Player'], x['Amount']) for x in balances]
+    tile_html.cache_clear()
+    board, cold = timed(leaderboard_html, balances)
+    return {'players': players, 'timings': {
+        'legacy_messages': len(legacy),
+        'legacy_bytes': sum(len(x.encode()) for x in legacy),
+        'legacy_render_s': per_call(lambda x: [legacy_tile(y['Player'], y['Amount']) for y in balances], RENDERS),
+        'messages': 1,
+        'bytes': len(board.encode()),
+        'render_cold_s': cold,
+        'render_same_s': per_call(lambda x: leaderboard_html(balances, previous), RENDERS),
+        'render_two_moved_s': per_call(lambda x: leaderboard_html(moved[x], previous), RENDERS),
+    }}
+
+
+def run_payouts(players, seed=0):
+    # Balances in points, as a session would have them, times the usual multiplier.
+    rng = np.random.default_rng(seed)
+    points = rng.choice(DEFAULT_SCORING['OutRight'].to_numpy(), size=players) * rng.integers(-6, 7, size=players)
+    points[-1] -= points.sum()
+    amounts = {name: int(x) * 0.15 for name, x in zip(player_names(players), points)}
+    owing = sum(1 for x in points if x != 0)
+    transfers, seconds = timed(settle_up, amounts)
+    timings = {'owing': owing, 'transfers': len(transfers), 'settle_s': seconds}
+    if players <= EXACT_MAX:
+        greedy, timings['greedy_s'] = timed(settle_up, amounts, exact_max=0)
+        timings['greedy_transfers'] = len(greedy)
+    return {'players': players, 'timings': timings}
+
+
+def scan_leaderboard(db, start, end):
+    # The same board straight from game_log, for the rollups to be timed against.
+    where = f"g.Played >= '{start.isoformat()}' AND g.Played < '{(end + timedelta(days=1)).isoformat()}'"
+    with db.read() as conn:
+        return pd.read_sql(
+            f'''SELECT p.Name AS Player, SUM(h.Points) AS Points, SUM(h.Hands) AS Hands, SUM(h.Wins) AS Wins
+                FROM ({' UNION ALL '.join(rollup_seats('g', where))}) h JOIN {PLAYER_TABLE} p ON p.ID = h.PlayerID
+                GROUP BY h.PlayerID ORDER BY Points DESC, p.Name''',
+            conn
+        )
+
+
+def run_rollups(hands, players, seed=0):
+    # The hands spread evenly over ROLLUP_DAYS up to ROLLUP_END, then boards for
+    # a week, a month, a quarter and the whole span.
+    games = generate_games(hands, players=players, seed=seed)
+    records = games.drop(columns='ID').astype(object).where(games.notna(), None).to_dict('records')
+    first = datetime.combine(ROLLUP_END - timedelta(days=ROLLUP_DAYS - 1), datetime.min.time())
+    step = ROLLUP_DAYS * 86400 / hands
+    for x, record in enumerate(records):
+        record['Played'] = (first + timedelta(seconds=int(x * step))).strftime('%Y-%m-%d %H:%M:%S')
+    ranges = {'week': ROLLUP_END - timedelta(days=6), 'month': ROLLUP_END.replace(day=1),
+              'quarter': date(ROLLUP_END.year, 7, 1), 'all': first.date()}
+    timings = {}
+    with tempfile.TemporaryDirectory() as directory:
+        db = open_database(os.path.join(directory, 'bench.db'))
+        try:
+            session_id = create_session(db, 'bench')
+            _, timings['insert_bulk_s'] = timed(import_records, db, session_id, records, DEFAULT_SCORING)
+            with db.read() as conn:
+                timings['rollup_rows'] = conn.execute('SELECT COUNT(*) FROM player_rollups').fetchone()[0]
+                timings['game_log_rows'] = conn.execute(f'SELECT COUNT(*) FROM {GAME_TABLE}').fetchone()[0]
+            for name, start in ranges.items():
+                board, timings[f'{name}_rollups_s'] = timed(get_leaderboard, db, start, ROLLUP_END, session_id)
+                scan, timings[f'{name}_scan_s'] = timed(scan_leaderboard, db, start, ROLLUP_END)
+                timings[f'{name}_match'] = bool(board['Player'].tolist() == scan['Player'].tolist()
+                                                and board['Hands'].tolist() == scan['Hands'].tolist()
+                                                and board['Wins'].tolist() == scan['Wins'].tolist())
+        finally:
+            db.close()
+    return {'hands': hands, 'players': players, 'timings': timings}
+
+
+def run_simulation(sessions, seed=0):
+    # Frequencies of a synthetic log; the default table against one paying double on self draws.
+    frequencies = generate_games(10_000, seed=seed).groupby(['WinType', 'Points']).size().rename('Hands').reset_index()
+    double = DEFAULT_SCORING.assign(SelfDraw=DEFAULT_SCORING['SelfDraw'] * 2)
+    profiles = {'default': (DEFAULT_SCORING, 0.15), 'double self draw': (double, 0.15)}
+    workers = os.cpu_count() or 1
+    timings = {'hands': sessions * SIM_HANDS, 'workers': workers}
+    single, timings['one_process_s'] = timed(simulate, frequencies, profiles, SIM_HANDS, sessions, workers=1, seed=seed)
+    if workers > 1:
+        _, timings['pool_s'] = timed(simulate, frequencies, profiles, SIM_HANDS, sessions, workers=workers, seed=seed)
+    timings['default_std'] = float(single['StdDev'][0])
+    timings['double_std'] = float(single['StdDev'][1])
+    return {'sessions': sessions, 'timings': timings}
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except Exception:
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Time settlement, awards, undo and inserts as game_log grows.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1_000, 100_000, 1_000_000])
+    parser.add_argument('--players', type=int, default=8)
+    parser.add_argument('--multiplier', type=float, default=0.15)
+    parser.add_argument('--legacy-max', type=int, default=LEGACY_MAX_HANDS,
+                        help='largest size to also time the original per-hand loop on')
+    parser.add_argument('--tile-players', type=int, nargs='*', default=[8, 30, 100],
+                        help='league sizes to time the results leaderboard at')
+    parser.add_argument('--payout-players', type=int, nargs='*', default=[4, 8, 14, 30, 100, 1_000, 10_000],
+                        help='player counts to time the payout solver at')
+    parser.add_argument('--rollup-sizes', type=int, nargs='*', default=[10_000, 100_000],
+                        help='game_log sizes to time date-range leaderboards at')
+    parser.add_argument('--sim-sessions', type=int, nargs='*', default=[100_000, 1_000_000],
+                        help=f'simulated sessions of {SIM_HANDS} hands to time the scoring simulator at')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    args = parser.parse_args(argv)
+
+    report = {
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': [],
+        'leaderboard': [],
+        'payouts': [],
+        'rollups': [],
+        'simulation': [],
+    }
+    for hands in args.sizes:
+        result = run_size(hands, args.players, args.multiplier, args.legacy_max)
+        report['results'].append(result)
+        print(f'{hands:>10,} hands | ' + ' | '.join(
+            f'{name} {value:.4f}' if isinstance(value, float) else f'{name} {value}'
+            for name, value in result['timings'].items()))
+    for players in args.tile_players:
+        result = run_leaderboard(players)
+        report['leaderboard'].append(result)
+        print(f'{players:>10,} tiles | ' + ' | '.join(
+            f'{name} {value:.6f}' if isinstance(value, float) else f'{name} {value:,}'
+            for name, value in result['timings'].items()))
+    for players in args.payout_players:
+        result = run_payouts(players)
+        report['payouts'].append(result)
+        print(f'{players:>10,} payers | ' + ' | '.join(
+            f'{name} {value:.6f}' if isinstance(value, float) else f'{name} {value:,}'
+            for name, value in result['timings'].items()))
+    for hands in args.rollup_sizes:
+        result = run_rollups(hands, args.players)
+        report['rollups'].append(result)
+        print(f'{hands:>10,} dated | ' + ' | '.join(
+            f'{name} {value:.6f}' if isinstance(value, float) else f'{name} {value}' if isinstance(value, bool) else f'{name} {value:,}'
+            for name, value in result['timings'].items()))
+
+    for sessions in args.sim_sessions:
+        result = run_simulation(sessions)
+        report['simulation'].append(result)
+        print(f'{sessions:>10,} simulated | ' + ' | '.join(
+            f'{name} {value:.4f}' if isinstance(value, float) else f'{name} {value:,}'
+            for name, value in result['timings'].items()))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,196 @@
+# Command line access to a database file, without Streamlit.
+#
+#   python -m mahjong_calculator balances mahjong_app.db --rebuild
+#   python -m mahjong_calculator awards mahjong_app.db --session 1
+#   python -m mahjong_calculator payouts mahjong_app.db --session 1
+#   python -m mahjong_calculator standings mahjong_app.db --from 2026-10-01 --to 2026-10-31
+#   python -m mahjong_calculator simulate mahjong_app.db --sessions 1000000 --hands 40
+#   python -m mahjong_calculator state mahjong_app.db --session 1 --at "2026-10-18 21:00:00"
+#   python -m mahjong_calculator import-time
+import argparse
+import json
+import subprocess
+import sys
+from datetime import date, datetime, timezone
+
+from mahjong_calculator.awards import load_awards
+from mahjong_calculator.database import get_session_ids, open_database
+from mahjong_calculator.events import get_state_at, verify_events
+from mahjong_calculator.ledger import get_balances, rebuild_ledger, verify_ledger
+from mahjong_calculator.payouts import get_payouts
+from mahjong_calculator.rollups import get_standings, verify_rollups
+from mahjong_calculator.simulation import SESSIONS, get_frequencies, get_saved_profiles, simulate
+from mahjong_calculator.stats import verify_stats
+from mahjong_calculator.transfer import export_games, import_games
+
+
+def session_ids(db, args):
+    return [args.session] if args.session is not None else get_session_ids(db)
+
+
+def cmd_balances(db, args):
+    for session_id in session_ids(db, args):
+        if args.rebuild:
+            rebuild_ledger(db, session_id)
+        print(f'Session {session_id}')
+        for row in get_balances(db, session_id, args.multiplier):
+            print(f"  {row['Player']:<12}{row['Amount']:>12,.2f}")
+
+
+def cmd_verify(db, args):
+    drifted = False
+    for session_id in session_ids(db, args):
+        drift = verify_ledger(db, session_id)
+        stale = verify_stats(db, session_id)
+        unreplayed = verify_events(db, session_id)
+        unrolled = verify_rollups(db, session_id)
+        drifted = drifted or len(drift) > 0 or len(stale) > 0 or len(unreplayed) > 0 or len(unrolled) > 0
+        print(f'Session {session_id}: ' + ('ok' if len(drift) == 0 else json.dumps(drift, ensure_ascii=False))
+              + ('' if len(stale) == 0 else f" | stats differ for {', '.join(stale)}")
+              + ('' if len(unreplayed) == 0 else f" | event replay differs for {', '.join(unreplayed)}")
+              + ('' if len(unrolled) == 0 else f" | rollups differ for {', '.join(unrolled)}"))
+    return 1 if drifted else 0
+
+
+def cmd_awards(db, args):
+    for session_id in session_ids(db, args):
+        print(f'Session {session_id}')
+        for award, (value, names) in load_awards(db, session_id).items():
+            print(f"  {award:<20}{'-' if value is None else round(value, 2):>8}  {', '.join(names or [])}")
+
+
+def cmd_payouts(db, args):
+    for session_id in session_ids(db, args):
+        print(f'Session {session_id}')
+        for row in get_payouts(db, session_id, args.multiplier):
+            print(f"  {row['From']:<12} pays {row['To']:<12}{row['Amount']:>12,.2f}")
+
+
+def cmd_standings(db, args):
+    today = datetime.now(timezone.utc).date()
+    start = date.fromisoformat(args.start) if args.start else today.replace(day=1)
+    end = date.fromisoformat(args.end) if args.end else today
+    board, awards = get_standings(db, start, end, args.session)
+    print(f"{start} to {end}, {'every session' if args.session is None else f'session {args.session}'}")
+    for row in board.itertuples():
+        print(f"  {row.Player:<12}{row.Amount:>12,.2f}{row.Hands:>8,} hands{row.Wins:>6,} wins")
+    for award, (value, names) in awards.items():
+        print(f"  {award:<20}{'-' if value is None else round(value, 2):>8}  {', '.join(names or [])}")
+
+
+def cmd_simulate(db, args):
+    frequencies, length = get_frequencies(db, args.session)
+    hands = args.hands or length
+    profiles = get_saved_profiles(db)
+    missing = [x for x in args.profile if x not in profiles]
+    if missing:
+        print(f"No profile named {', '.join(missing)}")
+        return 1
+    if args.profile:
+        profiles = {name: profiles[name] for name in args.profile}
+    result = simulate(frequencies, profiles, hands, args.sessions, args.workers, args.seed)
+    print(f"{args.sessions:,} sessions of {hands} hands, drawn from {frequencies['Hands'].sum():,} recorded hands")
+    print(result.round(2).to_string(index=False))
+
+
+def cmd_state(db, args):
+    for session_id in session_ids(db, args):
+        print(f'Session {session_id}')
+        state = get_state_at(db, session_id, event_id=args.event, recorded=args.at)
+        for row in state.itertuples():
+            print(f"  {row.Player:<12}{row.Amount:>12,.2f}{row.Hands:>8,} hands")
+
+
+def cmd_import(db, args):
+    imported, errors = import_games(db, args.session, args.file)
+    print(f'Imported {imported:,} games, skipped {len(errors):,} rows')
+    for row_number, error in errors[:50]:
+        print(f'  row {row_number}: {error}')
+    return 1 if errors else 0
+
+
+def cmd_export(db, args):
+    written = export_games(db, args.file, session_id=args.session)
+    print(f'Exported {written:,} games')
+
+
+def cmd_import_time(args):
+    # A fresh interpreter, so nothing is already imported.
+    code = ("import sys, time; start = time.perf_counter(); import mahjong_calculator; "
+            "print(f'{time.perf_counter() - start:.3f}'); print('streamlit' in sys.modules)")
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], capture_output=True, text=True, check=True)
+    seconds, streamlit_loaded = result.stdout.split()
+    modules = []
+    for line in result.stderr.splitlines():
+        if line.startswith('import time:') and '|' in line and 'cumulative' not in line:
+            _, cumulative, name = line[len('import time:'):].split('|')
+            modules.append((int(cumulative), name.strip()))
+    print(f'import mahjong_calculator: {float(seconds)*1000:.0f} ms | streamlit imported: {streamlit_loaded}')
+    for cumulative, name in sorted(modules, reverse=True)[:args.top]:
+        print(f'  {cumulative/1000:8.1f} ms  {name}')
+    return 1 if streamlit_loaded == 'True' else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m mahjong_calculator')
+    commands = parser.add_subparsers(dest='command', required=True)
+    database = argparse.ArgumentParser(add_help=False)
+    database.add_argument('database')
+    database.add_argument('--session', type=int, default=None, help='defaults to every session')
+
+    balances = commands.add_parser('balances', parents=[database], help='print (and optionally rebuild) per-player balances')
+    balances.add_argument('--multiplier', type=float, default=None, help="defaults to the session profile's")
+    balances.add_argument('--rebuild', action='store_true', help='replay game_log into the ledger first')
+    balances.set_defaults(func=cmd_balances)
+
+    verify = commands.add_parser('verify', parents=[database], help='replay game_log and the event log and report drift')
+    verify.set_defaults(func=cmd_verify)
+
+    awards = commands.add_parser('awards', parents=[database], help='print the awards')
+    awards.set_defaults(func=cmd_awards)
+
+    payouts = commands.add_parser('payouts', parents=[database], help='print who pays whom to settle up')
+    payouts.add_argument('--multiplier', type=float, default=None, help="defaults to the session profile's")
+    payouts.set_defaults(func=cmd_payouts)
+
+    standings = commands.add_parser('standings', parents=[database], help='print the leaderboard for a date range')
+    standings.add_argument('--from', dest='start', default=None, help='YYYY-MM-DD (UTC); defaults to the 1st of this month')
+    standings.add_argument('--to', dest='end', default=None, help='YYYY-MM-DD (UTC), inclusive; defaults to today')
+    standings.set_defaults(func=cmd_standings)
+
+    simulate_profiles = commands.add_parser('simulate', parents=[database],
+                                            help='simulate sessions under each scoring profile and print the spread of results')
+    simulate_profiles.add_argument('--profile', action='append', default=[], help='profile name, repeatable; defaults to every profile')
+    simulate_profiles.add_argument('--sessions', type=int, default=SESSIONS)
+    simulate_profiles.add_argument('--hands', type=int, default=None, help='hands per session; defaults to the median per night played')
+    simulate_profiles.add_argument('--workers', type=int, default=None, help='processes; defaults to one per CPU')
+    simulate_profiles.add_argument('--seed', type=int, default=0)
+    simulate_profiles.set_defaults(func=cmd_simulate)
+
+    state = commands.add_parser('state', parents=[database], help='print balances as of an event or a time')
+    state.add_argument('--event', type=int, default=None, help='event ID; defaults to the latest')
+    state.add_argument('--at', default=None, help="'YYYY-MM-DD HH:MM:SS' (UTC); overrides --event")
+    state.set_defaults(func=cmd_state)
+
+    import_file = commands.add_parser('import', parents=[database], help='import hands from CSV or Parquet')
+    import_file.add_argument('file')
+    import_file.set_defaults(func=cmd_import)
+
+    export_file = commands.add_parser('export', parents=[database], help='export hands to CSV or Parquet')
+    export_file.add_argument('file')
+    export_file.set_defaults(func=cmd_export)
+
+    import_time = commands.add_parser('import-time', help='measure how long importing the package takes')
+    import_time.add_argument('--top', type=int, default=10)
+    import_time.set_defaults(func=None)
+
+    args = parser.parse_args(argv)
+    if args.command == 'import-time':
+        return cmd_import_time(args)
+    if args.command == 'import' and args.session is None:
+        parser.error('import needs --session')
+    db = open_database(args.database)
+    try:
+        return args.func(db, args) or 0
+    finally:
+        db.close()
@@ -0,0 +1,345 @@
+# Game, session and player access on top of Storage.
+#
+# These functions raise on failure and never touch Streamlit; the app wraps
+# them with its own success/error messages.
+import sqlite3
+
+import pandas as pd
+
+from mahjong_calculator.events import record_clear, record_events, reset_snapshots, session_entries, snapshot_if_due
+from mahjong_calculator.ledger import apply_to_ledger, bump_log_version, rebuild_ledger, reset_ledger
+from mahjong_calculator.players import normalize_name, player_ids, with_ids
+from mahjong_calculator.profiles import (compiled_payoffs, get_session_payoffs, load_scoring, new_revision,
+                                         session_payoffs)
+from mahjong_calculator.rivalry import reset_head_to_head
+from mahjong_calculator.rollups import reset_rollups
+from mahjong_calculator.series import reset_series
+from mahjong_calculator.schema import (BALANCE_TABLE, GAME_TABLE, HAND_VIEW, PAYOFF_TABLE, PLAYER_TABLE, PROFILE_TABLE,
+                                       SERIES_TABLE, SESSION_TABLE, SNAPSHOT_TABLE)
+from mahjong_calculator.settlement import PayoffTable, hand_points, payoff_table
+from mahjong_calculator.storage import Storage
+from mahjong_calculator.transfer import submit_chunk, validate_row
+
+DEFAULT_PLAYERS = ['NEL', 'WAI', 'CAM', 'BOS', 'LIL', 'LIS', 'AMA', 'JEN']
+GAME_ID_COLUMNS = 'ID, WinnerID, Loser1ID, Loser2ID, Loser3ID, WinType, Points'
+
+
+def open_database(path, scoring=None):
+    """Open (and migrate) a database file, building the ledger and event snapshots if they are new."""
+    probe = sqlite3.connect(path)
+    ledger_exists, snapshots_exist = (probe.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+    ).fetchone() for table in (BALANCE_TABLE, SNAPSHOT_TABLE))
+    probe.close()
+    db = Storage(path)
+    if not ledger_exists:
+        for session_id in get_session_ids(db):
+            rebuild_ledger(db, session_id, scoring)
+    if not snapshots_exist:
+        for session_id in get_session_ids(db):
+            db.write(lambda conn: reset_snapshots(conn, session_id, scoring))
+    return db
+
+
+# --- SESSIONS ---
+# Each table/evening is a session. Hands, balances and awards are always read
+# within the active session; archived sessions stay in the database.
+def create_session(db, name, profile_id=1):
+    return db.write(lambda conn: conn.execute(
+        f"INSERT INTO {SESSION_TABLE} (Name, ProfileID) VALUES (?, ?)", (name.strip() or 'Table', profile_id)
+    ).lastrowid)
+
+
+def get_sessions(db):
+    with db.read() as conn:
+        return conn.execute(
+            f"SELECT ID, Name, Created FROM {SESSION_TABLE} WHERE Archived = 0 ORDER BY ID DESC"
+        ).fetchall()
+
+
+def get_session_ids(db):
+    with db.read() as conn:
+        return [x[0] for x in conn.execute(f"SELECT ID FROM {SESSION_TABLE} ORDER BY ID")]
+
+
+def archive_session(db, session_id):
+    db.write(lambda conn: conn.execute(f"UPDATE {SESSION_TABLE} SET Archived = 1 WHERE ID = ?", (session_id,)))
+
+
+def get_active_session(db):
+    open_sessions = get_sessions(db)
+    if len(open_sessions) > 0:
+        return open_sessions[0][0]
+    return create_session(db, 'Default')
+
+
+def rescore_session(conn, session_id, scoring=None):
+    # Everything priced by the profile: the ledger, head-to-head points, the balance series and rollups, all from
+    # one read of the session's hands, then the snapshots from one read of its events.
+    if scoring is None:
+        scoring = session_payoffs(conn, session_id)
+    entries = session_entries(conn, session_id, scoring)
+    reset_ledger(conn, session_id, entries=entries)
+    reset_head_to_head(conn, session_id, entries)
+    reset_series(conn, session_id, entries)
+    reset_rollups(conn, session_id, entries)
+    reset_snapshots(conn, session_id, scoring)
+
+
+def set_session_profile(db, session_id, profile_id):
+    """Settle a session with another profile, recomputing everything priced by it."""
+    def job(conn):
+        conn.execute(f"UPDATE {SESSION_TABLE} SET ProfileID = ? WHERE ID = ?", (profile_id, session_id))
+        rescore_session(conn, session_id)
+        bump_log_version(conn, session_id)
+    db.write(job, touches=[(GAME_TABLE, session_id)])
+
+
+# --- SCORING PROFILES ---
+def save_profile(db, name, scoring, multiplier, profile_id=None):
+    """Create a profile, or update one, and return its ID.
+
+    scoring is a Points/SelfDraw/OutRight frame; it is compiled up front so a
+    bad table raises before anything is written. If an existing profile's
+    payoffs change, every session using it has its balances recomputed in the
+    same transaction.
+    """
+    table = PayoffTable(scoring)
+    name = name.strip()
+    if not name:
+        raise ValueError('Profile name cannot be empty')
+    if not multiplier > 0:
+        raise ValueError('Multiplier must be positive')
+
+    # Sessions whose cached head-to-head points go stale if the payoffs change.
+    with db.read() as conn:
+        using = [x[0] for x in conn.execute(f"SELECT ID FROM {SESSION_TABLE} WHERE ProfileID = ?", (profile_id,))]
+
+    def job(conn):
+        if profile_id is None:
+            revision = new_revision()
+            saved_id = conn.execute(
+                f"INSERT INTO {PROFILE_TABLE} (Name, Multiplier, Revision) VALUES (?, ?, ?)",
+                (name, multiplier, revision)
+            ).lastrowid
+            changed = True
+        else:
+            saved_id = profile_id
+            changed = not load_scoring(conn, profile_id).equals(table.scoring)
+            revision = new_revision()
+            conn.execute(
+                f"UPDATE {PROFILE_TABLE} SET Name = ?, Multiplier = ?, Revision = CASE WHEN ? THEN ? ELSE Revision END WHERE ID = ?",
+                (name, multiplier, changed, revision, profile_id)
+            )
+        if not changed:
+            return saved_id
+        conn.execute(f"DELETE FROM {PAYOFF_TABLE} WHERE ProfileID = ?", (saved_id,))
+        conn.executemany(
+            f"INSERT INTO {PAYOFF_TABLE} (ProfileID, Points, SelfDraw, OutRight) VALUES (?, ?, ?, ?)",
+            [(saved_id, int(row.Points), int(row.SelfDraw), int(row.OutRight)) for row in table.scoring.itertuples()]
+        )
+        compiled_payoffs(conn, saved_id, revision)
+        sessions = [x[0] for x in conn.execute(f"SELECT ID FROM {SESSION_TABLE} WHERE ProfileID = ?", (saved_id,))]
+        for session_id in sessions:
+            rescore_session(conn, session_id, table)
+            bump_log_version(conn, session_id)
+        return saved_id
+    return db.write(job, touches=[(PROFILE_TABLE,)] + [(GAME_TABLE, x) for x in using])
+
+
+# --- GAMES ---
+# Hands are written with player IDs from the registry and read back with
+# names through the game_hands view.
+def add_game(db, session_id, winner, loser1, loser2, loser3, win_type, points, scoring=None):
+    def job(conn):
+        payoffs = session_payoffs(conn, session_id) if scoring is None else scoring
+        hand = with_ids((winner, loser1, loser2, loser3, win_type, points), player_ids(conn, [winner, loser1, loser2, loser3]))
+        entries = hand_points(*hand, payoffs)
+        game_id = conn.execute(
+            f"INSERT INTO {GAME_TABLE} (SessionID, WinnerID, Loser1ID, Loser2ID, Loser3ID, WinType, Points, Played) VALUES (?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)",
+            (session_id, *hand)
+        ).lastrowid
+        apply_to_ledger(conn, session_id, entries)
+        record_events(conn, 'add', 'g.ID = ?', (game_id,))
+        snapshot_if_due(conn, session_id)
+        bump_log_version(conn, session_id)
+    db.write(job, touches=[(GAME_TABLE, session_id), (PLAYER_TABLE,)])
+
+
+def add_games(db, session_id, hands, batch_key, scoring=None):
+    """Add a batch of hands (row dicts) in one transaction. Returns the hands written.
+
+    Every hand is checked before anything is written, and the batch is all or
+    nothing. A batch whose key was already committed writes nothing and returns 0.
+    """
+    if scoring is not None:
+        scoring = payoff_table(scoring)
+    valid_points = set((get_session_payoffs(db, session_id) if scoring is None else scoring).points)
+    rows = []
+    for number, hand in enumerate(hands, start=1):
+        row, error = validate_row(hand, valid_points)
+        if error is not None:
+            raise ValueError(f'Hand {number}: {error}')
+        rows.append(row)
+    if not rows:
+        return 0
+    return submit_chunk(db, session_id, rows, scoring, batch_key).result()
+
+
+def void_hand(conn, session_id, row, scoring=None):
+    # row is (ID, WinnerID, Loser1ID, Loser2ID, Loser3ID, WinType, Points) of one of the session's hands.
+    payoffs = session_payoffs(conn, session_id) if scoring is None else scoring
+    record_events(conn, 'void', 'g.ID = ?', (row[0],))
+    conn.execute(f"DELETE FROM {GAME_TABLE} WHERE ID = ?", (row[0],))
+    apply_to_ledger(conn, session_id, hand_points(*row[1:], payoffs), direction=-1)
+    snapshot_if_due(conn, session_id)
+    bump_log_version(conn, session_id)
+
+
+def remove_last_game(db, session_id, scoring=None):
+    """Undo the session's latest hand. Returns False if there was nothing to undo."""
+    def job(conn):
+        last_row = conn.execute(
+            f"SELECT {GAME_ID_COLUMNS} FROM {GAME_TABLE} WHERE SessionID = ? ORDER BY ID DESC LIMIT 1",
+            (session_id,)
+        ).fetchone()
+        if last_row is None:
+            return False
+        void_hand(conn, session_id, last_row, scoring)
+        return True
+    return db.write(job, touches=[(GAME_TABLE, session_id)])
+
+
+def void_game(db, session_id, game_id, scoring=None):
+    """Void any one of the session's hands. Returns False if it has no hand with that ID."""
+    def job(conn):
+        row = conn.execute(
+            f"SELECT {GAME_ID_COLUMNS} FROM {GAME_TABLE} WHERE SessionID = ? AND ID = ?",
+            (session_id, game_id)
+        ).fetchone()
+        if row is None:
+            return False
+        void_hand(conn, session_id, row, scoring)
+        return True
+    return db.write(job, touches=[(GAME_TABLE, session_id)])
+
+
+def correct_game(db, session_id, game_id, winner, loser1, loser2, loser3, win_type, points, scoring=None):
+    """Replace one of the session's hands, keeping its ID and Played. Returns False if there is no such hand."""
+    if scoring is not None:
+        scoring = payoff_table(scoring)
+    valid_points = set((get_session_payoffs(db, session_id) if scoring is None else scoring).points)
+    hand, error = validate_row(dict(zip(['Winner', 'Loser1', 'Loser2', 'Loser3', 'WinType', 'Points'],
+                                        [winner, loser1, loser2, loser3, win_type, points])), valid_points)
+    if error is not None:
+        raise ValueError(error)
+
+    def job(conn):
+        row = conn.execute(
+            f"SELECT {GAME_ID_COLUMNS}, Played FROM {GAME_TABLE} WHERE SessionID = ? AND ID = ?",
+            (session_id, game_id)
+        ).fetchone()
+        if row is None:
+            return False
+        payoffs = session_payoffs(conn, session_id) if scoring is None else scoring
+        new = with_ids(hand[:6], player_ids(conn, hand[:4]))
+        # Out and back in under the same ID, so the derived tables' triggers see a void and an add.
+        conn.execute(f"DELETE FROM {GAME_TABLE} WHERE ID = ?", (game_id,))
+        conn.execute(
+            f"INSERT INTO {GAME_TABLE} (ID, SessionID, WinnerID, Loser1ID, Loser2ID, Loser3ID, WinType, Points, Played) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (game_id, session_id, *new, row[7])
+        )
+        apply_to_ledger(conn, session_id, hand_points(*row[1:7], payoffs), direction=-1)
+        apply_to_ledger(conn, session_id, hand_points(*new, payoffs))
+        record_events(conn, 'correct', 'g.ID = ?', (game_id,))
+        snapshot_if_due(conn, session_id)
+        bump_log_version(conn, session_id)
+        return True
+    return db.write(job, touches=[(GAME_TABLE, session_id), (PLAYER_TABLE,)])
+
+
+def clear_session(db, session_id):
+    def job(conn):
+        record_clear(conn, session_id)
+        # Dropped first, so the series delete trigger has no later balances to move.
+        conn.execute(f"DELETE FROM {SERIES_TABLE} WHERE SessionID = ?", (session_id,))
+        conn.execute(f"DELETE FROM {GAME_TABLE} WHERE SessionID = ?", (session_id,))
+        conn.execute(f"DELETE FROM {BALANCE_TABLE} WHERE SessionID = ?", (session_id,))
+        bump_log_version(conn, session_id)
+    db.write(job, touches=[(GAME_TABLE, session_id)])
+
+
+def get_games(db, session_id):
+    query = f"SELECT ID, Winner, Loser1, Loser2, Loser3, WinType, Points FROM {HAND_VIEW} WHERE SessionID = ? ORDER BY ID"
+    return db.cached('get_data', (GAME_TABLE, session_id),
+                     lambda conn: pd.read_sql(query, conn, params=(session_id,)))
+
+
+def get_history_page(db, session_id, page_size, before_id=None, after_id=None, player=None, win_type=None):
+    """One page of a session's hands, newest first, and whether more lie beyond it.
+
+    Keyset pagination: before_id/after_id are exclusive ID bounds for the
+    older/newer page, so only page_size + 1 rows are ever read.
+    """
+    conditions = ['SessionID = ?']
+    params = [session_id]
+    if player is not None:
+        conditions.append(f'(SELECT ID FROM {PLAYER_TABLE} WHERE Name = ?) IN (WinnerID, Loser1ID, Loser2ID, Loser3ID)')
+        params.append(player)
+    if win_type is not None:
+        conditions.append('WinType = ?')
+        params.append(win_type)
+    if after_id is not None:
+        conditions.append('ID > ?')
+        params.append(after_id)
+        order = 'ASC'
+    else:
+        if before_id is not None:
+            conditions.append('ID < ?')
+            params.append(before_id)
+        order = 'DESC'
+    query = f'''SELECT ID, Winner, Loser1, Loser2, Loser3, WinType, Points, Played FROM {HAND_VIEW}
+                WHERE {' AND '.join(conditions)} ORDER BY ID {order} LIMIT ?'''
+    params.append(page_size + 1)
+    df = db.cached(('history', page_size, before_id, after_id, player, win_type), (GAME_TABLE, session_id),
+                   lambda conn: pd.read_sql(query, conn, params=params))
+    has_more = len(df) > page_size
+    df = df.head(page_size)
+    if order == 'ASC':
+        df = df.iloc[::-1].reset_index(drop=True)
+    return df, has_more
+
+
+# --- PLAYERS ---
+# Players are never deleted, since hands refer to them; taking one off the
+# roster archives them instead.
+def get_players(db, archived=False):
+    """The roster by name; with archived, every registered player."""
+    query = f"SELECT Name FROM {PLAYER_TABLE} {'' if archived else 'WHERE Archived = 0'} ORDER BY Name"
+    return db.cached(('get_player', archived), (PLAYER_TABLE,), lambda conn: pd.read_sql(query, conn))
+
+
+def add_player(db, name):
+    """Add a player to the roster (or bring an archived one back) and return the cleansed name."""
+    cleansed = normalize_name(name)
+    if not cleansed:
+        raise ValueError('Player name cannot be empty')
+    db.write(lambda conn: conn.execute(
+        f"INSERT INTO {PLAYER_TABLE} (Name) VALUES (?) ON CONFLICT(Name) DO UPDATE SET Archived = 0", (cleansed,)
+    ), touches=[(PLAYER_TABLE,)])
+    return cleansed
+
+
+def archive_player(db, name):
+    """Take a player off the roster. Returns False if no such player is on it."""
+    return db.write(lambda conn: conn.execute(
+        f"UPDATE {PLAYER_TABLE} SET Archived = 1 WHERE Name = ? AND Archived = 0", (normalize_name(name),)
+    ).rowcount > 0, touches=[(PLAYER_TABLE,)])
+
+
+def reset_players(db):
+    def job(conn):
+        conn.execute(f"UPDATE {PLAYER_TABLE} SET Archived = 1")
+        conn.executemany(f"INSERT INTO {PLAYER_TABLE} (Name) VALUES (?) ON CONFLICT(Name) DO UPDATE SET Archived = 0",
+                         [(name,) for name in DEFAULT_PLAYERS])
+    db.write(job, touches=[(PLAYER_TABLE,)])
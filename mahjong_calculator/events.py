@@ -0,0 +1,301 @@
+# Append-only event log of a session's hands, with periodic snapshots.
+#
+# game_log holds the hands as they stand now; game_events records every change
+# that led there: 'add', 'void' (any hand, logged with the values it had),
+# 'correct' (logged with the new values) and 'clear'. Nothing in game_events is
+# ever updated or deleted.
+#
+# Every SNAPSHOT_EVERY events each player's points and stats are copied from the
+# trigger-maintained tables into event_snapshots. The state as of any event is
+# then the nearest snapshot before it plus the events that follow, so a past
+# state costs at most SNAPSHOT_EVERY events to replay, however long the session.
+# Events and snapshots hold player IDs, like game_log.
+import numpy as np
+import pandas as pd
+
+from mahjong_calculator.players import player_names
+from mahjong_calculator.profiles import get_session_profile, session_payoffs
+from mahjong_calculator.schema import (BALANCE_TABLE, EVENT_TABLE, GAME_TABLE, PLAYER_SEATS, SNAPSHOT_TABLE,
+                                       STATS_COLUMNS, STATS_TABLE, seat_column, seat_names)
+from mahjong_calculator.settlement import FULL_SELF_DRAW, SEATS, SELF_DRAW, payoff_table, win_type_codes
+
+SNAPSHOT_EVERY = 500
+STATE_COLUMNS = ['Points'] + STATS_COLUMNS
+HAND_COLUMNS = [seat_column(x) for x in PLAYER_SEATS] + ['WinType', 'Points']
+
+
+def hand_columns(row):
+    # A hand's columns of game_events alias row, with the seats named as in GAME_COLUMNS for hand_totals().
+    return ', '.join([f'{row}.{seat_column(x)} AS {x}' for x in PLAYER_SEATS] + [f'{row}.WinType', f'{row}.Points'])
+
+
+def record_events(conn, kind, where, params=()):
+    """Log a kind event for every game_log row g matching where: after an add or correction, before a void."""
+    conn.execute(
+        f'''INSERT INTO {EVENT_TABLE} (SessionID, Kind, GameID, {', '.join(HAND_COLUMNS)}, Played)
+            SELECT g.SessionID, '{kind}', g.ID, {', '.join(f'g.{x}' for x in HAND_COLUMNS)}, g.Played
+            FROM {GAME_TABLE} g WHERE {where} ORDER BY g.ID''',
+        params
+    )
+
+
+def record_clear(conn, session_id):
+    conn.execute(f"INSERT INTO {EVENT_TABLE} (SessionID, Kind) VALUES (?, 'clear')", (session_id,))
+
+
+def empty_state():
+    return pd.DataFrame(columns=STATE_COLUMNS, dtype=np.int64).rename_axis('PlayerID')
+
+
+def seat_entries(hands, scoring):
+    """One row per filled seat of each hand: the hand's position Row, Seat (0 for the Winner to 3 for Loser3),
+    PlayerID, Seated (whether the seat settles, as in settle_points()) and Points and STATS_COLUMNS."""
+    table = payoff_table(scoring)
+    points = hands['Points'].to_numpy(dtype=np.int64)
+    if len(points):
+        table.check_points(points)
+    win_types = hands['WinType'].to_numpy(dtype=object)
+    codes = win_type_codes(win_types)
+    seated = SEATS[codes]
+    amounts = table.amounts[codes, points]*seated
+    # The same counts as schema.seat_stats(), one column per STATS_COLUMNS entry.
+    self_draw = (win_types == SELF_DRAW).astype(np.int64)
+    full_self_draw = (win_types == FULL_SELF_DRAW).astype(np.int64)
+    # A NULL WinType counts as neither, like WinType IS NOT NULL in the SQL.
+    out_right = (pd.notna(win_types) & (self_draw == 0) & (full_self_draw == 0)).astype(np.int64)
+    one, zero = np.ones(len(hands), dtype=np.int64), np.zeros(len(hands), dtype=np.int64)
+    seats = [
+        ('Winner', [one, one, points, self_draw, full_self_draw, out_right, zero, zero, zero]),
+        ('Loser1', [one, zero, zero, zero, zero, zero, self_draw, full_self_draw, out_right]),
+        ('Loser2', [one, zero, zero, zero, zero, zero, self_draw, zero, zero]),
+        ('Loser3', [one, zero, zero, zero, zero, zero, self_draw, zero, zero]),
+    ]
+    parts = []
+    for i, (seat, values) in enumerate(seats):
+        players = hands[seat].to_numpy(dtype=object)
+        present = pd.notna(players)
+        part = pd.DataFrame(np.column_stack([amounts[:, i]] + values)[present], columns=STATE_COLUMNS)
+        part.insert(0, 'Row', np.flatnonzero(present))
+        part.insert(1, 'Seat', i)
+        part.insert(2, 'PlayerID', players[present].astype(np.int64))
+        part.insert(3, 'Seated', seated[present, i])
+        parts.append(part)
+    return pd.concat(parts, ignore_index=True)
+
+
+def hand_totals(hands, scoring):
+    """Per-player ID Points and STATS_COLUMNS over hands, each counted Sign times (+1 or -1)."""
+    if len(hands) == 0:
+        return empty_state()
+    entries = seat_entries(hands, scoring)
+    sign = hands['Sign'].to_numpy(dtype=np.int64)[entries['Row'].to_numpy()]
+    return entries[STATE_COLUMNS].mul(sign, axis=0).groupby(entries['PlayerID']).sum()
+
+
+def game_entries(hands, scoring):
+    """seat_entries() of game_log hands in ID order (GameID, the seats' player IDs named as in GAME_COLUMNS,
+    WinType, Points and Day, the UTC date played or None), with each hand's GameID, WinnerID, WinType and Day."""
+    entries = seat_entries(hands, scoring)
+    rows = entries['Row'].to_numpy()
+    entries['GameID'] = hands['GameID'].to_numpy(dtype=np.int64)[rows]
+    entries['WinnerID'] = hands['Winner'].to_numpy(dtype=object)[rows]
+    entries['WinType'] = hands['WinType'].to_numpy(dtype=object)[rows]
+    entries['Day'] = hands['Day'].to_numpy(dtype=object)[rows]
+    return entries
+
+
+def session_entries(conn, session_id, scoring=None):
+    """game_entries() of the whole session, from one read of its game_log."""
+    if scoring is None:
+        scoring = session_payoffs(conn, session_id)
+    hands = pd.read_sql(
+        f'''SELECT ID AS GameID, {', '.join(f'{seat_column(x)} AS {x}' for x in PLAYER_SEATS)}, WinType, Points,
+                  date(Played) AS Day
+            FROM {GAME_TABLE} WHERE SessionID = ? ORDER BY ID''',
+        conn, params=(session_id,)
+    )
+    return game_entries(hands, scoring)
+
+
+def combine(state, totals):
+    state = state.add(totals, fill_value=0).astype(np.int64)
+    return state[state['Hands'] > 0]
+
+
+def signed_hands(conn, session_id, after, upto):
+    """The hands of events in (after, upto] with a Sign: adds and corrections count once, voids and the values a
+    correction replaced count minus once."""
+    window = 'e.SessionID = ? AND e.EventID > ? AND e.EventID <= ?'
+    return pd.read_sql(
+        f'''SELECT 1 AS Sign, {hand_columns('e')} FROM {EVENT_TABLE} e WHERE {window} AND e.Kind IN ('add', 'correct')
+            UNION ALL
+            SELECT -1, {hand_columns('e')} FROM {EVENT_TABLE} e WHERE {window} AND e.Kind = 'void'
+            UNION ALL
+            SELECT -1, {hand_columns('p')} FROM {EVENT_TABLE} e JOIN {EVENT_TABLE} p ON p.EventID = (
+                SELECT MAX(x.EventID) FROM {EVENT_TABLE} x WHERE x.SessionID = e.SessionID AND x.GameID = e.GameID
+                AND x.EventID < e.EventID AND x.Kind IN ('add', 'correct'))
+            WHERE {window} AND e.Kind = 'correct' ''',
+        conn, params=(session_id, after, upto)*3
+    )
+
+
+def load_snapshot(conn, session_id, event_id):
+    return pd.read_sql(
+        f"SELECT PlayerID, {', '.join(STATE_COLUMNS)} FROM {SNAPSHOT_TABLE} WHERE SessionID = ? AND EventID = ?",
+        conn, params=(session_id, event_id), index_col='PlayerID'
+    ).astype(np.int64)
+
+
+def state_at(conn, session_id, event_id=None, scoring=None):
+    """Each player ID's Points and stats as of event_id (default: the latest), from the nearest snapshot."""
+    if event_id is None:
+        event_id = conn.execute(f"SELECT MAX(EventID) FROM {EVENT_TABLE} WHERE SessionID = ?",
+                                (session_id,)).fetchone()[0] or 0
+    if scoring is None:
+        scoring = session_payoffs(conn, session_id)
+    start = conn.execute(
+        f"SELECT MAX(EventID) FROM {SNAPSHOT_TABLE} WHERE SessionID = ? AND EventID <= ?", (session_id, event_id)
+    ).fetchone()[0]
+    # A clear after the snapshot wipes everything before it.
+    cleared = conn.execute(
+        f"SELECT MAX(EventID) FROM {EVENT_TABLE} WHERE SessionID = ? AND Kind = 'clear' AND EventID > ? AND EventID <= ?",
+        (session_id, start or 0, event_id)
+    ).fetchone()[0]
+    if cleared is not None:
+        state, start = empty_state(), cleared
+    elif start is not None:
+        state = load_snapshot(conn, session_id, start)
+    else:
+        state, start = empty_state(), 0
+    return combine(state, hand_totals(signed_hands(conn, session_id, start, event_id), scoring))
+
+
+def stored_state(conn, session_id):
+    # The current state as kept by the ledger and the player_stats triggers.
+    return pd.read_sql(
+        f'''SELECT s.PlayerID, COALESCE(b.Points, 0) AS Points, {', '.join(f's.{x}' for x in STATS_COLUMNS)}
+            FROM {STATS_TABLE} s LEFT JOIN {BALANCE_TABLE} b ON b.SessionID = s.SessionID AND b.PlayerID = s.PlayerID
+            WHERE s.SessionID = ?''',
+        conn, params=(session_id,), index_col='PlayerID'
+    )
+
+
+def write_snapshot(conn, session_id, event_id, state):
+    conn.executemany(
+        f'''INSERT OR REPLACE INTO {SNAPSHOT_TABLE} (SessionID, EventID, PlayerID, {', '.join(STATE_COLUMNS)})
+            VALUES (?, ?, ?, {', '.join('?' for _ in STATE_COLUMNS)})''',
+        [(session_id, event_id, int(player), *map(int, values)) for player, values in zip(state.index, state.to_numpy())]
+    )
+
+
+def snapshot_if_due(conn, session_id, every=SNAPSHOT_EVERY):
+    """Snapshot the session's current points and stats once every events have passed since the last one.
+
+    Call at the end of a write, when player_balance and player_stats are up to date.
+    """
+    last = conn.execute(f"SELECT MAX(EventID) FROM {SNAPSHOT_TABLE} WHERE SessionID = ?",
+                        (session_id,)).fetchone()[0] or 0
+    pending = conn.execute(
+        f"SELECT COUNT(*) FROM (SELECT 1 FROM {EVENT_TABLE} WHERE SessionID = ? AND EventID > ? LIMIT ?)",
+        (session_id, last, every)
+    ).fetchone()[0]
+    if pending < every:
+        return False
+    state = stored_state(conn, session_id)
+    event_id = conn.execute(f"SELECT MAX(EventID) FROM {EVENT_TABLE} WHERE SessionID = ?", (session_id,)).fetchone()[0]
+    write_snapshot(conn, session_id, event_id, state)
+    return True
+
+
+def reset_snapshots(conn, session_id, scoring=None, every=SNAPSHOT_EVERY):
+    """Rebuild a session's snapshots from its events, e.g. after its payoffs change.
+
+    The events are read once and signed as in signed_hands(); each window's hands are summed in one pass and
+    carried forward from the window before, unless a clear in the window starts it afresh.
+    """
+    if scoring is None:
+        scoring = session_payoffs(conn, session_id)
+    conn.execute(f"DELETE FROM {SNAPSHOT_TABLE} WHERE SessionID = ?", (session_id,))
+    events = pd.read_sql(
+        f"SELECT e.EventID, e.Kind, e.GameID, {hand_columns('e')} FROM {EVENT_TABLE} e WHERE e.SessionID = ? ORDER BY e.EventID",
+        conn, params=(session_id,)
+    )
+    marks = events['EventID'].to_numpy(dtype=np.int64)[every - 1::every]
+    if len(marks) == 0:
+        return 0
+    live = events[events['Kind'].isin(['add', 'correct'])]
+    # What a correction replaced is the game's add or correction before it.
+    replaced = live.groupby('GameID')[PLAYER_SEATS + ['WinType', 'Points']].shift()
+    replaced = replaced[(live['Kind'] == 'correct') & replaced['Points'].notna()]
+    hands = pd.concat([live.assign(Sign=1), events[events['Kind'] == 'void'].assign(Sign=-1),
+                       replaced.assign(EventID=live.loc[replaced.index, 'EventID'], Sign=-1)], ignore_index=True)
+    entries = seat_entries(hands, scoring)
+    rows = entries['Row'].to_numpy()
+    event_ids = hands['EventID'].to_numpy(dtype=np.int64)[rows]
+    values = entries[STATE_COLUMNS].to_numpy(dtype=np.int64)*hands['Sign'].to_numpy(dtype=np.int64)[rows, None]
+    # The snapshot each hand is first part of, and the last clear (or 0) in each snapshot's window.
+    window = np.searchsorted(marks, event_ids)
+    clears = events.loc[events['Kind'] == 'clear', 'EventID'].to_numpy(dtype=np.int64)
+    cleared = np.zeros(len(marks) + 1, dtype=np.int64)
+    np.maximum.at(cleared, np.searchsorted(marks, clears), clears)
+    kept = event_ids > cleared[window]
+    codes, players = pd.factorize(entries['PlayerID'].to_numpy()[kept])
+    sums = np.zeros((len(marks) + 1, len(players), len(STATE_COLUMNS)), dtype=np.int64)
+    np.add.at(sums, (window[kept], codes), values[kept])
+    hands_column = STATE_COLUMNS.index('Hands')
+    state = np.zeros((len(players), len(STATE_COLUMNS)), dtype=np.int64)
+    for x, upto in enumerate(marks):
+        state = sums[x] + (0 if cleared[x] else state)
+        present = state[:, hands_column] > 0
+        write_snapshot(conn, session_id, int(upto), pd.DataFrame(state[present], index=players[present], columns=STATE_COLUMNS))
+    return len(marks)
+
+
+def rebuild_snapshots(db, session_id):
+    return db.write(lambda conn: reset_snapshots(conn, session_id))
+
+
+def event_at(conn, session_id, recorded):
+    """The last event recorded at or before recorded ('YYYY-MM-DD HH:MM:SS', UTC), or 0 if none was."""
+    row = conn.execute(
+        f"SELECT MAX(EventID) FROM {EVENT_TABLE} WHERE SessionID = ? AND Recorded <= ?", (session_id, recorded)
+    ).fetchone()
+    return row[0] or 0
+
+
+def get_state_at(db, session_id, event_id=None, recorded=None, multiplier=None):
+    """Money balance and stats per player as of an event, or as recorded at a time; the latest by default."""
+    if multiplier is None:
+        multiplier = get_session_profile(db, session_id)[2]
+    with db.read() as conn:
+        if recorded is not None:
+            event_id = event_at(conn, session_id, recorded)
+        state = state_at(conn, session_id, event_id)
+        names = player_names(conn, state.index)
+    state = state.reset_index()
+    state['Player'] = state['PlayerID'].map(names)
+    return state.assign(Amount=(state['Points']*multiplier).round(2)).sort_values('Player', ignore_index=True)[
+        ['Player', 'Amount'] + STATS_COLUMNS]
+
+
+def get_events(db, session_id, limit=50):
+    """The session's latest events, newest first."""
+    columns, joins = seat_names('e')
+    with db.read() as conn:
+        return pd.read_sql(
+            f'''SELECT e.EventID, e.Kind, e.GameID, {columns}, e.WinType, e.Points, e.Recorded
+                FROM {EVENT_TABLE} e {joins} WHERE e.SessionID = ? ORDER BY e.EventID DESC LIMIT ?''',
+            conn, params=(session_id, limit)
+        )
+
+
+def verify_events(db, session_id):
+    """Replay the latest snapshot and the events after it; list every player whose stored points or stats differ."""
+    with db.read() as conn:
+        replayed = state_at(conn, session_id)
+        stored = stored_state(conn, session_id)
+        names = player_names(conn, set(replayed.index) | set(stored.index))
+    players = set(replayed.index) | set(stored.index)
+    return sorted(names.get(player, str(player)) for player in players
+                  if player not in replayed.index or player not in stored.index
+                  or list(replayed.loc[player, STATE_COLUMNS]) != list(stored.loc[player, STATE_COLUMNS]))
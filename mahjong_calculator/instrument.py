@@ -0,0 +1,175 @@
+# Opt-in timing of page functions and SQL statements.
+#
+# Set MAHJONG_PROFILE=1 to turn it on. When it is off (the default) nothing is
+# wrapped: profiled() hands back the original function and Storage opens plain
+# sqlite3 connections, so there is no per-call cost at all.
+#
+# When it is on, each Streamlit rerun gets a Recorder. Decorated functions and
+# every statement run through an instrumented connection (including writes
+# performed on the writer thread for that rerun) add an event to it: the time
+# spent and, for SQL, the rows fetched or changed. Finished reruns are appended
+# to a JSON-lines log (MAHJONG_PROFILE_LOG, default mahjong_profile.jsonl).
+# A fragment rerun runs only the fragment's function, outside any Recorder,
+# so the outermost profiled call then records and logs a rerun of its own.
+import functools
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+ENABLED = os.environ.get('MAHJONG_PROFILE', '') not in ('', '0')
+LOG_PATH = os.environ.get('MAHJONG_PROFILE_LOG', 'mahjong_profile.jsonl')
+
+_local = threading.local()
+_log_lock = threading.Lock()
+
+
+class Recorder:
+    def __init__(self, name):
+        self.name = name
+        self.created = datetime.now(timezone.utc).isoformat(timespec='milliseconds')
+        self.started = time.perf_counter()
+        self.total = None
+        self.events = []
+
+    def add(self, kind, name, seconds, rows=None):
+        event = {'kind': kind, 'name': name, 'seconds': seconds, 'rows': rows}
+        self.events.append(event)
+        return event
+
+    def finish(self):
+        self.total = time.perf_counter() - self.started
+
+    def summary(self):
+        """Events grouped by (kind, name): calls, total seconds and rows, slowest first."""
+        groups = {}
+        for event in self.events:
+            group = groups.setdefault((event['kind'], event['name']),
+                                      {'kind': event['kind'], 'name': event['name'], 'calls': 0, 'seconds': 0.0, 'rows': None})
+            group['calls'] += 1
+            group['seconds'] += event['seconds']
+            if event['rows'] is not None:
+                group['rows'] = (group['rows'] or 0) + event['rows']
+        return sorted(groups.values(), key=lambda group: group['seconds'], reverse=True)
+
+    def to_json(self):
+        return json.dumps({'created': self.created, 'name': self.name, 'total_s': self.total,
+                           'events': self.events}, ensure_ascii=False)
+
+
+def current():
+    return getattr(_local, 'recorder', None)
+
+
+@contextmanager
+def recording(recorder):
+    previous = current()
+    _local.recorder = recorder
+    try:
+        yield recorder
+    finally:
+        _local.recorder = previous
+
+
+def profiled(func):
+    """Record each call of func in the current rerun; a no-op unless profiling is enabled."""
+    if not ENABLED:
+        return func
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        recorder = current()
+        if recorder is None:
+            recorder = Recorder(func.__qualname__)
+            try:
+                with recording(recorder):
+                    return wrapper(*args, **kwargs)
+            finally:
+                recorder.finish()
+                write_log(recorder)
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            recorder.add('function', func.__qualname__, time.perf_counter() - start)
+    return wrapper
+
+
+def write_log(recorder, path=None):
+    with _log_lock, open(path or LOG_PATH, 'a', encoding='utf-8') as f:
+        f.write(recorder.to_json() + '\n')
+
+
+def statement_name(sql):
+    return ' '.join(sql.split())[:200]
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    event = None
+
+    def execute(self, sql, parameters=()):
+        recorder = current()
+        if recorder is None:
+            self.event = None
+            return super().execute(sql, parameters)
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self.event = recorder.add('sql', statement_name(sql), time.perf_counter() - start,
+                                      rows=max(self.rowcount, 0))
+
+    def executemany(self, sql, seq_of_parameters):
+        recorder = current()
+        if recorder is None:
+            self.event = None
+            return super().executemany(sql, seq_of_parameters)
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self.event = recorder.add('sql', statement_name(sql), time.perf_counter() - start,
+                                      rows=max(self.rowcount, 0))
+
+    def fetched(self, start, rows):
+        if self.event is not None:
+            self.event['seconds'] += time.perf_counter() - start
+            self.event['rows'] += rows
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self.fetched(start, 0 if row is None else 1)
+        return row
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self.fetched(start, len(rows))
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self.fetched(start, len(rows))
+        return rows
+
+    def __next__(self):
+        start = time.perf_counter()
+        row = super().__next__()
+        self.fetched(start, 1)
+        return row
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
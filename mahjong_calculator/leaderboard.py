@@ -0,0 +1,47 @@
+# Results leaderboard for the Calc page.
+#
+# All tiles go out as one HTML block with one shared stylesheet, sorted by
+# balance, instead of one st.markdown call with inline styles per player. Tile
+# markup is memoized on (name, amount, changed), so a rerun only builds the
+# tiles whose balance moved; those are flagged and briefly highlighted. When
+# nothing changed the block is byte-for-byte what the browser already shows.
+import functools
+import html
+
+LEADERBOARD_CSS = '''<style>
+.mj-board{display:grid;grid-template-columns:repeat(auto-fill,minmax(180px,1fr));gap:10px;margin:10px 0}
+.mj-tile{background:linear-gradient(135deg,#f8fafc 0%,#f1f5f9 100%);border-left:4px solid #808080;border-radius:8px;padding:20px;box-shadow:0 2px 4px rgba(0,0,0,0.1)}
+.mj-tile .mj-name{font-size:14px;color:#64748b;font-weight:500;margin-bottom:8px}
+.mj-tile .mj-amount{font-size:32px;color:#808080;font-weight:700}
+.mj-up{border-left-color:#10b981}.mj-up .mj-amount{color:#10b981}
+.mj-down{border-left-color:#ef4444}.mj-down .mj-amount{color:#ef4444}
+.mj-changed{animation:mj-flash 1.5s ease-out}
+@keyframes mj-flash{from{box-shadow:0 0 0 3px #facc15}to{box-shadow:0 2px 4px rgba(0,0,0,0.1)}}
+</style>'''
+
+
+def format_amount(amount):
+    sign = "+" if amount > 0 else "-" if amount < 0 else ""
+    # $ as an entity, or Streamlit's markdown could read two of them as LaTeX.
+    return f"{sign}&#36;{abs(amount):,.2f}"
+
+
+@functools.lru_cache(maxsize=1024)
+def tile_html(name, amount, changed=False):
+    kind = 'mj-up' if amount > 0 else 'mj-down' if amount < 0 else 'mj-even'
+    classes = f"mj-tile {kind}{' mj-changed' if changed else ''}"
+    return (f'<div class="{classes}"><div class="mj-name">{html.escape(str(name))}</div>'
+            f'<div class="mj-amount">{format_amount(amount)}</div></div>')
+
+
+def ranked(balances):
+    """[(name, amount)] from get_balances rows, highest balance first (ties by name)."""
+    return sorted(((x['Player'], x['Amount']) for x in balances), key=lambda x: (-x[1], x[0]))
+
+
+def leaderboard_html(balances, previous=None):
+    """One HTML block for every tile; with previous ({name: amount}), tiles that moved are flagged."""
+    tiles = ''.join(tile_html(name, amount, previous is not None and previous.get(name) != amount)
+                    for name, amount in ranked(balances))
+    # No blank lines: the whole block must stay a single raw HTML block to markdown.
+    return f'{LEADERBOARD_CSS}<div class="mj-board">{tiles}</div>'
@@ -0,0 +1,122 @@
+# Per-session balance ledger and log version.
+#
+# player_balance holds each player's running balance in scoring points (before
+# the multiplier), kept in step with game_log inside the same transaction so
+# the results never need to replay every hand. log_version counts writes per
+# session; with MAX(ID) it keys cached statistics. Unless a scoring table is
+# passed in, a session settles with its own scoring profile. Balances are kept
+# per player ID; names are joined in when they are read.
+import pandas as pd
+
+from mahjong_calculator.events import session_entries
+from mahjong_calculator.players import player_names
+from mahjong_calculator.profiles import session_payoffs
+from mahjong_calculator.schema import (BALANCE_TABLE, GAME_TABLE, PLAYER_SEATS, PLAYER_TABLE, PROFILE_TABLE, SESSION_TABLE,
+                                       VERSION_TABLE)
+from mahjong_calculator.settlement import settle_points
+
+
+def apply_to_ledger(conn, session_id, entries, direction=1):
+    # entries are hand_points() of a hand's player IDs.
+    for player, player_points in entries:
+        conn.execute(
+            f'''INSERT INTO {BALANCE_TABLE} (SessionID, PlayerID, Points, Hands) VALUES (?, ?, ?, ?)
+                ON CONFLICT(SessionID, PlayerID) DO UPDATE SET Points = Points + excluded.Points, Hands = Hands + excluded.Hands''',
+            (session_id, player, player_points*direction, direction)
+        )
+    conn.execute(f"DELETE FROM {BALANCE_TABLE} WHERE SessionID = ? AND Hands <= 0", (session_id,))
+
+
+def add_totals(conn, session_id, totals):
+    # totals is a settle_points() or seat_totals() frame for a batch of new hands, by player ID.
+    conn.executemany(
+        f'''INSERT INTO {BALANCE_TABLE} (SessionID, PlayerID, Points, Hands) VALUES (?, ?, ?, ?)
+            ON CONFLICT(SessionID, PlayerID) DO UPDATE SET Points = Points + excluded.Points, Hands = Hands + excluded.Hands''',
+        [(session_id, int(row.Player), int(row.Points), int(row.Hands)) for row in totals.itertuples()]
+    )
+
+
+def replay_ledger(conn, session_id, scoring=None):
+    if scoring is None:
+        scoring = session_payoffs(conn, session_id)
+    games = pd.read_sql(
+        f'''SELECT {', '.join(f'{seat}ID AS {seat}' for seat in PLAYER_SEATS)}, WinType, Points
+            FROM {GAME_TABLE} WHERE SessionID = ?''',
+        conn, params=(session_id,)
+    )
+    totals = settle_points(games, scoring)
+    return {int(row.Player): (int(row.Points), int(row.Hands)) for row in totals.itertuples()}
+
+
+def seat_totals(entries):
+    # settle_points() by player ID, from seat entries: the seats that settle in each hand.
+    totals = entries[entries['Seated']].groupby('PlayerID')['Points'].agg(['sum', 'count'])
+    return pd.DataFrame({'Player': totals.index, 'Points': totals['sum'].to_numpy(), 'Hands': totals['count'].to_numpy()})
+
+
+def reset_ledger(conn, session_id, scoring=None, entries=None):
+    # One scan of the session's hands replaces its balances; entries are its session_entries(), if already read.
+    if entries is None:
+        entries = session_entries(conn, session_id, scoring)
+    conn.execute(f"DELETE FROM {BALANCE_TABLE} WHERE SessionID = ?", (session_id,))
+    add_totals(conn, session_id, seat_totals(entries))
+
+
+def rebuild_ledger(db, session_id, scoring=None):
+    db.write(lambda conn: reset_ledger(conn, session_id, scoring))
+
+
+def verify_ledger(db, session_id, scoring=None):
+    """Replay the session's hands and list every player whose stored balance differs."""
+    with db.read() as conn:
+        replayed = replay_ledger(conn, session_id, scoring)
+        stored = {row[0]: (row[1], row[2]) for row in conn.execute(
+            f"SELECT PlayerID, Points, Hands FROM {BALANCE_TABLE} WHERE SessionID = ?", (session_id,)
+        )}
+        names = player_names(conn, set(replayed) | set(stored))
+    drift = []
+    for player in sorted(set(replayed) | set(stored), key=lambda x: names.get(x, '')):
+        if replayed.get(player) != stored.get(player):
+            drift.append({'Player': names.get(player, player),
+                          'Ledger': stored.get(player, (0, 0))[0],
+                          'Replay': replayed.get(player, (0, 0))[0]})
+    return drift
+
+
+def session_multiplier(conn, session_id):
+    row = conn.execute(
+        f'''SELECT p.Multiplier FROM {SESSION_TABLE} s JOIN {PROFILE_TABLE} p ON p.ID = s.ProfileID
+            WHERE s.ID = ?''',
+        (session_id,)
+    ).fetchone()
+    return row[0] if row is not None else 0.15
+
+
+def get_balances(db, session_id, multiplier=None):
+    """Money balances for a session; the multiplier defaults to the session profile's."""
+    with db.read() as conn:
+        if multiplier is None:
+            multiplier = session_multiplier(conn, session_id)
+        rows = conn.execute(
+            f'''SELECT p.Name, b.Points FROM {BALANCE_TABLE} b JOIN {PLAYER_TABLE} p ON p.ID = b.PlayerID
+                WHERE b.SessionID = ? ORDER BY p.Name''',
+            (session_id,)
+        ).fetchall()
+    return [{'Player': player, 'Amount': round(player_points*multiplier, 2)} for player, player_points in rows]
+
+
+def bump_log_version(conn, session_id):
+    conn.execute(
+        f'''INSERT INTO {VERSION_TABLE} (SessionID, Writes) VALUES (?, 1)
+            ON CONFLICT(SessionID) DO UPDATE SET Writes = Writes + 1''',
+        (session_id,)
+    )
+
+
+def get_log_version(db, session_id):
+    with db.read() as conn:
+        return conn.execute(
+            f'''SELECT (SELECT MAX(ID) FROM {GAME_TABLE} WHERE SessionID = ?),
+                       (SELECT Writes FROM {VERSION_TABLE} WHERE SessionID = ?)''',
+            (session_id, session_id)
+        ).fetchone()
@@ -0,0 +1,122 @@
+# End-of-night payouts: who pays whom.
+#
+# Balances are worked in whole cents. The exact amounts (points times the
+# multiplier) are rounded by largest remainder so they still sum to zero:
+# nobody ends up more than a cent off their balance and the transfers always
+# close out, which rounding each player on their own does not guarantee.
+#
+# The fewest transfers is the number of players owed or owing minus the most
+# groups they split into that each sum to zero, since a group of k settles in
+# k - 1 transfers. That split is found exactly by a DP over subsets while at
+# most EXACT_MAX players are left once exact opposite pairs are taken out. Past
+# that the largest debtor pays the largest creditor until everyone is square:
+# O(n log n) and at most n - 1 transfers.
+import heapq
+
+from mahjong_calculator.ledger import session_multiplier
+from mahjong_calculator.schema import BALANCE_TABLE, PLAYER_TABLE
+
+EXACT_MAX = 14
+
+
+def to_cents(amounts):
+    """{name: amount} in whole cents that sum to zero, each within a cent of the amount."""
+    exact = {name: amount * 100 for name, amount in amounts.items()}
+    cents = {name: round(x) for name, x in exact.items()}
+    residual = sum(cents.values())
+    if abs(residual) > len(cents) / 2:
+        raise ValueError(f'Balances do not sum to zero (off by {residual / 100:,.2f})')
+    # Undo the roundings that went furthest in the direction of the residual.
+    error = {name: round(exact[name] - cents[name], 9) for name in cents}
+    step = -1 if residual > 0 else 1
+    order = sorted(cents, key=lambda name: (-error[name] * step, -abs(exact[name]), name))
+    for name in order[:abs(residual)]:
+        cents[name] += step
+    return cents
+
+
+def opposite_pairs(cents):
+    # A player owing exactly what another is owed settles with them in one
+    # transfer; some fewest-transfer answer always does this.
+    transfers = []
+    rest = dict(cents)
+    owing = {}
+    for name in sorted(cents):
+        if cents[name] < 0:
+            owing.setdefault(cents[name], []).append(name)
+    for name in sorted(cents):
+        if cents[name] > 0 and owing.get(-cents[name]):
+            payer = owing[-cents[name]].pop(0)
+            transfers.append((payer, name, cents[name]))
+            del rest[payer], rest[name]
+    return transfers, rest
+
+
+def zero_sum_groups(cents):
+    """The players split into the most groups that each sum to zero (2**n states)."""
+    names = sorted(cents)
+    n = len(names)
+    total = [0] * (1 << n)
+    best = [0] * (1 << n)
+    for mask in range(1, 1 << n):
+        low = mask & -mask
+        total[mask] = total[mask ^ low] + cents[names[low.bit_length() - 1]]
+        best[mask] = max(best[mask ^ (1 << i)] for i in range(n) if mask >> i & 1) + (total[mask] == 0)
+    # Walk back down from everyone; each zero-sum subset passed starts a group.
+    groups = []
+    mask = (1 << n) - 1
+    while mask:
+        closed = total[mask] == 0
+        if closed:
+            groups.append([])
+        i = next(i for i in range(n) if mask >> i & 1 and best[mask ^ (1 << i)] + closed == best[mask])
+        groups[-1].append(names[i])
+        mask ^= 1 << i
+    return groups
+
+
+def match(cents):
+    """Largest debtor pays largest creditor until everyone is square; at most n - 1 transfers."""
+    debtors = [(x, name) for name, x in cents.items() if x < 0]
+    creditors = [(-x, name) for name, x in cents.items() if x > 0]
+    heapq.heapify(debtors)
+    heapq.heapify(creditors)
+    transfers = []
+    while debtors and creditors:
+        owes, payer = heapq.heappop(debtors)
+        owed, payee = heapq.heappop(creditors)
+        amount = min(-owes, -owed)
+        transfers.append((payer, payee, amount))
+        if -owes > amount:
+            heapq.heappush(debtors, (owes + amount, payer))
+        if -owed > amount:
+            heapq.heappush(creditors, (owed + amount, payee))
+    return transfers
+
+
+def settle_up(amounts, exact_max=EXACT_MAX):
+    """Transfers [{'From', 'To', 'Amount'}] that square up {name: amount} balances.
+
+    Fewest transfers possible while at most exact_max players are left after
+    exact opposite pairs; otherwise the greedy match.
+    """
+    cents = {name: x for name, x in to_cents(amounts).items() if x != 0}
+    transfers, rest = opposite_pairs(cents)
+    groups = zero_sum_groups(rest) if len(rest) <= exact_max else [list(rest)]
+    for group in groups:
+        transfers += match({name: rest[name] for name in group})
+    return [{'From': payer, 'To': payee, 'Amount': amount / 100}
+            for payer, payee, amount in sorted(transfers, key=lambda x: (x[0], -x[2], x[1]))]
+
+
+def get_payouts(db, session_id, multiplier=None, exact_max=EXACT_MAX):
+    """settle_up() for a session's balances; the multiplier defaults to the session profile's."""
+    with db.read() as conn:
+        if multiplier is None:
+            multiplier = session_multiplier(conn, session_id)
+        rows = conn.execute(
+            f'''SELECT p.Name, b.Points FROM {BALANCE_TABLE} b JOIN {PLAYER_TABLE} p ON p.ID = b.PlayerID
+                WHERE b.SessionID = ?''',
+            (session_id,)
+        ).fetchall()
+    return settle_up({player: player_points * multiplier for player, player_points in rows}, exact_max)
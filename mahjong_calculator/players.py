@@ -0,0 +1,39 @@
+# Player registry.
+#
+# Every player is one row of players: an integer ID, which is what game_log,
+# game_events and the derived tables store, and a name kept trimmed and
+# upper-cased, unique in that form. Archived players are off the roster but
+# keep their ID, so their hands still read back with their name. Names first
+# seen in a hand (an import, say) are registered as archived.
+import json
+
+from mahjong_calculator.schema import PLAYER_TABLE
+
+
+def normalize_name(name):
+    return str(name).strip().upper()
+
+
+def player_ids(conn, names):
+    """{name: ID} for the names given (None skipped), registering any not seen before."""
+    normalized = {name: normalize_name(name) for name in set(names) if name is not None}
+    conn.executemany(f"INSERT OR IGNORE INTO {PLAYER_TABLE} (Name, Archived) VALUES (?, 1)",
+                     [(x,) for x in sorted(set(normalized.values()))])
+    ids = dict(conn.execute(
+        f"SELECT Name, ID FROM {PLAYER_TABLE} WHERE Name IN (SELECT value FROM json_each(?))",
+        (json.dumps(sorted(set(normalized.values())), ensure_ascii=False),)
+    ))
+    return {name: ids[x] for name, x in normalized.items()}
+
+
+def with_ids(hand, ids):
+    # A hand tuple with its four seats (names) swapped for their IDs.
+    return tuple(None if x is None else ids[x] for x in hand[:4]) + tuple(hand[4:])
+
+
+def player_names(conn, ids):
+    """{ID: name} for the IDs given."""
+    return dict(conn.execute(
+        f"SELECT ID, Name FROM {PLAYER_TABLE} WHERE ID IN (SELECT value FROM json_each(?))",
+        (json.dumps(sorted(int(x) for x in set(ids))),)
+    ))
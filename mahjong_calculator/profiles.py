@@ -0,0 +1,79 @@
+# Named scoring profiles.
+#
+# A profile is a multiplier plus one payoff row per points value. Settlement
+# never reads those rows hand by hand: session_payoffs() compiles a session's
+# profile into a PayoffTable once per (profile, revision) and keeps it. The
+# revision is a random token replaced whenever a profile's payoffs change, so
+# compiled tables from different database files never collide. Only the latest
+# revision compiled is kept for each profile, so edits do not pile up tables.
+import secrets
+import threading
+
+import pandas as pd
+
+from mahjong_calculator.schema import PAYOFF_TABLE, PROFILE_TABLE, SESSION_TABLE
+from mahjong_calculator.settlement import DEFAULT_PAYOFFS, PayoffTable
+
+COMPILED = {1: (0, DEFAULT_PAYOFFS)}
+COMPILED_LOCK = threading.Lock()
+
+
+def new_revision():
+    return secrets.randbits(62)
+
+
+def load_scoring(conn, profile_id):
+    return pd.read_sql(
+        f"SELECT Points, SelfDraw, OutRight FROM {PAYOFF_TABLE} WHERE ProfileID = ? ORDER BY Points",
+        conn, params=(profile_id,)
+    )
+
+
+def compiled_payoffs(conn, profile_id, revision):
+    with COMPILED_LOCK:
+        cached = COMPILED.get(profile_id)
+    if cached is not None and cached[0] == revision:
+        return cached[1]
+    table = PayoffTable(load_scoring(conn, profile_id))
+    with COMPILED_LOCK:
+        COMPILED[profile_id] = (revision, table)
+    return table
+
+
+def session_payoffs(conn, session_id):
+    """The compiled payoff table of the session's profile, read on conn."""
+    row = conn.execute(
+        f'''SELECT p.ID, p.Revision FROM {SESSION_TABLE} s JOIN {PROFILE_TABLE} p ON p.ID = s.ProfileID
+            WHERE s.ID = ?''',
+        (session_id,)
+    ).fetchone()
+    if row is None:
+        return DEFAULT_PAYOFFS
+    return compiled_payoffs(conn, *row)
+
+
+def get_profiles(db):
+    """(ID, Name, Multiplier) for every profile, by name."""
+    return db.cached('get_profiles', (PROFILE_TABLE,), lambda conn: conn.execute(
+        f"SELECT ID, Name, Multiplier FROM {PROFILE_TABLE} ORDER BY Name"
+    ).fetchall())
+
+
+def get_profile_scoring(db, profile_id):
+    return db.cached(('get_profile_scoring', profile_id), (PROFILE_TABLE,),
+                     lambda conn: load_scoring(conn, profile_id))
+
+
+def get_session_profile(db, session_id):
+    """(ID, Name, Multiplier) of the profile a session settles with."""
+    with db.read() as conn:
+        return conn.execute(
+            f'''SELECT p.ID, p.Name, p.Multiplier FROM {SESSION_TABLE} s JOIN {PROFILE_TABLE} p ON p.ID = s.ProfileID
+                WHERE s.ID = ?''',
+            (session_id,)
+        ).fetchone()
+
+
+def get_session_payoffs(db, session_id):
+    with db.read() as conn:
+        return session_payoffs(conn, session_id)
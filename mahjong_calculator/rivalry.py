@@ -0,0 +1,83 @@
+# Head-to-head matrix between players.
+#
+# head_to_head holds one row per (winner, loser) pair that has met, keyed by
+# integer player IDs and kept current by triggers on game_log. Reading a
+# session's matrix turns those rows into dense N x N arrays, with row i the
+# winner and column j the loser.
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from mahjong_calculator.events import session_entries
+from mahjong_calculator.schema import GAME_TABLE, MATRIX_TABLE, PLAYER_TABLE
+from mahjong_calculator.settlement import SELF_DRAW
+
+HeadToHead = namedtuple('HeadToHead', ['names', 'hands', 'deal_ins', 'points'])
+
+
+def load_head_to_head(conn, session_id):
+    rows = conn.execute(
+        f'''SELECT WinnerID, LoserID, Hands, DealIns, Points FROM {MATRIX_TABLE} WHERE SessionID = ?''',
+        (session_id,)
+    ).fetchall()
+    cells = np.array(rows, dtype=np.int64).reshape(-1, 5)
+    ids = np.union1d(cells[:, 0], cells[:, 1])
+    names = dict(conn.execute(
+        f"SELECT ID, Name FROM {PLAYER_TABLE} WHERE ID IN ({', '.join('?'*len(ids))})", [int(x) for x in ids]
+    ).fetchall()) if len(ids) > 0 else {}
+    # Players in name order; searchsorted maps the sorted IDs to matrix positions.
+    order = sorted(range(len(ids)), key=lambda x: names[int(ids[x])])
+    position = np.empty(len(ids), dtype=np.int64)
+    position[order] = np.arange(len(ids))
+    winner = position[np.searchsorted(ids, cells[:, 0])]
+    loser = position[np.searchsorted(ids, cells[:, 1])]
+    matrices = []
+    for column in (2, 3, 4):
+        matrix = np.zeros((len(ids), len(ids)), dtype=np.int64)
+        matrix[winner, loser] = cells[:, column]
+        matrices.append(matrix)
+    return HeadToHead([names[int(ids[x])] for x in order], *matrices)
+
+
+def get_head_to_head(db, session_id):
+    return db.cached('get_head_to_head', (GAME_TABLE, session_id), lambda conn: load_head_to_head(conn, session_id))
+
+
+def arch_nemesis(matrix):
+    """Most 出銃/包自摸 hands between one pair, either way round, as (count, ['A-B', ...])."""
+    met = matrix.deal_ins + matrix.deal_ins.T
+    upper = np.triu(met, 1)
+    if upper.size == 0 or upper.max() == 0:
+        return None, None
+    best = int(upper.max())
+    return best, sorted(f'{matrix.names[i]}-{matrix.names[j]}' for i, j in zip(*np.nonzero(upper == best)))
+
+
+def add_head_to_head(conn, session_id, entries):
+    # Add the cells of schema.matrix_cells() for the hands of game_entries() to the session's matrix.
+    seat, win_type = entries['Seat'].to_numpy(), entries['WinType'].to_numpy(dtype=object)
+    self_draw = win_type == SELF_DRAW
+    losers = entries[(seat > 0) & entries['WinnerID'].notna().to_numpy()
+                     & np.where(seat == 1, pd.notna(win_type), self_draw)]
+    cells = pd.DataFrame({
+        'WinnerID': losers['WinnerID'].to_numpy(dtype=np.int64),
+        'LoserID': losers['PlayerID'].to_numpy(),
+        'DealIns': ((losers['Seat'] == 1) & (losers['WinType'] != SELF_DRAW)).to_numpy(dtype=np.int64),
+        'Points': -losers['Points'].to_numpy(),
+    }).groupby(['WinnerID', 'LoserID']).agg(Hands=('Points', 'size'), DealIns=('DealIns', 'sum'), Points=('Points', 'sum'))
+    conn.executemany(
+        f'''INSERT INTO {MATRIX_TABLE} (SessionID, WinnerID, LoserID, Hands, DealIns, Points) VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(SessionID, WinnerID, LoserID) DO UPDATE SET
+            Hands = Hands + excluded.Hands, DealIns = DealIns + excluded.DealIns, Points = Points + excluded.Points''',
+        [(session_id, *map(int, key), *map(int, values)) for key, values in zip(cells.index, cells.to_numpy())]
+    )
+
+
+def reset_head_to_head(conn, session_id, entries=None):
+    # After a profile change the cells' points are stale; they are recounted from the session's hands
+    # (session_entries(), read here unless passed in).
+    if entries is None:
+        entries = session_entries(conn, session_id)
+    conn.execute(f"DELETE FROM {MATRIX_TABLE} WHERE SessionID = ?", (session_id,))
+    add_head_to_head(conn, session_id, entries)
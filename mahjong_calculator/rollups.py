@@ -0,0 +1,125 @@
+# Date-range leaderboards from the per-player rollups.
+#
+# player_rollups holds each player's points and stats per session and UTC day,
+# week (from Monday) and month, kept in step with game_log by triggers. A date
+# range is covered with whole months and, at its edges, whole weeks and single
+# days, so a leaderboard sums a few dozen rows per player whether the league
+# has played for a month or for ten years.
+import json
+from datetime import timedelta
+
+import pandas as pd
+
+from mahjong_calculator.awards import stat_awards
+from mahjong_calculator.events import session_entries
+from mahjong_calculator.schema import (PLAYER_TABLE, PROFILE_TABLE, ROLLUP_COLUMNS, ROLLUP_TABLE, SESSION_TABLE,
+                                       rollup_seats, rollup_select)
+
+
+def next_month(day):
+    return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def cover_days(start, end):
+    # Single days up to the first Monday, whole weeks, then single days again.
+    buckets = []
+    day = start
+    while day <= end:
+        if day.weekday() == 0 and day + timedelta(days=6) <= end:
+            buckets.append(('week', day.isoformat()))
+            day += timedelta(days=7)
+        else:
+            buckets.append(('day', day.isoformat()))
+            day += timedelta(days=1)
+    return buckets
+
+
+def cover(start, end):
+    """[(grain, bucket)] covering the days start..end (inclusive) exactly once.
+
+    Whole months in the range are one bucket each; the part before the first
+    and after the last is at most 6 days, 4 weeks and 6 days.
+    """
+    first = start if start.day == 1 else next_month(start)
+    last = (end + timedelta(days=1)).replace(day=1)
+    if first >= last:
+        return cover_days(start, end)
+    months = []
+    month = first
+    while month < last:
+        months.append(('month', month.isoformat()))
+        month = next_month(month)
+    return cover_days(start, first - timedelta(days=1)) + months + cover_days(last, end)
+
+
+def load_leaderboard(conn, start, end, session_id=None):
+    where = '' if session_id is None else f'WHERE r.SessionID = {int(session_id)}'
+    return pd.read_sql(
+        f'''SELECT p.Name AS Player, ROUND(SUM(r.Points * f.Multiplier), 2) AS Amount,
+                   {', '.join(f'SUM(r.{x}) AS {x}' for x in ROLLUP_COLUMNS)}
+            FROM json_each(?) b
+            JOIN {ROLLUP_TABLE} r ON r.Grain = json_extract(b.value, '$[0]') AND r.Bucket = json_extract(b.value, '$[1]')
+            JOIN {SESSION_TABLE} s ON s.ID = r.SessionID JOIN {PROFILE_TABLE} f ON f.ID = s.ProfileID
+            JOIN {PLAYER_TABLE} p ON p.ID = r.PlayerID
+            {where}
+            GROUP BY r.PlayerID ORDER BY Amount DESC, p.Name''',
+        conn, params=(json.dumps(cover(start, end)),)
+    )
+
+
+def get_leaderboard(db, start, end, session_id=None):
+    """Money and stats per player for hands played on the UTC days start..end, highest balance first.
+
+    Every session counts unless session_id is given; each settles with its own
+    profile's multiplier. Not cached: it reads a few rows per player anyway.
+    """
+    with db.read() as conn:
+        return load_leaderboard(conn, start, end, session_id)
+
+
+def get_standings(db, start, end, session_id=None):
+    """(leaderboard, awards) for a date range. The arch nemesis needs pairs of players, so it is not included."""
+    board = get_leaderboard(db, start, end, session_id)
+    return board, stat_awards(list(zip(board['Player'], board['SelfDrawLosses'], board['Wins'], board['WinPoints'],
+                                       board['FullSelfDrawLosses'] + board['OutRightLosses'], board['SelfDrawWins'])))
+
+
+def add_rollups(conn, session_id, entries):
+    # Add the hands of game_entries() to the session's rollups, summed per day first and then per
+    # schema.rollup_bucket().
+    days = entries[entries['Day'].notna()].groupby(['Day', 'PlayerID'])[ROLLUP_COLUMNS].sum().reset_index()
+    day = pd.to_datetime(days['Day'], format='%Y-%m-%d')
+    buckets = {'day': days['Day'],
+               'week': (day - pd.to_timedelta(day.dt.dayofweek, unit='D')).dt.strftime('%Y-%m-%d'),
+               'month': day.dt.strftime('%Y-%m-01')}
+    rows = pd.concat([days.assign(Grain=grain, Bucket=bucket) for grain, bucket in buckets.items()])
+    rows = rows.groupby(['Grain', 'Bucket', 'PlayerID'])[ROLLUP_COLUMNS].sum()
+    conn.executemany(
+        f'''INSERT INTO {ROLLUP_TABLE} (Grain, Bucket, SessionID, PlayerID, {', '.join(ROLLUP_COLUMNS)})
+            VALUES (?, ?, ?, ?, {', '.join('?' for _ in ROLLUP_COLUMNS)})
+            ON CONFLICT(Grain, Bucket, SessionID, PlayerID) DO UPDATE SET {', '.join(f'{x} = {x} + excluded.{x}' for x in ROLLUP_COLUMNS)}''',
+        [(grain, bucket, session_id, int(player), *map(int, values))
+         for (grain, bucket, player), values in zip(rows.index, rows.to_numpy())]
+    )
+
+
+def reset_rollups(conn, session_id, entries=None):
+    # After a profile change every bucket's points are stale; the session's rows are summed again from its hands
+    # (session_entries(), read here unless passed in).
+    if entries is None:
+        entries = session_entries(conn, session_id)
+    conn.execute(f"DELETE FROM {ROLLUP_TABLE} WHERE SessionID = ?", (session_id,))
+    add_rollups(conn, session_id, entries)
+
+
+def verify_rollups(db, session_id):
+    """Players whose stored rollups differ from a recount of game_log."""
+    with db.read() as conn:
+        stored = set(conn.execute(
+            f"SELECT Grain, Bucket, SessionID, PlayerID, {', '.join(ROLLUP_COLUMNS)} FROM {ROLLUP_TABLE} WHERE SessionID = ?",
+            (session_id,)
+        ))
+        counted = set(conn.execute(rollup_select(rollup_seats('g', f'g.SessionID = {int(session_id)}'))))
+        differ = {x[3] for x in stored ^ counted}
+        names = dict(conn.execute(f"SELECT ID, Name FROM {PLAYER_TABLE}"))
+    return sorted(names.get(x, str(x)) for x in differ)
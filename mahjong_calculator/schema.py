@@ -0,0 +1,681 @@
+# Versioned schema migrations tracked in PRAGMA user_version.
+#
+# Each entry upgrades the database from the previous version. Version 1 is the
+# schema the app created before migrations existed, so its statements use
+# IF NOT EXISTS and are safe to run over an older database file.
+GAME_TABLE = 'game_log'
+PLAYER_TABLE = 'players'
+BALANCE_TABLE = 'player_balance'
+VERSION_TABLE = 'log_version'
+SESSION_TABLE = 'sessions'
+PROFILE_TABLE = 'scoring_profiles'
+PAYOFF_TABLE = 'scoring_payoffs'
+STATS_TABLE = 'player_stats'
+MATRIX_TABLE = 'head_to_head'
+SERIES_TABLE = 'balance_series'
+BULK_TABLE = 'bulk_load'
+BATCH_TABLE = 'hand_batches'
+EVENT_TABLE = 'game_events'
+SNAPSHOT_TABLE = 'event_snapshots'
+HAND_VIEW = 'game_hands'
+ROLLUP_TABLE = 'player_rollups'
+CACHE_TABLE = 'cache_versions'
+# Replaced by players in version 10.
+ROSTER_TABLE = 'player_name'
+PLAYER_ID_TABLE = 'player_ids'
+BULK_SKIP = f"NOT EXISTS (SELECT 1 FROM {BULK_TABLE} WHERE SessionID = NEW.SessionID)"
+
+PLAYER_SEATS = ['Winner', 'Loser1', 'Loser2', 'Loser3']
+STATS_COLUMNS = ['Hands', 'Wins', 'WinPoints', 'SelfDrawWins', 'FullSelfDrawWins', 'OutRightWins',
+                 'SelfDrawLosses', 'FullSelfDrawLosses', 'OutRightLosses']
+ROLLUP_GRAINS = ['day', 'week', 'month']
+ROLLUP_COLUMNS = ['Points'] + STATS_COLUMNS
+
+
+# Up to version 9 game_log and the tables derived from it held player names:
+# Winner, Loser1, ... and Player. Since version 10 they hold player IDs in
+# WinnerID, Loser1ID, ... and PlayerID. The generators below write the current
+# layout; named=True gives the old one, for the migrations that predate it.
+def seat_column(seat, named=False):
+    return seat if named else f'{seat}ID'
+
+
+def player_column(named=False):
+    return 'Player' if named else 'PlayerID'
+
+
+def seat_names(row):
+    """(select list, joins) naming the seats of a game_log or game_events alias as Winner, Loser1, ..."""
+    columns = ', '.join(f'{row}_{seat}.Name AS {seat}' for seat in PLAYER_SEATS)
+    joins = ' '.join(f'LEFT JOIN {PLAYER_TABLE} {row}_{seat} ON {row}_{seat}.ID = {row}.{seat_column(seat)}'
+                     for seat in PLAYER_SEATS)
+    return columns, joins
+
+
+def seat_stats(row, named=False):
+    """Per-seat (column, STATS_COLUMNS expressions) for one game_log row (NEW, OLD or an alias)."""
+    # IS rather than = so a NULL WinType counts as 0 instead of nulling the sum.
+    self_draw = f"({row}.WinType IS '自摸')"
+    full_self_draw = f"({row}.WinType IS '包自摸')"
+    out_right = f"({row}.WinType IS NOT NULL AND {row}.WinType NOT IN ('自摸', '包自摸'))"
+    return [
+        (seat_column('Winner', named), ['1', '1', f'COALESCE({row}.Points, 0)', self_draw, full_self_draw, out_right, '0', '0', '0']),
+        (seat_column('Loser1', named), ['1', '0', '0', '0', '0', '0', self_draw, full_self_draw, out_right]),
+        (seat_column('Loser2', named), ['1', '0', '0', '0', '0', '0', self_draw, '0', '0']),
+        (seat_column('Loser3', named), ['1', '0', '0', '0', '0', '0', self_draw, '0', '0']),
+    ]
+
+
+def trigger(name, event, statements, when=None):
+    return f'''CREATE TRIGGER {GAME_TABLE}_{name}_{event.lower()} AFTER {event} ON {GAME_TABLE}
+        {'' if when is None else f'WHEN {when}'}
+        BEGIN
+        {' '.join(statements)}
+        END'''
+
+
+def stats_trigger(event, row, sign, when=None, named=False):
+    # One UPSERT per seat; a delete also drops players left with no hands.
+    player = player_column(named)
+    upserts = []
+    for seat, values in seat_stats(row, named):
+        upserts.append(
+            f'''INSERT INTO {STATS_TABLE} (SessionID, {player}, {', '.join(STATS_COLUMNS)})
+                SELECT {row}.SessionID, {row}.{seat}, {', '.join(x if x == '0' else f'{sign}{x}' for x in values)} WHERE {row}.{seat} IS NOT NULL
+                ON CONFLICT(SessionID, {player}) DO UPDATE SET {', '.join(f'{x} = {x} + excluded.{x}' for x in STATS_COLUMNS)};''')
+    if sign == '-':
+        upserts.append(f"DELETE FROM {STATS_TABLE} WHERE SessionID = OLD.SessionID AND Hands <= 0;")
+    return trigger('stats', event, upserts, when)
+
+
+def stats_backfill(where='1', named=False):
+    """Count player_stats from game_log; where filters game_log g."""
+    player = player_column(named)
+    selects = [
+        f'''SELECT g.SessionID AS SessionID, g.{seat} AS {player}, {', '.join(f'{x} AS {column}' for x, column in zip(values, STATS_COLUMNS))}
+            FROM {GAME_TABLE} g WHERE {where} AND g.{seat} IS NOT NULL'''
+        for seat, values in seat_stats('g', named)
+    ]
+    return f'''INSERT INTO {STATS_TABLE} (SessionID, {player}, {', '.join(STATS_COLUMNS)})
+        SELECT SessionID, {player}, {', '.join(f'SUM({x})' for x in STATS_COLUMNS)}
+        FROM ({' UNION ALL '.join(selects)})
+        GROUP BY SessionID, {player}'''
+
+
+def payoff(row, column):
+    # The session profile's SelfDraw or OutRight payoff for a game_log row.
+    return f'''COALESCE((SELECT p.{column} FROM {PAYOFF_TABLE} p JOIN {SESSION_TABLE} s ON p.ProfileID = s.ProfileID
+                          WHERE s.ID = {row}.SessionID AND p.Points = {row}.Points), 0)'''
+
+
+def loser1_paid(row):
+    return (f"CASE WHEN {row}.WinType IS '自摸' THEN {payoff(row, 'SelfDraw')} "
+            f"WHEN {row}.WinType IS '包自摸' THEN 3*{payoff(row, 'SelfDraw')} ELSE {payoff(row, 'OutRight')} END")
+
+
+def matrix_cells(row, named=False):
+    """(loser column, condition, DealIns, Points) for each head_to_head cell a hand touches.
+
+    Points are what the loser paid the winner under the session's profile.
+    """
+    return [
+        (seat_column('Loser1', named), f'{row}.WinType IS NOT NULL', f"({row}.WinType IS NOT '自摸')", loser1_paid(row)),
+        (seat_column('Loser2', named), f"{row}.WinType IS '自摸'", '0', payoff(row, 'SelfDraw')),
+        (seat_column('Loser3', named), f"{row}.WinType IS '自摸'", '0', payoff(row, 'SelfDraw')),
+    ]
+
+
+def matrix_trigger(event, row, sign, when=None, named=False):
+    # Cells are keyed by integer player IDs; with named, names are given one on first sight.
+    statements = []
+    if sign == '+' and named:
+        statements.append(
+            f'''INSERT OR IGNORE INTO {PLAYER_ID_TABLE} (Name)
+                SELECT Name FROM (SELECT {row}.Winner AS Name UNION ALL SELECT {row}.Loser1 UNION ALL SELECT {row}.Loser2 UNION ALL SELECT {row}.Loser3)
+                WHERE Name IS NOT NULL;''')
+    for seat, condition, deal_ins, points in matrix_cells(row, named):
+        if named:
+            source = f'''SELECT {row}.SessionID, w.ID, l.ID, {sign}1, {sign}{deal_ins}, {sign}{points}
+                FROM {PLAYER_ID_TABLE} w, {PLAYER_ID_TABLE} l WHERE w.Name = {row}.Winner AND l.Name = {row}.{seat} AND {condition}'''
+        else:
+            source = f'''SELECT {row}.SessionID, {row}.WinnerID, {row}.{seat}, {sign}1, {sign}{deal_ins}, {sign}{points}
+                WHERE {row}.WinnerID IS NOT NULL AND {row}.{seat} IS NOT NULL AND {condition}'''
+        statements.append(
+            f'''INSERT INTO {MATRIX_TABLE} (SessionID, WinnerID, LoserID, Hands, DealIns, Points)
+                {source}
+                ON CONFLICT(SessionID, WinnerID, LoserID) DO UPDATE SET
+                Hands = Hands + excluded.Hands, DealIns = DealIns + excluded.DealIns, Points = Points + excluded.Points;''')
+    if sign == '-':
+        winner = f'(SELECT ID FROM {PLAYER_ID_TABLE} WHERE Name = OLD.Winner)' if named else 'OLD.WinnerID'
+        statements.append(
+            f'''DELETE FROM {MATRIX_TABLE} WHERE SessionID = OLD.SessionID AND Hands <= 0
+                AND WinnerID = {winner};''')
+    return trigger('matrix', event, statements, when)
+
+
+def player_ids_backfill(where='1'):
+    return f'''INSERT OR IGNORE INTO {PLAYER_ID_TABLE} (Name)
+        SELECT Name FROM ({' UNION ALL '.join(f'SELECT g.{seat} AS Name FROM {GAME_TABLE} g WHERE {where}'
+                                              for seat in ('Winner', 'Loser1', 'Loser2', 'Loser3'))})
+        WHERE Name IS NOT NULL'''
+
+
+def matrix_backfill(where='1', named=False):
+    """Count head_to_head cells from game_log; where filters game_log g."""
+    if named:
+        selects = [
+            f'''SELECT g.SessionID AS SessionID, w.ID AS WinnerID, l.ID AS LoserID, {deal_ins} AS DealIns, {points} AS Points
+                FROM {GAME_TABLE} g JOIN {PLAYER_ID_TABLE} w ON w.Name = g.Winner JOIN {PLAYER_ID_TABLE} l ON l.Name = g.{seat}
+                WHERE {where} AND {condition}'''
+            for seat, condition, deal_ins, points in matrix_cells('g', named)
+        ]
+    else:
+        selects = [
+            f'''SELECT g.SessionID AS SessionID, g.WinnerID AS WinnerID, g.{seat} AS LoserID, {deal_ins} AS DealIns, {points} AS Points
+                FROM {GAME_TABLE} g WHERE {where} AND g.WinnerID IS NOT NULL AND g.{seat} IS NOT NULL AND {condition}'''
+            for seat, condition, deal_ins, points in matrix_cells('g')
+        ]
+    return f'''INSERT INTO {MATRIX_TABLE} (SessionID, WinnerID, LoserID, Hands, DealIns, Points)
+        SELECT SessionID, WinnerID, LoserID, COUNT(*), SUM(DealIns), SUM(Points)
+        FROM ({' UNION ALL '.join(selects)})
+        GROUP BY SessionID, WinnerID, LoserID'''
+
+
+def seat_points(row, named=False):
+    """(column, condition, points) for each player a hand settles with, as in hand_points()."""
+    return [
+        (seat_column('Winner', named), '1', f"CASE WHEN {row}.WinType IN ('自摸', '包自摸') THEN 3*{payoff(row, 'SelfDraw')} ELSE {payoff(row, 'OutRight')} END"),
+        (seat_column('Loser1', named), '1', f'-({loser1_paid(row)})'),
+        (seat_column('Loser2', named), f"{row}.WinType IS '自摸'", f"-{payoff(row, 'SelfDraw')}"),
+        (seat_column('Loser3', named), f"{row}.WinType IS '自摸'", f"-{payoff(row, 'SelfDraw')}"),
+    ]
+
+
+def series_trigger(event, row, when=None, shift=False, named=False):
+    # Without shift a new hand is assumed to have the highest ID, so the player's previous balance is their last
+    # row. With shift a hand may sit anywhere: it builds on the row before it and moves every later balance.
+    player = player_column(named)
+    statements = []
+    for seat, condition, points in seat_points(row, named):
+        later = f"SessionID = {row}.SessionID AND {player} = {row}.{seat} AND GameID > {row}.ID"
+        if event == 'INSERT':
+            statements.append(
+                f'''INSERT INTO {SERIES_TABLE} (SessionID, {player}, GameID, Balance)
+                    SELECT {row}.SessionID, {row}.{seat}, {row}.ID, {points} + COALESCE((
+                        SELECT Balance FROM {SERIES_TABLE} WHERE SessionID = {row}.SessionID AND {player} = {row}.{seat}
+                        {f'AND GameID < {row}.ID' if shift else ''} ORDER BY GameID DESC LIMIT 1), 0)
+                    WHERE {row}.{seat} IS NOT NULL AND {condition};''')
+            if shift:
+                statements.append(
+                    f'''UPDATE {SERIES_TABLE} SET Balance = Balance + ({points})
+                        WHERE {later} AND {row}.{seat} IS NOT NULL AND {condition};''')
+        else:
+            statements.append(
+                f'''DELETE FROM {SERIES_TABLE} WHERE SessionID = {row}.SessionID AND {player} = {row}.{seat} AND GameID = {row}.ID;''')
+            if shift:
+                statements.append(
+                    f'''UPDATE {SERIES_TABLE} SET Balance = Balance - ({points})
+                        WHERE {later} AND {row}.{seat} IS NOT NULL AND {condition};''')
+    return trigger('series', event, statements, when)
+
+
+def series_backfill(where='1', named=False):
+    """Write balance_series from game_log with a running sum; where filters game_log g."""
+    player = player_column(named)
+    selects = [
+        f'''SELECT g.SessionID AS SessionID, g.{seat} AS {player}, g.ID AS GameID, {points} AS Points
+            FROM {GAME_TABLE} g WHERE {where} AND g.{seat} IS NOT NULL AND {condition}'''
+        for seat, condition, points in seat_points('g', named)
+    ]
+    return f'''INSERT INTO {SERIES_TABLE} (SessionID, {player}, GameID, Balance)
+        SELECT SessionID, {player}, GameID, SUM(Points) OVER (PARTITION BY SessionID, {player} ORDER BY GameID)
+        FROM ({' UNION ALL '.join(selects)}) h'''
+
+
+def rollup_bucket(grain, played):
+    # The first day of the UTC day, Monday-started week or month a Played timestamp falls in.
+    return {'day': f"date({played})",
+            'week': f"date({played}, '-6 days', 'weekday 1')",
+            'month': f"strftime('%Y-%m-01', {played})"}[grain]
+
+
+def rollup_seats(row, where=None):
+    """(SessionID, PlayerID, Played, ROLLUP_COLUMNS) selects, one per seat of a game_log row (NEW, OLD or, with where, g)."""
+    source = 'WHERE' if where is None else f'FROM {GAME_TABLE} {row} WHERE {where} AND'
+    return [
+        f'''SELECT {row}.SessionID AS SessionID, {row}.{seat} AS PlayerID, {row}.Played AS Played,
+            CASE WHEN {condition} THEN {points} ELSE 0 END AS Points, {', '.join(f'{x} AS {column}' for x, column in zip(values, STATS_COLUMNS))}
+            {source} {row}.{seat} IS NOT NULL AND {row}.Played IS NOT NULL'''
+        for (seat, values), (_, condition, points) in zip(seat_stats(row), seat_points(row))
+    ]
+
+
+def rollup_select(seats, sign=''):
+    # The seats' hands summed per (Grain, Bucket, SessionID, PlayerID), every hand counted once per grain.
+    # Summed per day first, so weeks and months are worked out once per player and day rather than per hand.
+    grains = ' UNION ALL '.join(f"SELECT '{x}' AS Grain" for x in ROLLUP_GRAINS)
+    bucket = 'CASE k.Grain ' + ' '.join(f"WHEN '{x}' THEN {rollup_bucket(x, 'd.Day')}" for x in ROLLUP_GRAINS) + ' END'
+    return f'''SELECT k.Grain, {bucket} AS Bucket, d.SessionID, d.PlayerID, {', '.join(f'{sign}SUM(d.{x})' for x in ROLLUP_COLUMNS)}
+        FROM (SELECT {rollup_bucket('day', 'h.Played')} AS Day, h.SessionID, h.PlayerID, {', '.join(f'SUM(h.{x}) AS {x}' for x in ROLLUP_COLUMNS)}
+              FROM ({' UNION ALL '.join(seats)}) h GROUP BY Day, h.SessionID, h.PlayerID) d, ({grains}) k WHERE 1
+        GROUP BY k.Grain, Bucket, d.SessionID, d.PlayerID'''
+
+
+def rollup_insert(seats, sign='', upsert=False):
+    statement = f'''INSERT INTO {ROLLUP_TABLE} (Grain, Bucket, SessionID, PlayerID, {', '.join(ROLLUP_COLUMNS)})
+        {rollup_select(seats, sign)}'''
+    if upsert:
+        statement += f''' ON CONFLICT(Grain, Bucket, SessionID, PlayerID) DO UPDATE SET {', '.join(f'{x} = {x} + excluded.{x}' for x in ROLLUP_COLUMNS)}'''
+    return statement
+
+
+def rollup_trigger(event, row, sign, when=None):
+    # One upsert covers every seat and grain; a delete then drops the emptied rows of the hand's three buckets.
+    statements = [rollup_insert(rollup_seats(row), sign, upsert=True) + ';']
+    if sign == '-':
+        buckets = ', '.join(f"('{x}', {rollup_bucket(x, f'{row}.Played')})" for x in ROLLUP_GRAINS)
+        statements.append(
+            f'''DELETE FROM {ROLLUP_TABLE} WHERE (Grain, Bucket) IN (VALUES {buckets})
+                AND SessionID = {row}.SessionID AND Hands <= 0;''')
+    return trigger('rollup', event, statements, when)
+
+
+def rollup_backfill(where='1'):
+    """Sum player_rollups from game_log; where filters game_log g."""
+    return rollup_insert(rollup_seats('g', where))
+
+
+def player_id(name):
+    # The players ID of a pre-version 10 name column, matched as it is normalized.
+    return f"(SELECT p.ID FROM {PLAYER_TABLE} p WHERE p.Name = UPPER(TRIM({name})))"
+
+
+MIGRATIONS = [
+    (1, [
+        f'''CREATE TABLE IF NOT EXISTS {GAME_TABLE} (
+            ID INTEGER PRIMARY KEY AUTOINCREMENT,
+            Winner TEXT,
+            Loser1 TEXT,
+            Loser2 TEXT,
+            Loser3 TEXT,
+            WinType TEXT,
+            Points INTEGER
+            )''',
+        f'''CREATE TABLE IF NOT EXISTS {ROSTER_TABLE} (
+            Name TEXT
+            )''',
+        f'''CREATE TABLE IF NOT EXISTS {BALANCE_TABLE} (
+            Player TEXT PRIMARY KEY,
+            Points INTEGER NOT NULL DEFAULT 0,
+            Hands INTEGER NOT NULL DEFAULT 0
+            )''',
+        f'''CREATE TABLE IF NOT EXISTS {VERSION_TABLE} (
+            ID INTEGER PRIMARY KEY CHECK (ID = 1),
+            Writes INTEGER NOT NULL DEFAULT 0
+            )''',
+        f"INSERT OR IGNORE INTO {VERSION_TABLE} (ID, Writes) VALUES (1, 0)",
+    ]),
+    (2, [
+        f"CREATE INDEX IF NOT EXISTS idx_{GAME_TABLE}_wintype ON {GAME_TABLE} (WinType)",
+        f"CREATE INDEX IF NOT EXISTS idx_{GAME_TABLE}_loser1 ON {GAME_TABLE} (Loser1)",
+        f"CREATE INDEX IF NOT EXISTS idx_{GAME_TABLE}_winner_loser1 ON {GAME_TABLE} (Winner, Loser1)",
+    ]),
+    # Hands, balances and log versions are partitioned by session. Every
+    # game_log index leads with SessionID so a session only reads its own rows.
+    (3, [
+        f'''CREATE TABLE {SESSION_TABLE} (
+            ID INTEGER PRIMARY KEY AUTOINCREMENT,
+            Name TEXT NOT NULL,
+            Created TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            Archived INTEGER NOT NULL DEFAULT 0
+            )''',
+        f"INSERT INTO {SESSION_TABLE} (ID, Name) VALUES (1, 'Default')",
+        f"CREATE INDEX idx_{SESSION_TABLE}_archived ON {SESSION_TABLE} (Archived, ID)",
+        f"ALTER TABLE {GAME_TABLE} ADD COLUMN SessionID INTEGER NOT NULL DEFAULT 1",
+        f"DROP INDEX idx_{GAME_TABLE}_wintype",
+        f"DROP INDEX idx_{GAME_TABLE}_loser1",
+        f"DROP INDEX idx_{GAME_TABLE}_winner_loser1",
+        f"CREATE INDEX idx_{GAME_TABLE}_session ON {GAME_TABLE} (SessionID, ID)",
+        f"CREATE INDEX idx_{GAME_TABLE}_session_wintype ON {GAME_TABLE} (SessionID, WinType)",
+        f"CREATE INDEX idx_{GAME_TABLE}_session_loser1 ON {GAME_TABLE} (SessionID, Loser1)",
+        f"CREATE INDEX idx_{GAME_TABLE}_session_winner_loser1 ON {GAME_TABLE} (SessionID, Winner, Loser1)",
+        f'''CREATE TABLE {BALANCE_TABLE}_new (
+            SessionID INTEGER NOT NULL,
+            Player TEXT NOT NULL,
+            Points INTEGER NOT NULL DEFAULT 0,
+            Hands INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (SessionID, Player)
+            )''',
+        f"INSERT INTO {BALANCE_TABLE}_new (SessionID, Player, Points, Hands) SELECT 1, Player, Points, Hands FROM {BALANCE_TABLE}",
+        f"DROP TABLE {BALANCE_TABLE}",
+        f"ALTER TABLE {BALANCE_TABLE}_new RENAME TO {BALANCE_TABLE}",
+        f'''CREATE TABLE {VERSION_TABLE}_new (
+            SessionID INTEGER PRIMARY KEY,
+            Writes INTEGER NOT NULL DEFAULT 0
+            )''',
+        f"INSERT INTO {VERSION_TABLE}_new (SessionID, Writes) SELECT 1, Writes FROM {VERSION_TABLE}",
+        f"DROP TABLE {VERSION_TABLE}",
+        f"ALTER TABLE {VERSION_TABLE}_new RENAME TO {VERSION_TABLE}",
+    ]),
+    # Named scoring profiles. Every session settles with one profile; profile 1
+    # is the original table, so existing ledgers stay valid. Revision is bumped
+    # whenever a profile's payoffs change, to key its compiled lookup.
+    (4, [
+        f'''CREATE TABLE {PROFILE_TABLE} (
+            ID INTEGER PRIMARY KEY AUTOINCREMENT,
+            Name TEXT NOT NULL UNIQUE,
+            Multiplier REAL NOT NULL DEFAULT 0.15,
+            Revision INTEGER NOT NULL DEFAULT 0
+            )''',
+        f'''CREATE TABLE {PAYOFF_TABLE} (
+            ProfileID INTEGER NOT NULL REFERENCES {PROFILE_TABLE} (ID),
+            Points INTEGER NOT NULL,
+            SelfDraw INTEGER NOT NULL,
+            OutRight INTEGER NOT NULL,
+            PRIMARY KEY (ProfileID, Points)
+            )''',
+        f"INSERT INTO {PROFILE_TABLE} (ID, Name, Multiplier) VALUES (1, 'Default', 0.15)",
+        f'''INSERT INTO {PAYOFF_TABLE} (ProfileID, Points, SelfDraw, OutRight) VALUES
+            (1, 3, 4, 8), (1, 4, 8, 16), (1, 5, 12, 24), (1, 6, 16, 32),
+            (1, 7, 24, 48), (1, 8, 32, 64), (1, 9, 48, 96), (1, 10, 64, 128)''',
+        f"ALTER TABLE {SESSION_TABLE} ADD COLUMN ProfileID INTEGER NOT NULL DEFAULT 1",
+    ]),
+    # Per-player counts kept in step with game_log by triggers, so awards and
+    # the stats page read one row per player whatever the history length.
+    (5, [
+        f'''CREATE TABLE {STATS_TABLE} (
+            SessionID INTEGER NOT NULL,
+            Player TEXT NOT NULL,
+            {' '.join(f'{x} INTEGER NOT NULL DEFAULT 0,' for x in STATS_COLUMNS)}
+            PRIMARY KEY (SessionID, Player)
+            )''',
+        stats_backfill(named=True),
+        stats_trigger('INSERT', 'NEW', '+', named=True),
+        stats_trigger('DELETE', 'OLD', '-', named=True),
+    ]),
+    # Head-to-head cells per (winner, loser), keyed by integer player IDs and
+    # maintained by triggers like player_stats.
+    (6, [
+        f'''CREATE TABLE {PLAYER_ID_TABLE} (
+            ID INTEGER PRIMARY KEY,
+            Name TEXT NOT NULL UNIQUE
+            )''',
+        f'''CREATE TABLE {MATRIX_TABLE} (
+            SessionID INTEGER NOT NULL,
+            WinnerID INTEGER NOT NULL,
+            LoserID INTEGER NOT NULL,
+            Hands INTEGER NOT NULL DEFAULT 0,
+            DealIns INTEGER NOT NULL DEFAULT 0,
+            Points INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (SessionID, WinnerID, LoserID)
+            ) WITHOUT ROWID''',
+        f"INSERT OR IGNORE INTO {PLAYER_ID_TABLE} (Name) SELECT Name FROM {ROSTER_TABLE} WHERE Name IS NOT NULL",
+        player_ids_backfill(),
+        matrix_backfill(named=True),
+        matrix_trigger('INSERT', 'NEW', '+', named=True),
+        matrix_trigger('DELETE', 'OLD', '-', named=True),
+    ]),
+    # Hands get a timestamp; hands from before this migration take their
+    # session's start. balance_series holds each player's running balance
+    # (scoring points) after every hand they played, so the balance at any
+    # hand, or between two hands, is an index seek per player. Deleting a
+    # hand removes only that hand's rows, which is exact for undo and clear.
+    (7, [
+        f"ALTER TABLE {GAME_TABLE} ADD COLUMN Played TEXT",
+        f"UPDATE {GAME_TABLE} SET Played = (SELECT Created FROM {SESSION_TABLE} s WHERE s.ID = {GAME_TABLE}.SessionID)",
+        f"CREATE INDEX idx_{GAME_TABLE}_session_played ON {GAME_TABLE} (SessionID, Played)",
+        f'''CREATE TABLE {SERIES_TABLE} (
+            SessionID INTEGER NOT NULL,
+            Player TEXT NOT NULL,
+            GameID INTEGER NOT NULL,
+            Balance INTEGER NOT NULL,
+            PRIMARY KEY (SessionID, Player, GameID)
+            ) WITHOUT ROWID''',
+        series_backfill(named=True),
+        series_trigger('INSERT', 'NEW', BULK_SKIP, named=True),
+        series_trigger('DELETE', 'OLD', named=True),
+        # While a session is listed in bulk_load its insert triggers stand
+        # aside; the importer updates the derived tables per chunk instead.
+        f"CREATE TABLE {BULK_TABLE} (SessionID INTEGER PRIMARY KEY)",
+        f"DROP TRIGGER {GAME_TABLE}_stats_insert",
+        stats_trigger('INSERT', 'NEW', '+', BULK_SKIP, named=True),
+        f"DROP TRIGGER {GAME_TABLE}_matrix_insert",
+        matrix_trigger('INSERT', 'NEW', '+', BULK_SKIP, named=True),
+    ]),
+    # One row per committed batch of hands, so a retried commit with the same
+    # key is recognised and skipped instead of adding the hands twice.
+    (8, [
+        f'''CREATE TABLE {BATCH_TABLE} (
+            BatchKey TEXT PRIMARY KEY,
+            SessionID INTEGER NOT NULL,
+            Hands INTEGER NOT NULL,
+            FirstID INTEGER,
+            LastID INTEGER,
+            Committed TEXT DEFAULT CURRENT_TIMESTAMP
+            ) WITHOUT ROWID''',
+    ]),
+    # game_events is the append-only history of every session's hands: adds,
+    # voids (of any hand, with the values it had), corrections (with the new
+    # values) and clears. Existing hands are logged as adds. event_snapshots
+    # holds each player's points and stats as of every so many events. Voids
+    # and corrections can hit any hand, so the series triggers now move the
+    # balances after it as well.
+    (9, [
+        f'''CREATE TABLE {EVENT_TABLE} (
+            EventID INTEGER PRIMARY KEY AUTOINCREMENT,
+            SessionID INTEGER NOT NULL,
+            Kind TEXT NOT NULL,
+            GameID INTEGER,
+            Winner TEXT,
+            Loser1 TEXT,
+            Loser2 TEXT,
+            Loser3 TEXT,
+            WinType TEXT,
+            Points INTEGER,
+            Played TEXT,
+            Recorded TEXT DEFAULT CURRENT_TIMESTAMP
+            )''',
+        f"CREATE INDEX idx_{EVENT_TABLE}_session ON {EVENT_TABLE} (SessionID)",
+        f"CREATE INDEX idx_{EVENT_TABLE}_game ON {EVENT_TABLE} (SessionID, GameID)",
+        f"CREATE INDEX idx_{EVENT_TABLE}_recorded ON {EVENT_TABLE} (SessionID, Recorded)",
+        f'''INSERT INTO {EVENT_TABLE} (SessionID, Kind, GameID, Winner, Loser1, Loser2, Loser3, WinType, Points, Played, Recorded)
+            SELECT SessionID, 'add', ID, Winner, Loser1, Loser2, Loser3, WinType, Points, Played, COALESCE(Played, CURRENT_TIMESTAMP)
+            FROM {GAME_TABLE} ORDER BY ID''',
+        f'''CREATE TABLE {SNAPSHOT_TABLE} (
+            SessionID INTEGER NOT NULL,
+            EventID INTEGER NOT NULL,
+            Player TEXT NOT NULL,
+            Points INTEGER NOT NULL,
+            {' '.join(f'{x} INTEGER NOT NULL,' for x in STATS_COLUMNS)}
+            PRIMARY KEY (SessionID, EventID, Player)
+            ) WITHOUT ROWID''',
+        f"DROP TRIGGER {GAME_TABLE}_series_insert",
+        series_trigger('INSERT', 'NEW', BULK_SKIP, shift=True, named=True),
+        f"DROP TRIGGER {GAME_TABLE}_series_delete",
+        series_trigger('DELETE', 'OLD', shift=True, named=True),
+    ]),
+    # The players registry replaces player_name and player_ids: one row per
+    # player with an integer ID, the name upper-cased and trimmed (unique in
+    # that form) and an Archived flag for players off the roster. Names only
+    # seen in hands are archived; names differing only in case or surrounding
+    # spaces become one player, keeping the lowest player_ids ID. game_log and
+    # game_events refer to players by ID, and the derived tables are keyed by
+    # PlayerID. Tables that cannot be recounted from game_log are re-keyed;
+    # the rest are rebuilt. game_hands is game_log with the names joined back.
+    (10, [
+        f'''CREATE TABLE {PLAYER_TABLE} (
+            ID INTEGER PRIMARY KEY,
+            Name TEXT NOT NULL UNIQUE CHECK (Name <> '' AND Name = UPPER(TRIM(Name))),
+            Archived INTEGER NOT NULL DEFAULT 0
+            )''',
+        f'''INSERT INTO {PLAYER_TABLE} (ID, Name, Archived)
+            SELECT MIN(ID), UPPER(TRIM(Name)), 1 FROM {PLAYER_ID_TABLE} WHERE TRIM(Name) <> '' GROUP BY UPPER(TRIM(Name))''',
+        f'''INSERT INTO {PLAYER_TABLE} (Name, Archived)
+            SELECT DISTINCT UPPER(TRIM(Name)), 0 FROM {ROSTER_TABLE} WHERE TRIM(Name) <> ''
+            ON CONFLICT(Name) DO UPDATE SET Archived = 0''',
+        f'''INSERT OR IGNORE INTO {PLAYER_TABLE} (Name, Archived)
+            SELECT UPPER(TRIM(Name)), 1 FROM ({' UNION '.join(f'SELECT {seat} AS Name FROM {table}'
+                                                              for table in (GAME_TABLE, EVENT_TABLE) for seat in PLAYER_SEATS)})
+            WHERE TRIM(Name) <> '' ''',
+        f"ALTER TABLE {GAME_TABLE} RENAME TO {GAME_TABLE}_v9",
+        f'''CREATE TABLE {GAME_TABLE} (
+            ID INTEGER PRIMARY KEY AUTOINCREMENT,
+            SessionID INTEGER NOT NULL DEFAULT 1,
+            {' '.join(f'{seat}ID INTEGER REFERENCES {PLAYER_TABLE} (ID),' for seat in PLAYER_SEATS)}
+            WinType TEXT,
+            Points INTEGER,
+            Played TEXT
+            )''',
+        f'''INSERT INTO {GAME_TABLE} (ID, SessionID, {', '.join(f'{seat}ID' for seat in PLAYER_SEATS)}, WinType, Points, Played)
+            SELECT ID, SessionID, {', '.join(player_id(f'g.{seat}') for seat in PLAYER_SEATS)}, WinType, Points, Played
+            FROM {GAME_TABLE}_v9 g ORDER BY ID''',
+        # Carry the AUTOINCREMENT counter over, so IDs of voided hands are never handed out again.
+        f"DELETE FROM sqlite_sequence WHERE name = '{GAME_TABLE}'",
+        f"UPDATE sqlite_sequence SET name = '{GAME_TABLE}' WHERE name = '{GAME_TABLE}_v9'",
+        f"DROP TABLE {GAME_TABLE}_v9",
+        f"CREATE INDEX idx_{GAME_TABLE}_session ON {GAME_TABLE} (SessionID, ID)",
+        f"CREATE INDEX idx_{GAME_TABLE}_session_wintype ON {GAME_TABLE} (SessionID, WinType)",
+        f"CREATE INDEX idx_{GAME_TABLE}_session_loser1 ON {GAME_TABLE} (SessionID, Loser1ID)",
+        f"CREATE INDEX idx_{GAME_TABLE}_session_winner_loser1 ON {GAME_TABLE} (SessionID, WinnerID, Loser1ID)",
+        f"CREATE INDEX idx_{GAME_TABLE}_session_played ON {GAME_TABLE} (SessionID, Played)",
+        f"ALTER TABLE {EVENT_TABLE} RENAME TO {EVENT_TABLE}_v9",
+        f'''CREATE TABLE {EVENT_TABLE} (
+            EventID INTEGER PRIMARY KEY AUTOINCREMENT,
+            SessionID INTEGER NOT NULL,
+            Kind TEXT NOT NULL,
+            GameID INTEGER,
+            {' '.join(f'{seat}ID INTEGER REFERENCES {PLAYER_TABLE} (ID),' for seat in PLAYER_SEATS)}
+            WinType TEXT,
+            Points INTEGER,
+            Played TEXT,
+            Recorded TEXT DEFAULT CURRENT_TIMESTAMP
+            )''',
+        f'''INSERT INTO {EVENT_TABLE} (EventID, SessionID, Kind, GameID, {', '.join(f'{seat}ID' for seat in PLAYER_SEATS)}, WinType, Points, Played, Recorded)
+            SELECT EventID, SessionID, Kind, GameID, {', '.join(player_id(f'e.{seat}') for seat in PLAYER_SEATS)}, WinType, Points, Played, Recorded
+            FROM {EVENT_TABLE}_v9 e ORDER BY EventID''',
+        f"DELETE FROM sqlite_sequence WHERE name = '{EVENT_TABLE}'",
+        f"UPDATE sqlite_sequence SET name = '{EVENT_TABLE}' WHERE name = '{EVENT_TABLE}_v9'",
+        f"DROP TABLE {EVENT_TABLE}_v9",
+        f"CREATE INDEX idx_{EVENT_TABLE}_session ON {EVENT_TABLE} (SessionID)",
+        f"CREATE INDEX idx_{EVENT_TABLE}_game ON {EVENT_TABLE} (SessionID, GameID)",
+        f"CREATE INDEX idx_{EVENT_TABLE}_recorded ON {EVENT_TABLE} (SessionID, Recorded)",
+        f"ALTER TABLE {BALANCE_TABLE} RENAME TO {BALANCE_TABLE}_v9",
+        f'''CREATE TABLE {BALANCE_TABLE} (
+            SessionID INTEGER NOT NULL,
+            PlayerID INTEGER NOT NULL,
+            Points INTEGER NOT NULL DEFAULT 0,
+            Hands INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (SessionID, PlayerID)
+            )''',
+        f'''INSERT INTO {BALANCE_TABLE} (SessionID, PlayerID, Points, Hands)
+            SELECT b.SessionID, {player_id('b.Player')} AS PlayerID, SUM(b.Points), SUM(b.Hands)
+            FROM {BALANCE_TABLE}_v9 b WHERE PlayerID IS NOT NULL GROUP BY b.SessionID, PlayerID''',
+        f"DROP TABLE {BALANCE_TABLE}_v9",
+        f"ALTER TABLE {SNAPSHOT_TABLE} RENAME TO {SNAPSHOT_TABLE}_v9",
+        f'''CREATE TABLE {SNAPSHOT_TABLE} (
+            SessionID INTEGER NOT NULL,
+            EventID INTEGER NOT NULL,
+            PlayerID INTEGER NOT NULL,
+            Points INTEGER NOT NULL,
+            {' '.join(f'{x} INTEGER NOT NULL,' for x in STATS_COLUMNS)}
+            PRIMARY KEY (SessionID, EventID, PlayerID)
+            ) WITHOUT ROWID''',
+        f'''INSERT INTO {SNAPSHOT_TABLE} (SessionID, EventID, PlayerID, Points, {', '.join(STATS_COLUMNS)})
+            SELECT s.SessionID, s.EventID, {player_id('s.Player')} AS PlayerID, SUM(s.Points), {', '.join(f'SUM(s.{x})' for x in STATS_COLUMNS)}
+            FROM {SNAPSHOT_TABLE}_v9 s WHERE PlayerID IS NOT NULL GROUP BY s.SessionID, s.EventID, PlayerID''',
+        f"DROP TABLE {SNAPSHOT_TABLE}_v9",
+        f"DROP TABLE {STATS_TABLE}",
+        f'''CREATE TABLE {STATS_TABLE} (
+            SessionID INTEGER NOT NULL,
+            PlayerID INTEGER NOT NULL,
+            {' '.join(f'{x} INTEGER NOT NULL DEFAULT 0,' for x in STATS_COLUMNS)}
+            PRIMARY KEY (SessionID, PlayerID)
+            )''',
+        stats_backfill(),
+        f"DELETE FROM {MATRIX_TABLE}",
+        matrix_backfill(),
+        f"DROP TABLE {SERIES_TABLE}",
+        f'''CREATE TABLE {SERIES_TABLE} (
+            SessionID INTEGER NOT NULL,
+            PlayerID INTEGER NOT NULL,
+            GameID INTEGER NOT NULL,
+            Balance INTEGER NOT NULL,
+            PRIMARY KEY (SessionID, PlayerID, GameID)
+            ) WITHOUT ROWID''',
+        series_backfill(),
+        f"DROP TABLE {PLAYER_ID_TABLE}",
+        f"DROP TABLE {ROSTER_TABLE}",
+        stats_trigger('INSERT', 'NEW', '+', BULK_SKIP),
+        stats_trigger('DELETE', 'OLD', '-'),
+        matrix_trigger('INSERT', 'NEW', '+', BULK_SKIP),
+        matrix_trigger('DELETE', 'OLD', '-'),
+        series_trigger('INSERT', 'NEW', BULK_SKIP, shift=True),
+        series_trigger('DELETE', 'OLD', shift=True),
+        f'''CREATE VIEW {HAND_VIEW} AS
+            SELECT g.ID, g.SessionID, {seat_names('g')[0]}, g.WinType, g.Points, g.Played,
+                   {', '.join(f'g.{seat}ID' for seat in PLAYER_SEATS)}
+            FROM {GAME_TABLE} g {seat_names('g')[1]}''',
+    ]),
+    # player_rollups holds each player's points and stats per session and UTC
+    # day, week (from Monday) and month of Played, each bucket keyed by its
+    # first day. Triggers keep it in step with game_log like player_stats, so
+    # a date range is a sum over a few buckets instead of a scan of the hands.
+    (11, [
+        f'''CREATE TABLE {ROLLUP_TABLE} (
+            Grain TEXT NOT NULL,
+            Bucket TEXT NOT NULL,
+            SessionID INTEGER NOT NULL,
+            PlayerID INTEGER NOT NULL,
+            {' '.join(f'{x} INTEGER NOT NULL DEFAULT 0,' for x in ROLLUP_COLUMNS)}
+            PRIMARY KEY (Grain, Bucket, SessionID, PlayerID)
+            ) WITHOUT ROWID''',
+        f"CREATE INDEX idx_{ROLLUP_TABLE}_session ON {ROLLUP_TABLE} (SessionID)",
+        rollup_backfill(),
+        rollup_trigger('INSERT', 'NEW', '', BULK_SKIP),
+        rollup_trigger('DELETE', 'OLD', '-'),
+    ]),
+    # cache_versions counts the writes to each key Storage.cached() results are
+    # kept against (e.g. 'game_log|3'), in the database so that every process
+    # sharing the file sees the others' writes.
+    (12, [
+        f'''CREATE TABLE {CACHE_TABLE} (
+            Key TEXT PRIMARY KEY,
+            Writes INTEGER NOT NULL
+            ) WITHOUT ROWID''',
+    ]),
+    # Awards come from player_stats and head_to_head, and the history filter
+    # matches a player in any seat, so nothing looks hands up by Loser1ID any
+    # more; these two only slowed every insert down.
+    (13, [
+        f"DROP INDEX IF EXISTS idx_{GAME_TABLE}_session_loser1",
+        f"DROP INDEX IF EXISTS idx_{GAME_TABLE}_session_winner_loser1",
+    ]),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn):
+    """Bring the database up to SCHEMA_VERSION and return the versions applied."""
+    applied = []
+    if get_schema_version(conn) >= SCHEMA_VERSION:
+        return applied
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        current = get_schema_version(conn)
+        for version, statements in MIGRATIONS:
+            if version <= current:
+                continue
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {version}")
+            applied.append(version)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return applied
@@ -0,0 +1,126 @@
+# Cumulative balance series.
+#
+# balance_series holds each player's running balance (scoring points) after
+# every hand they played, kept current by triggers on game_log. A balance at
+# hand ID x is one index seek per player, so the change between two hands or
+# two dates costs the same however long the session. Charts sample the series
+# at a fixed number of hand IDs instead of sending every hand.
+import json
+
+import numpy as np
+import pandas as pd
+
+from mahjong_calculator.events import session_entries
+from mahjong_calculator.profiles import get_session_profile
+from mahjong_calculator.schema import GAME_TABLE, PLAYER_TABLE, SERIES_TABLE, STATS_TABLE
+
+MAX_CHART_POINTS = 4000
+
+
+def balances_at(conn, session_id, game_ids):
+    """{(player, game_id): balance after the last hand up to game_id} for every player in the session."""
+    rows = conn.execute(
+        f'''SELECT p.Name, b.value, COALESCE((
+                SELECT x.Balance FROM {SERIES_TABLE} x WHERE x.SessionID = s.SessionID AND x.PlayerID = s.PlayerID
+                AND x.GameID <= b.value ORDER BY x.GameID DESC LIMIT 1), 0)
+            FROM {STATS_TABLE} s JOIN {PLAYER_TABLE} p ON p.ID = s.PlayerID, json_each(?) b WHERE s.SessionID = ?''',
+        (json.dumps([int(x) for x in game_ids]), session_id)
+    )
+    return {(player, game_id): balance for player, game_id, balance in rows}
+
+
+def multiplier_for(db, session_id, multiplier):
+    return get_session_profile(db, session_id)[2] if multiplier is None else multiplier
+
+
+def balance_change(db, session_id, first_id, last_id, multiplier=None):
+    """Each player's money won or lost over hands first_id..last_id (inclusive)."""
+    multiplier = multiplier_for(db, session_id, multiplier)
+    with db.read() as conn:
+        balances = balances_at(conn, session_id, [first_id - 1, last_id])
+    players = sorted(set(player for player, _ in balances))
+    return [{'Player': player,
+             'Amount': round((balances[(player, last_id)] - balances[(player, first_id - 1)])*multiplier, 2)}
+            for player in players]
+
+
+def hand_range(db, session_id, start, end):
+    """(first ID, last ID) of the hands played in [start, end), or None if there are none.
+
+    start and end are 'YYYY-MM-DD[ HH:MM:SS]' strings, compared with Played.
+    """
+    with db.read() as conn:
+        first = conn.execute(
+            f"SELECT ID FROM {GAME_TABLE} WHERE SessionID = ? AND Played >= ? ORDER BY Played, ID LIMIT 1",
+            (session_id, start)
+        ).fetchone()
+        last = conn.execute(
+            f"SELECT ID FROM {GAME_TABLE} WHERE SessionID = ? AND Played < ? ORDER BY Played DESC, ID DESC LIMIT 1",
+            (session_id, end)
+        ).fetchone()
+    if first is None or last is None or first[0] > last[0]:
+        return None
+    return first[0], last[0]
+
+
+def balance_change_between(db, session_id, start, end, multiplier=None):
+    bounds = hand_range(db, session_id, start, end)
+    if bounds is None:
+        return []
+    return balance_change(db, session_id, *bounds, multiplier)
+
+
+def load_balance_series(conn, session_id, max_points):
+    total = conn.execute(f"SELECT COALESCE(SUM(Hands), 0), COUNT(*) FROM {STATS_TABLE} WHERE SessionID = ?",
+                         (session_id,)).fetchone()
+    if total[0] <= max_points:
+        return pd.read_sql(
+            f'''SELECT p.Name AS Player, x.GameID AS Hand, x.Balance FROM {SERIES_TABLE} x JOIN {PLAYER_TABLE} p ON p.ID = x.PlayerID
+                WHERE x.SessionID = ? ORDER BY p.Name, x.GameID''',
+            conn, params=(session_id,)
+        )
+    first_id, last_id = conn.execute(f"SELECT MIN(ID), MAX(ID) FROM {GAME_TABLE} WHERE SessionID = ?",
+                                     (session_id,)).fetchone()
+    samples = np.unique(np.linspace(first_id, last_id, max(2, max_points // max(1, total[1]))).round().astype(np.int64))
+    balances = balances_at(conn, session_id, samples)
+    df = pd.DataFrame([(player, game_id, balance) for (player, game_id), balance in balances.items()],
+                      columns=['Player', 'Hand', 'Balance'])
+    return df.sort_values(['Player', 'Hand'], ignore_index=True)
+
+
+def get_balance_series(db, session_id, max_points=MAX_CHART_POINTS, multiplier=None):
+    """Player/Hand/Amount rows for a balance-over-hands chart, at most about max_points of them.
+
+    Hand is the hand ID. Short sessions return every hand; longer ones are
+    sampled at evenly spaced hand IDs, each sample being the balance then.
+    """
+    multiplier = multiplier_for(db, session_id, multiplier)
+    df = db.cached(('get_balance_series', max_points), (GAME_TABLE, session_id),
+                   lambda conn: load_balance_series(conn, session_id, max_points))
+    return df.assign(Amount=(df['Balance']*multiplier).round(2)).drop(columns='Balance')
+
+
+def add_series(conn, session_id, entries):
+    # One row per hand a player settles in, for hands of game_entries() newer than any stored; each player's
+    # balances follow on from their last stored one.
+    seated = entries[entries['Seated']].sort_values(['PlayerID', 'GameID'])
+    players = seated['PlayerID'].unique()
+    last = {int(player): conn.execute(
+        f"SELECT Balance FROM {SERIES_TABLE} WHERE SessionID = ? AND PlayerID = ? ORDER BY GameID DESC LIMIT 1",
+        (session_id, int(player))
+    ).fetchone() for player in players}
+    carried = seated['PlayerID'].map({player: row[0] if row else 0 for player, row in last.items()})
+    balances = seated.groupby('PlayerID')['Points'].cumsum() + carried
+    conn.executemany(
+        f"INSERT INTO {SERIES_TABLE} (SessionID, PlayerID, GameID, Balance) VALUES (?, ?, ?, ?)",
+        zip([session_id]*len(seated), seated['PlayerID'].tolist(), seated['GameID'].tolist(), balances.tolist())
+    )
+
+
+def reset_series(conn, session_id, entries=None):
+    # After a profile change every running balance is stale; they are summed again from the session's hands
+    # (session_entries(), read here unless passed in).
+    if entries is None:
+        entries = session_entries(conn, session_id)
+    conn.execute(f"DELETE FROM {SERIES_TABLE} WHERE SessionID = ?", (session_id,))
+    add_series(conn, session_id, entries)
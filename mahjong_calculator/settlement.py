@@ -0,0 +1,121 @@
+# Batch settlement of the whole game table.
+#
+# Every hand is turned into at most four (player, points) entries by indexing
+# a compiled payoff table with the hand's win type and points, and all the
+# entries are reduced per player in one pass. Nothing here imports Streamlit.
+import numpy as np
+import pandas as pd
+
+SELF_DRAW = '自摸'
+FULL_SELF_DRAW = '包自摸'
+OUT_RIGHT = '出銃'
+
+GAME_COLUMNS = ['Winner', 'Loser1', 'Loser2', 'Loser3', 'WinType', 'Points']
+
+DEFAULT_SCORING = pd.DataFrame({
+    "Points": [3,4,5,6,7,8,9,10],
+    "SelfDraw": [4,8,12,16,24,32,48,64],
+    "OutRight": [8,16,24,32,48,64,96,128]
+})
+
+
+WIN_TYPES = [SELF_DRAW, FULL_SELF_DRAW, OUT_RIGHT]
+
+# Which of (Winner, Loser1, Loser2, Loser3) take part in a hand of each win type.
+SEATS = np.array([[True, True, True, True],
+                  [True, True, False, False],
+                  [True, True, False, False]])
+
+
+class PayoffTable:
+    """A scoring table compiled into a dense lookup.
+
+    amounts[win_type, points] is the (Winner, Loser1, Loser2, Loser3) entry for
+    a hand, so settling any number of hands is a single fancy index. Points
+    need not be consecutive; rows for points outside the table are invalid.
+    """
+
+    def __init__(self, scoring):
+        points = np.asarray(scoring['Points'], dtype=np.int64)
+        self_draw = np.asarray(scoring['SelfDraw'], dtype=np.int64)
+        out_right = np.asarray(scoring['OutRight'], dtype=np.int64)
+        if len(points) == 0:
+            raise ValueError('Scoring table is empty')
+        if points.min() < 0:
+            raise ValueError('Scoring table points cannot be negative')
+        if len(np.unique(points)) != len(points):
+            raise ValueError('Scoring table points must be unique')
+        if self_draw.min() < 0 or out_right.min() < 0:
+            raise ValueError('Scoring table payoffs cannot be negative')
+
+        order = np.argsort(points)
+        self.scoring = pd.DataFrame({'Points': points[order],
+                                     'SelfDraw': self_draw[order],
+                                     'OutRight': out_right[order]})
+        self.points = [int(x) for x in points[order]]
+        self.valid = np.zeros(points.max() + 1, dtype=bool)
+        self.valid[points] = True
+        self.amounts = np.zeros((len(WIN_TYPES), points.max() + 1, 4), dtype=np.int64)
+        self.amounts[0, points] = np.stack([self_draw*3, -self_draw, -self_draw, -self_draw], axis=1)
+        self.amounts[1, points, :2] = np.stack([self_draw*3, -self_draw*3], axis=1)
+        self.amounts[2, points, :2] = np.stack([out_right, -out_right], axis=1)
+
+    def check_points(self, points):
+        if points.min() < 0 or points.max() >= len(self.valid) or not self.valid[points].all():
+            raise ValueError('Points outside the scoring table')
+
+
+def win_type_codes(win_types):
+    # Anything other than a self draw settles as an out-right win, as the form only offers the three types.
+    win_types = np.asarray(win_types, dtype=object)
+    return np.where(win_types == SELF_DRAW, 0, np.where(win_types == FULL_SELF_DRAW, 1, 2))
+
+
+def payoff_table(scoring):
+    """Accept either a compiled PayoffTable or a Points/SelfDraw/OutRight frame."""
+    if isinstance(scoring, PayoffTable):
+        return scoring
+    return PayoffTable(scoring)
+
+
+DEFAULT_PAYOFFS = PayoffTable(DEFAULT_SCORING)
+
+
+def hand_points(winner, loser1, loser2, loser3, win_type, points, scoring=DEFAULT_PAYOFFS):
+    """(player, points) entries for a single hand, before the multiplier."""
+    table = payoff_table(scoring)
+    table.check_points(np.array([points]))
+    code = int(win_type_codes([win_type])[0])
+    seats = zip((winner, loser1, loser2, loser3), table.amounts[code, points], SEATS[code])
+    return [(player, int(amount)) for player, amount, seated in seats if seated]
+
+
+def settle_points(games, scoring=DEFAULT_PAYOFFS):
+    """Per-player totals in scoring points (before the multiplier) and hands played."""
+    if len(games) == 0:
+        return pd.DataFrame({'Player': pd.Series(dtype=object),
+                             'Points': pd.Series(dtype=np.int64),
+                             'Hands': pd.Series(dtype=np.int64)})
+
+    table = payoff_table(scoring)
+    points = games['Points'].to_numpy(dtype=np.int64)
+    table.check_points(points)
+    codes = win_type_codes(games['WinType'].to_numpy(dtype=object))
+    seated = SEATS[codes]
+    players = games[['Winner', 'Loser1', 'Loser2', 'Loser3']].to_numpy(dtype=object)[seated]
+    amounts = table.amounts[codes, points][seated]
+
+    codes, names = pd.factorize(players, sort=True)
+    present = codes >= 0
+    totals = np.bincount(codes[present], weights=amounts[present], minlength=len(names))
+    hands = np.bincount(codes[present], minlength=len(names))
+    return pd.DataFrame({'Player': names,
+                         'Points': np.rint(totals).astype(np.int64),
+                         'Hands': hands.astype(np.int64)})
+
+
+def settle(games, multiplier, scoring=DEFAULT_PAYOFFS):
+    """Per-player money totals for the whole game table, rounded to cents."""
+    totals = settle_points(games, scoring)
+    return pd.DataFrame({'Player': totals['Player'],
+                         'Amount': (totals['Points']*multiplier).round(2)})
@@ -0,0 +1,188 @@
+# Monte Carlo sessions for comparing scoring profiles before switching to one.
+#
+# Win types and points are drawn from their frequencies in game_log; the
+# winner is any of the four seats with equal chance, and the loser of a 包自摸
+# or 出銃 any of the other three. Every candidate profile settles the same
+# drawn hands, so differences between them are not sampling noise. A batch of
+# sessions is a few (sessions, hands) arrays indexed with each profile's
+# payoffs, summed per seat; batches run across a process pool and come back as
+# histograms of whole points, from which the spread and tails are read exactly.
+import math
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from mahjong_calculator.profiles import load_scoring
+from mahjong_calculator.schema import GAME_TABLE, PROFILE_TABLE
+from mahjong_calculator.settlement import payoff_table, win_type_codes
+
+SESSIONS = 1_000_000
+BATCH_HANDS = 1_000_000
+TAIL = 0.05
+
+# The 12 seatings of a hand: winner, and the loser of a 包自摸 or 出銃 among the other three.
+WINNER = np.arange(12) // 3
+LOSER = (WINNER + np.arange(12) % 3 + 1) % 4
+
+
+def load_frequencies(conn, session_id=None):
+    where = '' if session_id is None else f'WHERE SessionID = {int(session_id)}'
+    return pd.read_sql(
+        f"SELECT WinType, Points, COUNT(*) AS Hands FROM {GAME_TABLE} {where} GROUP BY WinType, Points ORDER BY WinType, Points",
+        conn
+    )
+
+
+def load_session_length(conn, session_id=None):
+    # A night at the table: the median number of hands played in a session on one UTC day.
+    where = '' if session_id is None else f'AND SessionID = {int(session_id)}'
+    counts = [x[0] for x in conn.execute(
+        f"SELECT COUNT(*) FROM {GAME_TABLE} WHERE Played IS NOT NULL {where} GROUP BY SessionID, date(Played)"
+    )]
+    return int(np.median(counts)) if counts else None
+
+
+def get_frequencies(db, session_id=None):
+    """(WinType, Points, Hands) counts from game_log, and the median hands per session and day."""
+    with db.read() as conn:
+        return load_frequencies(conn, session_id), load_session_length(conn, session_id)
+
+
+def get_saved_profiles(db):
+    """{name: (scoring, multiplier)} for every saved profile."""
+    with db.read() as conn:
+        return {name: (load_scoring(conn, profile_id), multiplier) for profile_id, name, multiplier in conn.execute(
+            f"SELECT ID, Name, Multiplier FROM {PROFILE_TABLE} ORDER BY Name"
+        ).fetchall()}
+
+
+def category_payoffs(frequencies, scoring):
+    # Per (WinType, Points) row: what the winner takes, what each other seat pays on
+    # a self draw, and what the single loser pays otherwise.
+    table = payoff_table(scoring)
+    points = frequencies['Points'].to_numpy(dtype=np.int64)
+    table.check_points(points)
+    codes = win_type_codes(frequencies['WinType'].to_numpy(dtype=object))
+    amounts = table.amounts[codes, points]
+    self_draw = codes == 0
+    return np.stack([amounts[:, 0], np.where(self_draw, -amounts[:, 1], 0), np.where(self_draw, 0, -amounts[:, 1])])
+
+
+def merge_histograms(histograms):
+    values = np.concatenate([x[0] for x in histograms])
+    counts = np.concatenate([x[1] for x in histograms])
+    merged, inverse = np.unique(values, return_inverse=True)
+    return merged, np.bincount(inverse, weights=counts).astype(np.int64)
+
+
+def simulate_sessions(task):
+    """Histograms of (seat result, table's biggest loss) per profile for one task; runs in a worker."""
+    lookup, payoffs, hands, sessions, seed = task
+    rng = np.random.default_rng(seed)
+    batch = max(1, BATCH_HANDS // hands)
+    kinds = len(payoffs[0][0])
+    seats = [[] for _ in payoffs]
+    worst = [[] for _ in payoffs]
+    for start in range(0, sessions, batch):
+        size = min(batch, sessions - start)
+        # One integer per hand picks a recorded hand's kind and one of the 12 (winner, loser) seatings.
+        draw = rng.integers(0, len(lookup) * 12, size=(size, hands))
+        kind, pick = np.divmod(draw, 12)
+        category = lookup[kind]
+        table = np.arange(size)[:, None] * 4
+        # How often each seat won and lost each kind of hand; every profile is then a dot product.
+        won = np.bincount(((table + WINNER[pick]) * kinds + category).ravel(), minlength=size * 4 * kinds)
+        lost = np.bincount(((table + LOSER[pick]) * kinds + category).ravel(), minlength=size * 4 * kinds)
+        won, lost = won.reshape(size, 4, kinds), lost.reshape(size, 4, kinds)
+        for x, (win, each, one) in enumerate(payoffs):
+            # On a self draw the other three pay each; the winner's share of that is added back.
+            paid = won @ each
+            totals = won @ win + paid - paid.sum(axis=1, keepdims=True) - lost @ one
+            seats[x].append(np.unique(totals, return_counts=True))
+            worst[x].append(np.unique(totals.min(axis=1), return_counts=True))
+    return [(merge_histograms(x), merge_histograms(y)) for x, y in zip(seats, worst)]
+
+
+def quantile(values, counts, q):
+    return values[min(np.searchsorted(np.cumsum(counts), q * counts.sum()), len(values) - 1)]
+
+
+def tail_mean(values, counts, share):
+    # Mean of the lowest share of the results.
+    take = max(1, math.ceil(share * counts.sum()))
+    kept = np.minimum(counts, np.maximum(take - (np.cumsum(counts) - counts), 0))
+    return (values * kept).sum() / take
+
+
+def summarize(name, multiplier, seat_histogram, worst_histogram):
+    values, counts = seat_histogram
+    money = values * multiplier
+    total = counts.sum()
+    mean = (money * counts).sum() / total
+    worst_values, worst_counts = worst_histogram
+    return {
+        'Profile': name,
+        'Multiplier': multiplier,
+        'Mean': mean,
+        'StdDev': math.sqrt(((money - mean) ** 2 * counts).sum() / total),
+        'MeanSwing': (np.abs(money) * counts).sum() / total,
+        'P1': quantile(money, counts, 0.01),
+        'P5': quantile(money, counts, 0.05),
+        'Median': quantile(money, counts, 0.5),
+        'P95': quantile(money, counts, 0.95),
+        'P99': quantile(money, counts, 0.99),
+        'WorstTail': tail_mean(money, counts, TAIL),
+        'Worst': money[0],
+        'Best': money[-1],
+        'TableBiggestLoss': (worst_values * multiplier * worst_counts).sum() / worst_counts.sum(),
+    }
+
+
+def simulate(frequencies, profiles, hands, sessions=SESSIONS, workers=None, seed=0):
+    """Simulated per-player session results for each of {name: (scoring, multiplier)}, in money.
+
+    One row per profile: mean, standard deviation, mean absolute result,
+    percentiles, WorstTail (the mean of the worst TAIL of results), the single
+    worst and best results, and the mean biggest loss at a table of four.
+    frequencies is (WinType, Points, Hands) as from get_frequencies().
+    """
+    if len(frequencies) == 0 or frequencies['Hands'].sum() == 0:
+        raise ValueError('No hands recorded to simulate from')
+    if hands is None or hands < 1:
+        raise ValueError('Hands per session must be at least 1')
+    # Each kind of hand repeated in proportion to its count, so a uniform draw matches game_log exactly.
+    counts = frequencies['Hands'].to_numpy(dtype=np.int64)
+    lookup = np.repeat(np.arange(len(counts)), counts // np.gcd.reduce(counts))
+    payoffs = [category_payoffs(frequencies, scoring) for scoring, _ in profiles.values()]
+
+    workers = workers or os.cpu_count() or 1
+    tasks = min(workers, max(1, sessions * hands // BATCH_HANDS))
+    seeds = np.random.SeedSequence(seed).spawn(tasks)
+    work = [(lookup, payoffs, hands, sessions // tasks + (x < sessions % tasks), seeds[x]) for x in range(tasks)]
+    if tasks == 1:
+        results = [simulate_sessions(work[0])]
+    else:
+        # Spawned rather than forked: the app has threads running, and workers only need this module.
+        with ProcessPoolExecutor(max_workers=tasks, mp_context=multiprocessing.get_context('spawn')) as pool:
+            results = list(pool.map(simulate_sessions, work))
+
+    rows = []
+    for x, (name, (_, multiplier)) in enumerate(profiles.items()):
+        seat_histogram = merge_histograms([result[x][0] for result in results])
+        worst_histogram = merge_histograms([result[x][1] for result in results])
+        rows.append(summarize(name, multiplier, seat_histogram, worst_histogram))
+    return pd.DataFrame(rows)
+
+
+def get_simulation(db, profiles=None, session_id=None, sessions=SESSIONS, hands=None, workers=None, seed=0):
+    """simulate() with frequencies from game_log (one session, or every session).
+
+    profiles defaults to every saved profile; hands to the median hands per
+    session and day.
+    """
+    frequencies, length = get_frequencies(db, session_id)
+    return simulate(frequencies, get_saved_profiles(db) if profiles is None else profiles,
+                    length if hands is None else hands, sessions, workers, seed)
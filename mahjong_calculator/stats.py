@@ -0,0 +1,58 @@
+# Per-player statistics from the trigger-maintained player_stats table.
+#
+# player_stats is updated by triggers on every insert into and delete from
+# game_log, so reading it costs one row per player however long the session.
+import pandas as pd
+
+from mahjong_calculator.players import player_names
+from mahjong_calculator.schema import GAME_TABLE, PLAYER_TABLE, STATS_COLUMNS, STATS_TABLE, seat_stats
+
+
+def get_player_stats(db, session_id):
+    """One row per player with the raw counts and a few derived rates."""
+    query = f'''SELECT p.Name AS Player, {', '.join(f's.{x}' for x in STATS_COLUMNS)}
+                FROM {STATS_TABLE} s JOIN {PLAYER_TABLE} p ON p.ID = s.PlayerID WHERE s.SessionID = ? ORDER BY p.Name'''
+
+    def load(conn):
+        df = pd.read_sql(query, conn, params=(session_id,))
+        df['DealIns'] = df['FullSelfDrawLosses'] + df['OutRightLosses']
+        df['WinRate'] = (df['Wins']/df['Hands']).round(3)
+        df['AveragePoints'] = (df['WinPoints']/df['Wins'].where(df['Wins'] > 0)).round(2)
+        return df
+    return db.cached('get_player_stats', (GAME_TABLE, session_id), load)
+
+
+def add_stats(conn, session_id, entries):
+    # Add the counts of game_entries() to player_stats, as the insert trigger does one hand at a time.
+    totals = entries.groupby('PlayerID')[STATS_COLUMNS].sum()
+    conn.executemany(
+        f'''INSERT INTO {STATS_TABLE} (SessionID, PlayerID, {', '.join(STATS_COLUMNS)})
+            VALUES (?, ?, {', '.join('?' for _ in STATS_COLUMNS)})
+            ON CONFLICT(SessionID, PlayerID) DO UPDATE SET {', '.join(f'{x} = {x} + excluded.{x}' for x in STATS_COLUMNS)}''',
+        [(session_id, int(player), *map(int, values)) for player, values in zip(totals.index, totals.to_numpy())]
+    )
+
+
+def replay_stats(conn, session_id):
+    selects = ' UNION ALL '.join(
+        f'''SELECT g.{seat} AS PlayerID, {', '.join(f'{x} AS {column}' for x, column in zip(values, STATS_COLUMNS))}
+            FROM {GAME_TABLE} g WHERE g.SessionID = ? AND g.{seat} IS NOT NULL'''
+        for seat, values in seat_stats('g')
+    )
+    rows = conn.execute(
+        f"SELECT PlayerID, {', '.join(f'SUM({x})' for x in STATS_COLUMNS)} FROM ({selects}) GROUP BY PlayerID",
+        (session_id,)*4
+    )
+    return {row[0]: tuple(row[1:]) for row in rows}
+
+
+def verify_stats(db, session_id):
+    """Recount the session's hands and list every player whose stored stats differ."""
+    with db.read() as conn:
+        replayed = replay_stats(conn, session_id)
+        stored = {row[0]: tuple(row[1:]) for row in conn.execute(
+            f"SELECT PlayerID, {', '.join(STATS_COLUMNS)} FROM {STATS_TABLE} WHERE SessionID = ?", (session_id,)
+        )}
+        names = player_names(conn, set(replayed) | set(stored))
+    return sorted(names.get(player, str(player)) for player in set(replayed) | set(stored)
+                  if replayed.get(player) != stored.get(player))
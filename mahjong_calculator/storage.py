@@ -0,0 +1,173 @@
+# SQLite storage shared by every Streamlit session.
+#
+# The database runs in WAL mode so readers never wait on the writer. Reads
+# borrow a connection from a small pool; all writes go through one writer
+# thread, which drains whatever jobs are queued and commits them together.
+# Each job runs inside its own SAVEPOINT, so a failing job is rolled back
+# without taking the rest of the group with it.
+#
+# Writes name the data they touch (e.g. a session's hands), and the version of
+# each in cache_versions is bumped in the same transaction. cached() keeps query
+# results against those versions, so a result is reused until the next write to
+# it, whichever process made it.
+# Foreign keys are enforced, so hands can only name registered players.
+import queue
+import sqlite3
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+from mahjong_calculator import instrument
+from mahjong_calculator.schema import CACHE_TABLE, migrate
+
+MAX_GROUP_SIZE = 64
+MAX_CACHED = 128
+
+
+def open_connection(path):
+    factory = instrument.InstrumentedConnection if instrument.ENABLED else sqlite3.Connection
+    conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30, factory=factory)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA foreign_keys=ON")
+    return conn
+
+
+class Storage:
+    def __init__(self, path, readers=4, max_cached=MAX_CACHED):
+        self.path = path
+        self.cache = OrderedDict()
+        self.cache_lock = threading.Lock()
+        self.max_cached = max_cached
+        self.writer = open_connection(path)
+        migrate(self.writer)
+        self.readers = queue.LifoQueue()
+        for _ in range(readers):
+            self.readers.put(open_connection(path))
+        self.jobs = queue.Queue()
+        self.thread = threading.Thread(target=self.run_writer, name='mahjong-writer', daemon=True)
+        self.thread.start()
+
+    @contextmanager
+    def read(self):
+        conn = self.readers.get()
+        try:
+            yield conn
+        finally:
+            self.readers.put(conn)
+
+    @staticmethod
+    def cache_key(key):
+        return '|'.join(str(x) for x in key)
+
+    def version(self, key, conn=None):
+        if conn is None:
+            with self.read() as conn:
+                return self.version(key, conn)
+        row = conn.execute(f"SELECT Writes FROM {CACHE_TABLE} WHERE Key = ?", (self.cache_key(key),)).fetchone()
+        return 0 if row is None else row[0]
+
+    def cached(self, name, key, loader):
+        """Return loader(conn), reusing the last result until key is written to."""
+        with self.read() as conn:
+            # The version and the load come from one snapshot, so a result is never kept under a newer version.
+            conn.execute("BEGIN")
+            try:
+                token = self.version(key, conn)
+                with self.cache_lock:
+                    entry = self.cache.get((name, key))
+                    if entry is not None and entry[0] == token:
+                        self.cache.move_to_end((name, key))
+                        return entry[1]
+                value = loader(conn)
+            finally:
+                conn.execute("COMMIT")
+        with self.cache_lock:
+            self.cache[(name, key)] = (token, value)
+            self.cache.move_to_end((name, key))
+            while len(self.cache) > self.max_cached:
+                self.cache.popitem(last=False)
+        return value
+
+    def submit(self, job, touches=()):
+        """Queue job(conn) for the writer thread and return a Future for its result.
+
+        touches lists the version keys to bump along with the job.
+        """
+        future = Future()
+        if instrument.ENABLED and instrument.current() is not None:
+            job = self.recorded(job, instrument.current())
+        self.jobs.put(((job, tuple(touches)), future))
+        return future
+
+    @staticmethod
+    def recorded(job, recorder):
+        # Run on the writer thread, but count towards the rerun that queued it.
+        def run(conn):
+            with instrument.recording(recorder):
+                return job(conn)
+        return run
+
+    def write(self, job, touches=()):
+        return self.submit(job, touches).result()
+
+    def run_writer(self):
+        while True:
+            group = [self.jobs.get()]
+            while len(group) < MAX_GROUP_SIZE:
+                try:
+                    group.append(self.jobs.get_nowait())
+                except queue.Empty:
+                    break
+            stop = any(job is None for job, _ in group)
+            group = [(job, future) for job, future in group if job is not None]
+            if group:
+                self.commit_group(group)
+            if stop:
+                return
+
+    def commit_group(self, group):
+        conn = self.writer
+        done = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+        except Exception as e:
+            for _, future in group:
+                future.set_exception(e)
+            return
+        for (job, touches), future in group:
+            if not future.set_running_or_notify_cancel():
+                continue
+            conn.execute("SAVEPOINT job")
+            try:
+                result = job(conn)
+                for key in touches:
+                    conn.execute(
+                        f'''INSERT INTO {CACHE_TABLE} (Key, Writes) VALUES (?, 1)
+                            ON CONFLICT(Key) DO UPDATE SET Writes = Writes + 1''',
+                        (self.cache_key(key),)
+                    )
+            except Exception as e:
+                conn.execute("ROLLBACK TO job")
+                conn.execute("RELEASE job")
+                future.set_exception(e)
+                continue
+            conn.execute("RELEASE job")
+            done.append((future, result))
+        try:
+            conn.execute("COMMIT")
+        except Exception as e:
+            conn.rollback()
+            for future, _ in done:
+                future.set_exception(e)
+            return
+        for future, result in done:
+            future.set_result(result)
+
+    def close(self):
+        self.jobs.put((None, None))
+        self.thread.join()
+        self.writer.close()
+        while not self.readers.empty():
+            self.readers.get_nowait().close()
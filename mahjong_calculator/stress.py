@@ -0,0 +1,76 @@
+# Concurrent write stress test for Storage.
+#
+#   python -m mahjong_calculator.stress --writers 16 --hands 250
+#
+# Every writer thread submits hands into its own session against a fresh
+# temporary database while a reader thread keeps polling the log. The run
+# fails if any write errors or if a session ends up with the wrong count.
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+
+from mahjong_calculator.database import add_game, create_session
+from mahjong_calculator.schema import GAME_TABLE
+from mahjong_calculator.settlement import OUT_RIGHT
+from mahjong_calculator.storage import Storage
+
+
+def run(writers, hands, path):
+    db = Storage(path)
+    session_ids = [create_session(db, f'stress {x}') for x in range(writers)]
+    errors = []
+    stop_reading = threading.Event()
+
+    def writer(session_id):
+        rng = random.Random(session_id)
+        for _ in range(hands):
+            try:
+                add_game(db, session_id, 'A', 'B', None, None, OUT_RIGHT, rng.randint(3, 10))
+            except Exception as e:
+                errors.append(e)
+
+    def reader():
+        while not stop_reading.is_set():
+            with db.read() as conn:
+                conn.execute(f"SELECT COUNT(*) FROM {GAME_TABLE}").fetchone()
+
+    threads = [threading.Thread(target=writer, args=(session_id,)) for session_id in session_ids]
+    poller = threading.Thread(target=reader)
+    start = time.perf_counter()
+    poller.start()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    stop_reading.set()
+    poller.join()
+
+    with db.read() as conn:
+        counts = dict(conn.execute(f"SELECT SessionID, COUNT(*) FROM {GAME_TABLE} GROUP BY SessionID").fetchall())
+    db.close()
+    wrong = {session_id: counts.get(session_id, 0) for session_id in session_ids if counts.get(session_id, 0) != hands}
+    return elapsed, errors, wrong
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run concurrent writers against a temporary database.')
+    parser.add_argument('--writers', type=int, default=16)
+    parser.add_argument('--hands', type=int, default=250, help='hands submitted by each writer')
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as directory:
+        elapsed, errors, wrong = run(args.writers, args.hands, os.path.join(directory, 'stress.db'))
+
+    total = args.writers*args.hands
+    print(f'{args.writers} writers x {args.hands} hands: {total:,} writes in {elapsed:.2f}s ({total/elapsed:,.0f}/s)')
+    print(f'errors: {len(errors)} | sessions with wrong counts: {len(wrong)}')
+    if errors or wrong:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,277 @@
+# Streaming import and export of game_log.
+#
+# Rows are read one at a time, checked with the same rules as the Add Game
+# form, and written in chunks: each chunk is one writer transaction holding
+# the executemany insert, the ledger totals, stats, head-to-head, balance
+# series and rollups for those hands (all summed from the chunk in memory)
+# and the log version bump. Bad rows are skipped and reported with their row
+# number.
+# Played is optional on import; hands without it are stamped with the time
+# they are imported. It is stored in UTC: a time with an offset is converted,
+# one without is taken as UTC. Parquet needs pyarrow; CSV only uses the standard library.
+# A chunk given a batch key is written at most once: the key is recorded in the
+# same transaction, and a chunk whose key is already there is skipped.
+# Player names are normalized as they are read and stored as registry IDs;
+# names not registered yet are added to the registry as archived players.
+import csv
+import os
+from datetime import datetime, timezone
+
+import pandas as pd
+
+from mahjong_calculator.events import game_entries, record_events, snapshot_if_due
+from mahjong_calculator.ledger import add_totals, bump_log_version, seat_totals
+from mahjong_calculator.players import normalize_name, player_ids, with_ids
+from mahjong_calculator.profiles import get_session_payoffs, session_payoffs
+from mahjong_calculator.rivalry import add_head_to_head
+from mahjong_calculator.rollups import add_rollups
+from mahjong_calculator.schema import BATCH_TABLE, BULK_TABLE, GAME_TABLE, HAND_VIEW, PLAYER_SEATS, PLAYER_TABLE
+from mahjong_calculator.series import add_series
+from mahjong_calculator.settlement import GAME_COLUMNS, SELF_DRAW, WIN_TYPES, payoff_table
+from mahjong_calculator.stats import add_stats
+
+CHUNK_SIZE = 50_000
+HAND_COLUMNS = GAME_COLUMNS + ['Played']
+
+
+def file_format(source, format=None):
+    if format is not None:
+        return format
+    name = source if isinstance(source, (str, os.PathLike)) else getattr(source, 'name', '')
+    return 'parquet' if str(name).lower().endswith('.parquet') else 'csv'
+
+
+def read_rows(source, format=None):
+    """Yield one dict per row of a CSV or Parquet file (path or open file)."""
+    if file_format(source, format) == 'parquet':
+        import pyarrow.parquet as pq
+        parquet = pq.ParquetFile(source)
+        columns = [x for x in HAND_COLUMNS if x in parquet.schema_arrow.names]
+        for batch in parquet.iter_batches(columns=columns):
+            yield from batch.to_pylist()
+    elif isinstance(source, (str, os.PathLike)):
+        with open(source, newline='', encoding='utf-8-sig') as f:
+            yield from csv.DictReader(f)
+    else:
+        yield from csv.DictReader(source)
+
+
+def blank(value):
+    if value is None:
+        return True
+    if isinstance(value, str):
+        return value.strip() == ''
+    return value != value
+
+
+def validate_row(row, valid_points):
+    """Return (hand tuple, None) for a valid row or (None, error message)."""
+    values = []
+    for column in GAME_COLUMNS:
+        value = row.get(column)
+        if blank(value):
+            values.append(None)
+        elif column in PLAYER_SEATS:
+            values.append(normalize_name(value))
+        else:
+            values.append(value if column == 'Points' else str(value).strip())
+    winner, loser1, loser2, loser3, win_type, points = values
+    if winner is None:
+        return None, 'Winner cannot be empty'
+    if win_type is None:
+        return None, 'Win Type cannot be empty'
+    if win_type not in WIN_TYPES:
+        return None, f'Unknown Win Type {win_type}'
+    if points is None:
+        return None, 'Points cannot be empty'
+    try:
+        number = float(points)
+    except (TypeError, ValueError):
+        return None, f'Points must be a number, got {points}'
+    # int() would quietly cut 5.7 down to 5, so anything fractional is turned away.
+    if not number.is_integer():
+        return None, f'Points must be a whole number, got {points}'
+    points = int(number)
+    if points not in valid_points:
+        return None, f'Points must be one of {", ".join(str(x) for x in sorted(valid_points))}'
+    if loser1 is None:
+        return None, 'Loser cannot be nameless'
+    if win_type == SELF_DRAW:
+        players = [winner, loser1, loser2, loser3]
+        if None in players:
+            return None, '自摸 needs all three losers'
+        if len(set(players)) != 4:
+            return None, 'Players in a hand must be different'
+    else:
+        if winner == loser1:
+            return None, 'Winner cannot have same name as Loser'
+        if loser2 is not None or loser3 is not None:
+            return None, f'{win_type} only has one loser'
+        loser2 = loser3 = None
+    played = row.get('Played')
+    if blank(played):
+        played = None
+    else:
+        try:
+            stamp = datetime.fromisoformat(str(played).strip())
+        except ValueError:
+            return None, f'Played must be a date and time, got {played}'
+        # Played is kept in UTC; a time with an offset is converted, one without is taken as UTC already.
+        if stamp.tzinfo is not None:
+            stamp = stamp.astimezone(timezone.utc)
+        played = stamp.strftime('%Y-%m-%d %H:%M:%S')
+    return (winner, loser1, loser2, loser3, win_type, points, played), None
+
+
+def submit_chunk(db, session_id, hands, scoring=None, batch_key=None):
+    def job(conn):
+        if batch_key is not None and conn.execute(
+            f"SELECT 1 FROM {BATCH_TABLE} WHERE BatchKey = ?", (batch_key,)
+        ).fetchone():
+            return 0
+        ids = player_ids(conn, [x for hand in hands for x in hand[:4]])
+        # Hands without a time are stamped here rather than by SQLite, so the day each one is rolled up under is known.
+        now = conn.execute("SELECT CURRENT_TIMESTAMP").fetchone()[0]
+        rows = [row[:6] + (row[6] or now,) for row in (with_ids(hand, ids) for hand in hands)]
+        # The derived tables are updated from the chunk in memory, settled inside the transaction so a profile
+        # switch cannot slip in between; their per-row triggers stand aside meanwhile.
+        after_id = conn.execute(f"SELECT COALESCE(MAX(ID), 0) FROM {GAME_TABLE}").fetchone()[0]
+        conn.execute(f"INSERT INTO {BULK_TABLE} (SessionID) VALUES (?)", (session_id,))
+        conn.executemany(
+            f'''INSERT INTO {GAME_TABLE} (SessionID, WinnerID, Loser1ID, Loser2ID, Loser3ID, WinType, Points, Played)
+                VALUES ({session_id}, ?, ?, ?, ?, ?, ?, ?)''',
+            rows
+        )
+        chunk = f'g.SessionID = {session_id} AND g.ID > {after_id}'
+        frame = pd.DataFrame(rows, columns=HAND_COLUMNS)
+        frame['GameID'] = [x[0] for x in conn.execute(f"SELECT g.ID FROM {GAME_TABLE} g WHERE {chunk} ORDER BY g.ID")]
+        frame['Day'] = frame['Played'].str[:10]
+        entries = game_entries(frame, session_payoffs(conn, session_id) if scoring is None else scoring)
+        add_stats(conn, session_id, entries)
+        add_head_to_head(conn, session_id, entries)
+        add_series(conn, session_id, entries)
+        add_rollups(conn, session_id, entries)
+        conn.execute(f"DELETE FROM {BULK_TABLE} WHERE SessionID = ?", (session_id,))
+        if batch_key is not None:
+            conn.execute(
+                f'''INSERT INTO {BATCH_TABLE} (BatchKey, SessionID, Hands, FirstID, LastID)
+                    SELECT ?, ?, ?, MIN(ID), MAX(ID) FROM {GAME_TABLE} g WHERE {chunk}''',
+                (batch_key, session_id, len(hands))
+            )
+        add_totals(conn, session_id, seat_totals(entries))
+        record_events(conn, 'add', chunk)
+        snapshot_if_due(conn, session_id)
+        bump_log_version(conn, session_id)
+        return len(hands)
+    return db.submit(job, touches=[(GAME_TABLE, session_id), (PLAYER_TABLE,)])
+
+
+def chunk_written(future, first):
+    # (hands written, None) once a chunk's write job is done, or (0, (first row of the chunk, error)) if it failed.
+    try:
+        return future.result(), None
+    except Exception as e:
+        return 0, (first, f'Import stopped; this row and the rows after it were not written: {e}')
+
+
+def import_games(db, session_id, source, scoring=None, format=None, chunk_size=CHUNK_SIZE):
+    """Import hands into a session. Returns (rows imported, [(row number, error)])."""
+    return import_records(db, session_id, read_rows(source, format), scoring, chunk_size)
+
+
+def import_records(db, session_id, records, scoring=None, chunk_size=CHUNK_SIZE):
+    """Like import_games, for an iterable of row dicts already in memory.
+
+    Chunks commit one at a time. If writing one fails, the import stops there: the chunks before it stay
+    imported and are counted, and the error is reported against the first row that was not written, so the
+    rest of the file can be imported from that row.
+    """
+    session_id = int(session_id)
+    if scoring is not None:
+        scoring = payoff_table(scoring)
+    valid_points = set((get_session_payoffs(db, session_id) if scoring is None else scoring).points)
+    imported = 0
+    errors = []
+    hands = []
+    first = None
+    # One chunk is written while the next is parsed; wait before queueing another.
+    pending = None
+
+    def stopped(failure):
+        # Validation errors past the first row not written are reported again when the rest is imported.
+        return imported, [x for x in errors if x[0] < failure[0]] + [failure]
+
+    for row_number, row in enumerate(records, start=1):
+        hand, error = validate_row(row, valid_points)
+        if error is not None:
+            errors.append((row_number, error))
+            continue
+        if not hands:
+            first = row_number
+        hands.append(hand)
+        if len(hands) >= chunk_size:
+            if pending is not None:
+                count, failure = chunk_written(*pending)
+                imported += count
+                if failure is not None:
+                    return stopped(failure)
+            pending = submit_chunk(db, session_id, hands, scoring), first
+            hands = []
+    if pending is not None:
+        count, failure = chunk_written(*pending)
+        imported += count
+        if failure is not None:
+            return stopped(failure)
+    if hands:
+        count, failure = chunk_written(submit_chunk(db, session_id, hands, scoring), first)
+        imported += count
+        if failure is not None:
+            return stopped(failure)
+    return imported, errors
+
+
+def iter_games(db, session_id=None, chunk_size=CHUNK_SIZE):
+    query = f"SELECT ID, Winner, Loser1, Loser2, Loser3, WinType, Points, Played FROM {HAND_VIEW}"
+    params = ()
+    if session_id is not None:
+        query += " WHERE SessionID = ?"
+        params = (session_id,)
+    with db.read() as conn:
+        cursor = conn.execute(query + " ORDER BY ID", params)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                return
+            yield rows
+
+
+def export_games(db, destination, session_id=None, format=None, chunk_size=CHUNK_SIZE):
+    """Stream hands to a CSV or Parquet file (path or open file). Returns rows written."""
+    columns = ['ID'] + HAND_COLUMNS
+    written = 0
+    if file_format(destination, format) == 'parquet':
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        schema = pa.schema([('ID', pa.int64()), ('Winner', pa.string()), ('Loser1', pa.string()),
+                            ('Loser2', pa.string()), ('Loser3', pa.string()), ('WinType', pa.string()),
+                            ('Points', pa.int64()), ('Played', pa.string())])
+        with pq.ParquetWriter(destination, schema) as writer:
+            for rows in iter_games(db, session_id, chunk_size):
+                writer.write_table(pa.Table.from_pylist([dict(zip(columns, row)) for row in rows], schema=schema))
+                written += len(rows)
+        return written
+
+    def write_csv(f):
+        nonlocal written
+        out = csv.writer(f)
+        out.writerow(columns)
+        for rows in iter_games(db, session_id, chunk_size):
+            out.writerows(rows)
+            written += len(rows)
+
+    if isinstance(destination, (str, os.PathLike)):
+        with open(destination, 'w', newline='', encoding='utf-8') as f:
+            write_csv(f)
+    else:
+        write_csv(destination)
+    return written
@@ -0,0 +1,63 @@
+# Seeded synthetic game logs for benchmarks and load tests.
+#
+# Hands are played in sessions of a fixed table of four drawn from the player
+# pool. Each player has a hidden skill weight that skews who wins, and win
+# types and points follow the shape of a real log: mostly 出銃, about a third
+# 自摸, the odd 包自摸, and points falling off quickly above the minimum.
+import numpy as np
+import pandas as pd
+
+from mahjong_calculator.settlement import DEFAULT_SCORING, FULL_SELF_DRAW, OUT_RIGHT, SELF_DRAW
+
+WIN_TYPE_MIX = {OUT_RIGHT: 0.60, SELF_DRAW: 0.35, FULL_SELF_DRAW: 0.05}
+POINTS_DECAY = 0.72
+HANDS_PER_SESSION = 60
+
+
+def player_names(players):
+    return [f'P{x:03d}' for x in range(1, players + 1)]
+
+
+def points_weights(scoring=DEFAULT_SCORING, decay=POINTS_DECAY):
+    weights = decay ** np.arange(len(scoring['Points']))
+    return weights / weights.sum()
+
+
+def generate_games(hands, players=8, seed=0, scoring=DEFAULT_SCORING, win_type_mix=WIN_TYPE_MIX,
+                   hands_per_session=HANDS_PER_SESSION):
+    """A DataFrame of hands with the game_log columns (ID, Winner, ..., Points)."""
+    if players < 4:
+        raise ValueError('A game needs at least four players')
+    rng = np.random.default_rng(seed)
+    names = np.asarray(player_names(players), dtype=object)
+    skill = rng.lognormal(0.0, 0.25, size=players)
+
+    # Same four seats for every hand of a session.
+    sessions = -(-hands // hands_per_session)
+    tables = np.argsort(rng.random((sessions, players)), axis=1)[:, :4]
+    seats = np.repeat(tables, hands_per_session, axis=0)[:hands]
+
+    # Winner drawn by skill among the four; the others keep a random order.
+    seat_skill = skill[seats]
+    winner_at = (rng.random((hands, 1)) * seat_skill.sum(axis=1, keepdims=True) > np.cumsum(seat_skill, axis=1)).sum(axis=1)
+    sort_key = rng.random((hands, 4))
+    sort_key[np.arange(hands), winner_at] = -1.0
+    order = np.argsort(sort_key, axis=1)
+    seated = np.take_along_axis(seats, order, axis=1)
+    table = names[seated]
+
+    win_types = np.asarray(list(win_type_mix), dtype=object)
+    mix = np.asarray(list(win_type_mix.values()), dtype=float)
+    win_type = rng.choice(win_types, size=hands, p=mix / mix.sum())
+    is_self_draw = win_type == SELF_DRAW
+    points = rng.choice(np.asarray(scoring['Points'], dtype=np.int64), size=hands, p=points_weights(scoring))
+
+    return pd.DataFrame({
+        'ID': np.arange(1, hands + 1),
+        'Winner': table[:, 0],
+        'Loser1': table[:, 1],
+        'Loser2': np.where(is_self_draw, table[:, 2], None),
+        'Loser3': np.where(is_self_draw, table[:, 3], None),
+        'WinType': win_type,
+        'Points': points,
+    })
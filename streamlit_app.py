@@ -1,324 +1,274 @@
 import streamlit as st
 import pandas as pd
-import sqlite3
+import numpy as np
+import altair as alt
+import io
+import os
+import tempfile
+import uuid
+from datetime import datetime, timezone
 from streamlit_option_menu import option_menu
+from mahjong_calculator import instrument, load_awards, open_database
+from mahjong_calculator.background import Background
+from mahjong_calculator.database import (add_game, add_games, archive_session, clear_session, create_session, get_active_session,
+                                         correct_game, get_games, get_history_page, get_players, get_sessions,
+                                         remove_last_game, reset_players, save_profile, set_session_profile, void_game)
+from mahjong_calculator.events import get_events, get_state_at
+from mahjong_calculator.leaderboard import leaderboard_html
+from mahjong_calculator.payouts import get_payouts
+from mahjong_calculator.database import add_player as add_player_name
+from mahjong_calculator.database import archive_player as archive_player_name
+from mahjong_calculator.ledger import get_balances, get_log_version, rebuild_ledger, verify_ledger
+from mahjong_calculator.profiles import get_profile_scoring, get_profiles, get_session_payoffs, get_session_profile
+from mahjong_calculator.rivalry import arch_nemesis, get_head_to_head
+from mahjong_calculator.rollups import get_standings
+from mahjong_calculator.series import balance_change, balance_change_between, get_balance_series
+from mahjong_calculator.simulation import get_simulation
+from mahjong_calculator.stats import get_player_stats
+from mahjong_calculator.transfer import export_games, import_games
 
 
 # --- RESULT TILES ---
-def results_tile(name, amount):
-    if amount > 0:
-        color = "#10b981"  # Green
-    elif amount == 0:
-        color = "#808080"  #Grey
-    else:
-        color = "#ef4444"  # Red
-    formatted_amount = f"${abs(amount):,.2f}"
-    sign = "+" if amount > 0 else "-" if amount < 0 else ""
-
-    st.markdown(f"""
-        <div style="
-            background: linear-gradient(135deg, #f8fafc 0%, #f1f5f9 100%);
-            border-left: 4px solid {color};
-            border-radius: 8px;
-            padding: 20px;
-            margin: 10px 0;
-            box-shadow: 0 2px 4px rgba(0,0,0,0.1);
-            max-width: 180;
-        ">
-            <div style="
-                font-size: 14px;
-                color: #64748b;
-                font-weight: 500;
-                margin-bottom: 8px;
-            ">{name}</div>
-            <div style="
-                font-size: 32px;
-                color: {color};
-                font-weight: 700;
-            ">{sign}{formatted_amount}</div>
-        </div>
-    """, unsafe_allow_html=True)
+@instrument.profiled
+def results_grid(session_id, balances):
+    #One markdown call for every tile; tiles that moved since the last rerun of this session are flagged
+    shown = st.session_state.get('results_shown')
+    previous = shown[1] if shown is not None and shown[0] == session_id else None
+    st.markdown(leaderboard_html(balances, previous), unsafe_allow_html=True)
+    st.session_state['results_shown'] = (session_id, {x['Player']: x['Amount'] for x in balances})
 
 
 # --- DATABASE CONNECTION ---
 DB_NAME = 'mahjong_app.db'
-TABLE_NAME = 'game_log'
-TABLE_NAME_2 = 'player_name'
 
 @st.cache_resource
-def get_connection():
-    conn = sqlite3.connect(DB_NAME, check_same_thread=False)
-    conn.execute(f'''
-        CREATE TABLE IF NOT EXISTS {TABLE_NAME} (
-        ID INTEGER PRIMARY KEY AUTOINCREMENT,
-        Winner TEXT,
-        Loser1 TEXT,
-        Loser2 TEXT,
-        Loser3 TEXT,
-        WinType TEXT,
-        Points INTEGER
-        )
-    ''')
-    return conn
-
-conn = get_connection()
+def get_storage():
+    return open_database(DB_NAME)
+
+db = get_storage()
 
 @st.cache_resource
-def get_connection_2():
-    conn2 = sqlite3.connect(DB_NAME, check_same_thread=False)
-    conn2.execute(f'''
-        CREATE TABLE IF NOT EXISTS {TABLE_NAME_2} (
-        Name TEXT
-        )
-    ''')
-    return conn2
+def get_background():
+    return Background()
 
-conn2 = get_connection_2()
+background = get_background()
 
 # --- DATABASE INTERACTIONS ---
-def add_row(conn, winner, loser1, loser2, loser3, win_type, points):
+def add_row(db, session_id, winner, loser1, loser2, loser3, win_type, points):
     try:
-        cursor = conn.cursor()
-        cursor.execute(
-            f"INSERT INTO {TABLE_NAME} (Winner, Loser1, Loser2, Loser3, WinType, Points) VALUES (?, ?, ?, ?, ?, ?)", 
-            (winner, loser1, loser2, loser3, win_type, points)
-        )
-        conn.commit()
+        add_game(db, session_id, winner, loser1, loser2, loser3, win_type, points)
         st.success(f'Game added successfully. Congrats {winner}!')
     except Exception as e:
         st.error(f"Error adding row: {e}")
 
-def get_data(conn):
+# --- BATCH ENTRY ---
+# Hands entered in batch mode wait in this browser session until committed
+# together. The batch key stays the same until a commit succeeds, so
+# committing again after an error can never add the hands twice.
+def pending_batch(session_id):
+    batches = st.session_state.setdefault('pending_batches', {})
+    return batches.setdefault(session_id, {'key': uuid.uuid4().hex, 'hands': []})
+
+def queue_hand(session_id, winner, loser1, loser2, loser3, win_type, points):
+    hands = pending_batch(session_id)['hands']
+    hands.append({'Winner': winner, 'Loser1': loser1, 'Loser2': loser2, 'Loser3': loser3, 'WinType': win_type,
+                  'Points': points, 'Played': datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')})
+    st.success(f'Hand queued ({len(hands)} pending). Congrats {winner}!')
+
+def commit_batch(session_id):
+    batch = pending_batch(session_id)
+    try:
+        written = add_games(db, session_id, batch['hands'], batch['key'])
+        st.session_state['batch_message'] = ('success', f'{written} hands committed.' if written else 'This batch was already committed.')
+        st.session_state['pending_batches'][session_id] = {'key': uuid.uuid4().hex, 'hands': []}
+    except Exception as e:
+        st.session_state['batch_message'] = ('error', f"Error committing batch, the hands are still queued: {e}")
+
+def discard_batch(session_id):
+    st.session_state['pending_batches'][session_id] = {'key': uuid.uuid4().hex, 'hands': []}
+    st.session_state['batch_message'] = ('success', 'Pending hands discarded.')
+
+# --- HAND EDITS ---
+# Voids and corrections go into the event log next to the hands themselves, so
+# earlier balances can still be replayed. They run in the button callbacks.
+def void_hand(session_id):
+    game_id = int(st.session_state['edit_hand_id'])
     try:
-        query = f"SELECT * FROM {TABLE_NAME} ORDER BY ID"
-        df = pd.read_sql(query, conn)
-        return df
+        if void_game(db, session_id, game_id):
+            st.session_state['edit_message'] = ('success', f'Hand {game_id} voided.')
+        else:
+            st.session_state['edit_message'] = ('error', f'No hand {game_id} in this session.')
+    except Exception as e:
+        st.session_state['edit_message'] = ('error', f"Error voiding hand: {e}")
+
+def correct_hand(session_id):
+    game_id = int(st.session_state['edit_hand_id'])
+    winner = st.session_state['edit_winner']
+    win_type = st.session_state['edit_win_type']
+    if win_type == '自摸':
+        loser1, loser2, loser3 = ([x for x in st.session_state['selected_players'] if x != winner] + [None]*3)[:3]
+    else:
+        loser1, loser2, loser3 = st.session_state['edit_loser'], None, None
+    try:
+        if correct_game(db, session_id, game_id, winner, loser1, loser2, loser3, win_type, st.session_state['edit_points']):
+            st.session_state['edit_message'] = ('success', f'Hand {game_id} corrected.')
+        else:
+            st.session_state['edit_message'] = ('error', f'No hand {game_id} in this session.')
+    except Exception as e:
+        st.session_state['edit_message'] = ('error', f"Error correcting hand: {e}")
+
+def get_data(db, session_id):
+    try:
+        return get_games(db, session_id)
     except Exception as e:
         st.error(f"Error retrieving data: {e}")
         return pd.DataFrame()
-    
-def del_data(conn):
-    cursor = conn.cursor()
-    cursor.execute(f"DROP TABLE IF EXISTS {TABLE_NAME}")
-    conn.commit()
-    reset_data(conn)
-
-def reset_data(conn):
-    cursor = conn.cursor()
-    cursor.execute(f'''
-        CREATE TABLE IF NOT EXISTS {TABLE_NAME} (
-        ID INTEGER PRIMARY KEY AUTOINCREMENT,
-        Winner TEXT,
-        Loser1 TEXT,
-        Loser2 TEXT,
-        Loser3 TEXT,
-        WinType TEXT,
-        Points INTEGER
-        )
-    ''')
-    conn.commit()    
-
-def mahjong_remove_last_line():
+
+def mahjong_remove_last_line(session_id):
     try:
-        cursor = conn.cursor()
-        cursor.execute(
-            f"DELETE FROM {TABLE_NAME} WHERE ID = (SELECT MAX(ID) FROM {TABLE_NAME})"
-        )
-        conn.commit()
+        return remove_last_game(db, session_id)
     except Exception as e:
-        pass
+        return False
 
-def reset_player(conn2):
-    default_player_list = [('NEL',),('WAI',),('CAM',),('BOS',),('LIL',),('LIS',),('AMA',),('JEN',)]
+def reset_player(db):
     try:
-        cursor = conn2.cursor()
-        cursor.execute(
-            f"DELETE FROM {TABLE_NAME_2}"
-        )
-        conn2.commit()
-
-        cursor.executemany(
-            f"INSERT INTO {TABLE_NAME_2} (Name) VALUES (?)", 
-            (default_player_list)
-        )
-        conn2.commit()
+        reset_players(db)
     except Exception as e:
         st.error(f"Error adding row: {e}")
  
-def get_player(conn2):
+def get_player(db, archived=False):
     try:
-        query = f"SELECT DISTINCT Name FROM {TABLE_NAME_2} ORDER BY Name"
-        df = pd.read_sql(query, conn2)
-        return df
+        return get_players(db, archived)
     except Exception as e:
         st.error(f"Error retrieving data: {e}")
         return pd.DataFrame()
 
 def add_player(new_player_name):
     try:
-        new_player_name_cleansed = new_player_name.strip().upper()
-        new_player_name_tuple = [(new_player_name_cleansed,)]
-        cursor = conn2.cursor()
-        cursor.executemany(
-            f"INSERT INTO {TABLE_NAME_2} (Name) VALUES (?)", 
-            (new_player_name_tuple)
-        )
-        conn2.commit()
+        new_player_name_cleansed = add_player_name(db, new_player_name)
         st.success(f'Welcome to the den, {new_player_name_cleansed}.')
     except Exception as e:
         st.error(f"Error adding row: {e}")
 
+def archive_player(player_name):
+    try:
+        if archive_player_name(db, player_name):
+            st.success(f'{player_name.strip().upper()} has left the den. Their hands stay on record.')
+        else:
+            st.error(f'{player_name} is not on the roster.')
+    except Exception as e:
+        st.error(f"Error archiving player: {e}")
 
 
 
-def award_innocent_bystander(conn):
-    try:
-        query = f"""
-                    WITH Losers AS (SELECT Loser1 AS LoserName
-                        FROM {TABLE_NAME} 
-                        WHERE WinType = '自摸'
-                    UNION ALL
-                    SELECT Loser2
-                        FROM {TABLE_NAME} 
-                        WHERE WinType = '自摸'
-                    UNION ALL
-                    SELECT Loser3
-                        FROM {TABLE_NAME}
-                        WHERE WinType = '自摸')
-                    ,Losers2 AS (                    
-                    SELECT LoserName
-                          ,COUNT(LoserName) AS LossCount
-                        FROM Losers
-                        GROUP BY LoserName)
-                    SELECT *
-                        FROM Losers2
-                        WHERE LossCount = (SELECT MAX(LossCount) FROM Losers2)        
-                 """
-        df = pd.read_sql(query, conn)
-        max_self_draw_loss_count = df.iloc[0]['LossCount']
-        max_self_draw_loss_name = df['LoserName'].to_list()
-        return max_self_draw_loss_count, max_self_draw_loss_name
-    except Exception as e:
-        st.error(f"Error retrieving data: {e}")
-        return None, None 
 
-def award_arch_nemesis(conn):
-    try:
-        query = f"""
-                    WITH ARCHN1 AS (
-                    SELECT Winner
-                          ,Loser1
-                          ,CASE WHEN Winner < Loser1 THEN Winner || '-' || Loser1 ELSE Loser1 || '-' || Winner END AS alpha_pair
-                        FROM {TABLE_NAME} 
-                        WHERE WinType <> '自摸')
-                    ,ARCHN2 AS (                    
-                    SELECT alpha_pair
-                          ,COUNT(alpha_pair) AS LossCount
-                        FROM ARCHN1
-                        GROUP BY alpha_pair)
-                    SELECT *
-                        FROM ARCHN2
-                        WHERE LossCount = (SELECT MAX(LossCount) FROM ARCHN2)    
-                 """
-        df = pd.read_sql(query, conn)
-        max_arch_nemesis_count = df.iloc[0]['LossCount']
-        max_arch_nemesis_name = df['alpha_pair'].to_list()
-        return max_arch_nemesis_count, max_arch_nemesis_name     
-    except Exception as e:
-        st.error(f"Error retrieving data: {e}")
-        return None, None  
+# --- BACKGROUND RESULTS ---
+# Awards and stats are worked out on background threads, keyed by the session's
+# log version. Pages show the last result at once and rerun when the new one is in.
+REFRESH_POLL = 1
+FIRST_WAIT = 2
 
+def get_awards(session_id):
+    return background.refresh(('awards', session_id), get_log_version(db, session_id),
+                              lambda: load_awards(db, session_id), first_wait=FIRST_WAIT)
 
-def award_big(conn):
-    try:
-        query = f"""
-                    WITH BIG_PTS AS (
-                    SELECT Winner
-                          ,AVG(Points) AS Avg_Pts
-                        FROM {TABLE_NAME} 
-                        GROUP BY Winner)
-                    SELECT *
-                        FROM BIG_PTS
-                        WHERE Avg_Pts = (SELECT MAX(Avg_Pts) FROM BIG_PTS)    
-                 """
-        df = pd.read_sql(query, conn)
-        big_boy_count = df.iloc[0]['Avg_Pts']
-        big_boy_name = df['Winner'].to_list()
-        return big_boy_count, big_boy_name     
-    except Exception as e:
-        st.error(f"Error retrieving data: {e}")
-        return None, None  
 
-def award_charity(conn):
-    try:
-        query = f"""
-                    WITH CHARITY AS (
-                    SELECT Loser1
-                          ,COUNT(Loser1) AS Charity_Count
-                        FROM {TABLE_NAME} 
-                        WHERE WinType <> '自摸'
-                        GROUP BY Loser1
-                        )
-                    SELECT *
-                        FROM CHARITY
-                        WHERE Charity_Count = (SELECT MAX(Charity_Count) FROM CHARITY)    
-                 """
-        df = pd.read_sql(query, conn)
-        charity_count = df.iloc[0]['Charity_Count']
-        charity_name = df['Loser1'].to_list()
-        return charity_count, charity_name     
-    except Exception as e:
-        st.error(f"Error retrieving data: {e}")
-        return None, None  
+def get_stats(session_id):
+    return background.refresh(('stats', session_id), get_log_version(db, session_id),
+                              lambda: get_player_stats(db, session_id), first_wait=FIRST_WAIT)
 
 
-def award_selfdraw(conn):
-    try:
-        query = f"""
-                    WITH SELFDRAW AS (
-                    SELECT Winner
-                          ,COUNT(Winner) AS SD_Count
-                        FROM {TABLE_NAME} 
-                        WHERE WinType = '自摸'
-                        GROUP BY Winner
-                        )
-                    SELECT *
-                        FROM SELFDRAW
-                        WHERE SD_Count = (SELECT MAX(SD_Count) FROM SELFDRAW)    
-                 """
-        df = pd.read_sql(query, conn)
-        self_draw_count = df.iloc[0]['SD_Count']
-        self_draw_name = df['Winner'].to_list()
-        return self_draw_count, self_draw_name     
-    except Exception as e:
-        st.error(f"Error retrieving data: {e}")
-        return None, None 
+@st.fragment(run_every=REFRESH_POLL)
+def refresh_when_ready(key):
+    if not background.busy(key):
+        st.rerun()
 
 
+def updating_notice(key, fresh):
+    if not fresh:
+        st.caption(':material/sync: Updating...')
+        refresh_when_ready(key)
+
+
+
+# --- HAND HISTORY ---
+def history_newer(session_id, page_size, newest_id, filters):
+    newer, has_newer = get_history_page(db, session_id, page_size, after_id=newest_id, **filters)
+    st.session_state['history_before'] = int(newer['ID'].max()) + 1 if has_newer else None
 
-# --- PAGE FUNCTIONS ---
-def page_home():
-    st.title(":material/calculate: Mahjong Calculator")
 
+def history_older(oldest_id):
+    st.session_state['history_before'] = oldest_id
+
+
+@st.fragment
+@instrument.profiled
+def history_view(session_id):
+    col1, col2, col3, col4 = st.columns([1,1,1,1])
+    with col1:
+        player_filter = st.selectbox("Player", get_player(db, archived=True)['Name'].tolist(), index=None, placeholder='All players')
+    with col2:
+        win_type_filter = st.selectbox("Type", ['出銃','包自摸','自摸'], index=None, placeholder='All types')
+    with col3:
+        page_size = st.selectbox("Rows", [10,25,50,100], index=1)
+    with col4:
+        jump_to_hand = st.number_input("Jump to hand", min_value=0, value=0, step=1, help='0 shows the newest hands')
+
+    view = (session_id, player_filter, win_type_filter, page_size, jump_to_hand)
+    if st.session_state.get('history_view') != view:
+        st.session_state['history_view'] = view
+        st.session_state['history_before'] = jump_to_hand + 1 if jump_to_hand > 0 else None
+    filters = {'player': player_filter, 'win_type': win_type_filter}
+
+    page, has_older = get_history_page(db, session_id, page_size,
+                                       before_id=st.session_state['history_before'], **filters)
+    st.dataframe(page, hide_index=True)
+
+    #Paging happens in the callbacks, before the fragment reruns
+    colA, colB = st.columns([1,1])
+    with colA:
+        st.button(":material/chevron_left: Newer", disabled=st.session_state['history_before'] is None or len(page) == 0,
+                  on_click=history_newer, args=(session_id, page_size, int(page['ID'].max()) if len(page) else 0, filters))
+    with colB:
+        st.button("Older :material/chevron_right:", disabled=not has_older,
+                  on_click=history_older, args=(int(page['ID'].min()) if len(page) else 0,))
+
+
+# --- CALC FRAGMENTS ---
+# Each part of the Calc page reruns on its own: adding a hand reruns the hand
+# entry form and the results and history nested in it, not the whole app.
+@st.fragment
+@instrument.profiled
+def player_selection():
     st.write("Active Players")
     with st.form("active_player_form"):
         st.pills("Select 4 players",
-                       get_player(conn2),
+                       get_player(db),
                        key="selected_players",
                        selection_mode='multi',
                        default=None,
                        width='content'
                       )
         confirm_button = st.form_submit_button(label=':material/person_check: Confirm')
+        #The confirmed four are kept so the message survives the rerun below and later fragment reruns
         if len(st.session_state['selected_players']) == 4 and confirm_button:
+            st.session_state['confirmed_players'] = list(st.session_state['selected_players'])
+        if len(st.session_state['selected_players']) == 4 and st.session_state.get('confirmed_players') == list(st.session_state['selected_players']):
             var1, var2, var3, var4 = st.session_state['selected_players']    
             st.success(f'Active: {var1},{var2},{var3},{var4}')
         else:
             text_filler = 'Please select four players'
             st.error(f':red[{text_filler}]')
+    #Hand entry lives in another fragment, so it needs a full rerun to see the new players
+    if len(st.session_state['selected_players']) == 4 and confirm_button:
+        st.rerun()
 
-    st.divider()
+
+@st.fragment
+@instrument.profiled
+def hand_entry(session_id):
     st.write("Add Game Results")
+    batch_mode = st.toggle("Batch entry", key='batch_mode', help='Queue hands and commit them together')
     with st.form("game_result_form", clear_on_submit=True):
         col1, col2, col3, col4 = st.columns([1,1,1,1])
 
@@ -353,7 +303,7 @@ def page_home():
 
         with col4:
             points = st.pills("Points",
-                        [3,4,5,6,7,8,9,10],
+                        get_session_payoffs(db, session_id).points,
                         selection_mode='single',
                         default=None,
                         width='stretch'
@@ -380,66 +330,246 @@ def page_home():
             elif loser == None and win_type != '自摸':
                 text_filler = 'Loser cannot be nameless'
                 st.error(f':red[{text_filler}]')
-            elif win_type == '自摸':
-                loser1 = [x for x in st.session_state['selected_players'] if x != winner][0]
-                loser2 = [x for x in st.session_state['selected_players'] if x != winner][1]
-                loser3 = [x for x in st.session_state['selected_players'] if x != winner][2]
-                add_row(conn, winner, loser1, loser2, loser3, win_type, points)
             else:
-                loser1 = loser
-                loser2 = None
-                loser3 = None        
-                add_row(conn, winner, loser1, loser2, loser3, win_type, points)
+                if win_type == '自摸':
+                    loser1 = [x for x in st.session_state['selected_players'] if x != winner][0]
+                    loser2 = [x for x in st.session_state['selected_players'] if x != winner][1]
+                    loser3 = [x for x in st.session_state['selected_players'] if x != winner][2]
+                else:
+                    loser1 = loser
+                    loser2 = None
+                    loser3 = None
+                if batch_mode:
+                    queue_hand(session_id, winner, loser1, loser2, loser3, win_type, points)
+                else:
+                    add_row(db, session_id, winner, loser1, loser2, loser3, win_type, points)
 
         if DEL_last_game_button:
-            if len(get_data(conn)) > 0:
-                mahjong_remove_last_line()
+            if batch_mode and pending_batch(session_id)['hands']:
+                pending_batch(session_id)['hands'].pop()
+                st.success('Removed the last pending hand.')
+            elif mahjong_remove_last_line(session_id):
                 st.success('Deleted successfully.')
             else:
                 st.success('No lines to delete.')
 
-    #Calculation of winnings/losings
+    #Pending hands are committed in the button callbacks, before this fragment reruns
+    if 'batch_message' in st.session_state:
+        kind, message = st.session_state.pop('batch_message')
+        if kind == 'success':
+            st.success(message)
+        else:
+            st.error(message)
+    pending = pending_batch(session_id)['hands']
+    if len(pending) > 0:
+        st.write(f"Pending Hands ({len(pending)})")
+        st.dataframe(pd.DataFrame(pending), hide_index=True)
+        colA, colB = st.columns([3,1])
+        with colB:
+            st.button(":material/cloud_upload: Commit Batch", on_click=commit_batch, args=(session_id,))
+        with colA:
+            st.button(":material/delete: Discard Batch", on_click=discard_batch, args=(session_id,))
+
     st.divider()
+    results_view(session_id)
+
+
+@st.fragment
+@instrument.profiled
+def results_view(session_id):
+    #Calculation of winnings/losings
     st.write("Overall Results")
-    mahjong_calculator()
-    total_amount_df = pd.DataFrame(st.session_state['calculator_master'])
-    if len(st.session_state['calculator_master']) > 0:
-        overall_results = total_amount_df.groupby('Player')['Amount'].sum().round(2).reset_index()
-        overall_results_dict = overall_results.to_dict('records') 
-        for x in range(0, len(overall_results_dict)):
-            name = overall_results_dict[x]['Player']
-            amount = overall_results_dict[x]['Amount']
-            results_tile(name, amount)
+    overall_results_dict = get_balances(db, session_id)
+    if len(overall_results_dict) > 0:
+        results_grid(session_id, overall_results_dict)
+        payouts_view(session_id)
 
         st.divider()
         st.write("Game by Game Results")
-        st.write(get_data(conn))
+        history_view(session_id)
+
+        st.divider()
+        edit_hand_form(session_id)
         
     else:
         st.success('No games recorded')
 
 
-        
+@instrument.profiled
+def payouts_view(session_id):
+    with st.expander(":material/payments: Settle Up"):
+        try:
+            payouts = get_payouts(db, session_id)
+        except Exception as e:
+            st.error(f"Error working out payouts: {e}")
+            return
+        if len(payouts) == 0:
+            st.success('Everyone is square.')
+            return
+        for payout in payouts:
+            st.write(f"{payout['From']} pays {payout['To']} ${payout['Amount']:,.2f}")
+        st.caption(f'{len(payouts)} transfer(s). Amounts are rounded so they add up to the cent; a balance can be a cent off its tile.')
+
+
+@instrument.profiled
+def edit_hand_form(session_id):
+    st.write("Edit a Hand")
+    with st.form("edit_hand_form"):
+        players_list = st.session_state['selected_players'] if len(st.session_state['selected_players']) == 4 else []
+        col1, col2, col3, col4, col5 = st.columns([1,1,1,1,1])
+        with col1:
+            st.number_input("Hand ID", min_value=1, step=1, key='edit_hand_id')
+        with col2:
+            st.selectbox("Winner", players_list, index=None, key='edit_winner')
+        with col3:
+            st.selectbox("Loser (blank if 自摸)", players_list, index=None, key='edit_loser')
+        with col4:
+            st.selectbox("Type", ['出銃','包自摸','自摸'], index=None, key='edit_win_type')
+        with col5:
+            st.selectbox("Points", get_session_payoffs(db, session_id).points, index=None, key='edit_points')
+        colA, colB = st.columns([3,1])
+        with colB:
+            st.form_submit_button(":material/edit: Correct Hand", on_click=correct_hand, args=(session_id,))
+        with colA:
+            st.form_submit_button(":material/block: Void Hand", on_click=void_hand, args=(session_id,))
+    if 'edit_message' in st.session_state:
+        kind, message = st.session_state.pop('edit_message')
+        if kind == 'success':
+            st.success(message)
+        else:
+            st.error(message)
+
+
+# --- LEAGUE STANDINGS ---
+STANDINGS_PERIODS = ['This week', 'This month', 'This year', 'Custom']
+
+def standings_range(period):
+    today = datetime.now(timezone.utc).date()
+    if period == 'This week':
+        return today - pd.Timedelta(days=today.weekday()), today
+    if period == 'This month':
+        return today.replace(day=1), today
+    if period == 'This year':
+        return today.replace(month=1, day=1), today
+    dates = st.date_input("Dates (UTC)", value=(today.replace(day=1), today), key='standings_dates')
+    return (dates[0], dates[-1]) if len(dates) > 0 else (today, today)
+
+
+@instrument.profiled
+def league_standings(session_id):
+    st.subheader(':material/leaderboard: League Standings')
+    col1, col2 = st.columns([3,1])
+    with col1:
+        period = st.radio("Period", STANDINGS_PERIODS, horizontal=True, key='standings_period')
+    with col2:
+        every_session = st.checkbox("All sessions", value=True, key='standings_all')
+    start, end = standings_range(period)
+    try:
+        board, awards = get_standings(db, start, end, None if every_session else session_id)
+    except Exception as e:
+        st.error(f"Error computing standings: {e}")
+        return
+    if len(board) == 0:
+        st.success(f'No hands between {start} and {end}')
+        return
+    board['DealIns'] = board['FullSelfDrawLosses'] + board['OutRightLosses']
+    board['AveragePoints'] = (board['WinPoints']/board['Wins'].where(board['Wins'] > 0)).round(2)
+    st.dataframe(board[['Player', 'Amount', 'Hands', 'Wins', 'SelfDrawWins', 'DealIns', 'AveragePoints']], hide_index=True)
+    leaders = [('Innocent Bystander', 'innocent_bystander'), ('Go Big or Go Home', 'big'),
+               ('Charity Champion', 'charity'), ('Self Draw King/Queen', 'selfdraw')]
+    for title, award in leaders:
+        value, names = awards[award]
+        if names:
+            st.write(f'{title}: {value:,.2f} | Players: {", ".join(names)}')
+    st.caption(f'{start} to {end} (UTC), {"every session" if every_session else "this session"}.')
+
+
+# --- SCORING SIMULATION ---
+SIMULATED_SESSIONS = 200_000
+
+@instrument.profiled
+def simulation_view(candidates):
+    #Same simulated hands for the table's profile and the edited one, drawn from every session's log
+    try:
+        with st.spinner("Simulating sessions..."):
+            result = get_simulation(db, candidates, sessions=SIMULATED_SESSIONS)
+    except Exception as e:
+        st.error(f"Error simulating: {e}")
+        return
+    st.dataframe(result.round(2), hide_index=True)
+    st.caption(f'Per player per session, in dollars, over {SIMULATED_SESSIONS:,} simulated sessions. '
+               'WorstTail is the average of the worst 5% of results; TableBiggestLoss the average biggest loser at a table.')
+
+
+# --- PAGE FUNCTIONS ---
+@instrument.profiled
+def page_home():
+    st.title(":material/calculate: Mahjong Calculator")
+
+    st.write("Table")
+    with st.form("session_form"):
+        open_sessions = get_sessions(db)
+        session_labels = {x[0]: f'{x[1]} (#{x[0]}, {x[2][:10]})' for x in open_sessions}
+        session_ids = list(session_labels)
+        col1, col2 = st.columns([1,1])
+        with col1:
+            chosen_session = st.selectbox("Active table",
+                                          session_ids,
+                                          index=session_ids.index(st.session_state['session_id']) if st.session_state['session_id'] in session_ids else 0,
+                                          format_func=lambda x: session_labels[x]
+                                          )
+        with col2:
+            new_session_name = st.text_input("New table name", placeholder="New table name")
+
+        colA, colB, colC = st.columns([1,1,1])
+        with colA:
+            SWITCH_session_button = st.form_submit_button(":material/table_restaurant: Switch")
+        with colB:
+            NEW_session_button = st.form_submit_button(":material/add_circle: New Table")
+        with colC:
+            ARCHIVE_session_button = st.form_submit_button(":material/archive: Archive")
+
+        if SWITCH_session_button and chosen_session is not None:
+            st.session_state['session_id'] = chosen_session
+            st.success(f'Switched to {session_labels[chosen_session]}.')
+        if NEW_session_button:
+            profile_id = get_session_profile(db, st.session_state['session_id'])[0]
+            st.session_state['session_id'] = create_session(db, new_session_name, profile_id)
+            st.success('New table started.')
+        if ARCHIVE_session_button:
+            archive_session(db, st.session_state['session_id'])
+            st.session_state['session_id'] = get_active_session(db)
+            st.success('Table archived.')
+
+    session_id = st.session_state['session_id']
+
+    st.divider()
+    player_selection()
+
+    st.divider()
+    hand_entry(session_id)
+
     #Reset database
     st.divider()
     with st.form("reset_form"):
         RESET_game_button = st.form_submit_button(":material/reset_settings: DOUBLE CLICK TO RESET")
         try:
             if RESET_game_button:
-                del_data(conn)
+                clear_session(db, session_id)
                 st.success('Game results have been reset.')
         except:
             pass
 
         
 
+@instrument.profiled
 def page_player_settings():
     st.title(":material/person: Players")
 
     st.write("Add/Remove Players")
     player_name_label = "Insert Player Name"
     with st.form("add_player_form"):
-        col1, col2, col3 = st.columns([7,1,1])
+        col1, col2, col3, col4 = st.columns([6,1,1,1])
                
         with col1:
             new_player_name = st.text_input(player_name_label,
@@ -450,164 +580,359 @@ def page_player_settings():
             ADD_button_player_name = st.form_submit_button(":material/person_add: Add")
 
         with col3:
+            ARCHIVE_button_player_name = st.form_submit_button(":material/person_remove: Archive")
+
+        with col4:
             RESET_button_player_name = st.form_submit_button(":material/reset_settings: Reset")
         
         if ADD_button_player_name:
             add_player(new_player_name)
 
+        if ARCHIVE_button_player_name:
+            archive_player(new_player_name)
+
         if RESET_button_player_name:
-            reset_player(conn2)
+            reset_player(db)
             st.success(f'Reset to default players.')
 
-    st.session_state['player_df'] = get_player(conn2)
+    st.session_state['player_df'] = get_player(db)
     st.dataframe(st.session_state['player_df'])    
 
+@instrument.profiled
 def page_point_scoring():
     st.title(":material/settings: Settings")
     
-    with st.form("multiplier_form"):
-        multiplier = st.selectbox(
-                            "Multiplier",
-                            [0.10,0.15,0.20],
-                            index=None,
-                            placeholder='Multiplier'
-        )
-
-        confirm_button_points = st.form_submit_button("OK")
-        if confirm_button_points:
-            st.session_state['multipler'] = multiplier
-            st.success(f"Multipler set to ${abs(st.session_state['multipler']):,.2f}")
-    st.write(f"Multiplier is currently set to ${abs(st.session_state['multipler']):,.2f}")
-
-
-    default_scoring = {
-        "Points": [3,4,5,6,7,8,9,10],
-        "SelfDraw": [4,8,12,16,24,32,48,64],
-        "OutRight": [8,16,24,32,48,64,96,128]
-    }
-
-    default_scoring_df = pd.DataFrame(default_scoring)
-    st.write(default_scoring_df)
-
-def mahjong_calculator():
-    st.session_state['calculator_master'] = []
-    st.session_state['game_master'] = get_data(conn).to_dict(orient='records')
-    for x in range(len(st.session_state['game_master'])):
-        winner_x = st.session_state['game_master'][x]['Winner']
-        loser1_x = st.session_state['game_master'][x]['Loser1']
-        loser2_x = st.session_state['game_master'][x]['Loser2']
-        loser3_x = st.session_state['game_master'][x]['Loser3']
-        win_type_x = st.session_state['game_master'][x]['WinType']
-        points_x = st.session_state['game_master'][x]['Points']
-
-        if win_type_x == '自摸':
-            winner_x_entry = {'Player': winner_x, 'Amount': default_scoring_df.iloc[points_x-3]['SelfDraw']*st.session_state['multipler']*3.00}
-            loser1_x_entry = {'Player': loser1_x, 'Amount': default_scoring_df.iloc[points_x-3]['SelfDraw']*st.session_state['multipler']*-1.00}
-            loser2_x_entry = {'Player': loser2_x, 'Amount': default_scoring_df.iloc[points_x-3]['SelfDraw']*st.session_state['multipler']*-1.00}
-            loser3_x_entry = {'Player': loser3_x, 'Amount': default_scoring_df.iloc[points_x-3]['SelfDraw']*st.session_state['multipler']*-1.00}
-            st.session_state['calculator_master'].append(winner_x_entry)
-            st.session_state['calculator_master'].append(loser1_x_entry)
-            st.session_state['calculator_master'].append(loser2_x_entry)
-            st.session_state['calculator_master'].append(loser3_x_entry)
-        elif win_type_x == '包自摸':
-            winner_x_entry = {'Player': winner_x, 'Amount': default_scoring_df.iloc[points_x-3]['SelfDraw']*st.session_state['multipler']*3.00}
-            loser1_x_entry = {'Player': loser1_x, 'Amount': default_scoring_df.iloc[points_x-3]['SelfDraw']*st.session_state['multipler']*-3.00}
-            st.session_state['calculator_master'].append(winner_x_entry)
-            st.session_state['calculator_master'].append(loser1_x_entry)
-        else:
-            winner_x_entry = {'Player': winner_x, 'Amount': default_scoring_df.iloc[points_x-3]['OutRight']*st.session_state['multipler']*1.00}
-            loser1_x_entry = {'Player': loser1_x, 'Amount': default_scoring_df.iloc[points_x-3]['OutRight']*st.session_state['multipler']*-1.00}
-            st.session_state['calculator_master'].append(winner_x_entry)
-            st.session_state['calculator_master'].append(loser1_x_entry)
+    session_id = st.session_state['session_id']
+    st.write("Scoring Profile")
+    profiles = {x[0]: x for x in get_profiles(db)}
+    profile_ids = list(profiles)
+    active_profile = get_session_profile(db, session_id)
+    st.write(f"This table uses {active_profile[1]} at ${active_profile[2]:,.2f} per point.")
+    profile_id = st.selectbox("Profile",
+                              profile_ids,
+                              index=profile_ids.index(active_profile[0]),
+                              format_func=lambda x: profiles[x][1]
+                              )
+
+    with st.form("profile_form"):
+        col1, col2 = st.columns([2,1])
+        with col1:
+            profile_name = st.text_input("Name", value=profiles[profile_id][1])
+        with col2:
+            multiplier = st.number_input("Multiplier",
+                                         min_value=0.01,
+                                         value=float(profiles[profile_id][2]),
+                                         step=0.05,
+                                         format="%.2f"
+                                         )
+        scoring_df = st.data_editor(get_profile_scoring(db, profile_id),
+                                    num_rows='dynamic',
+                                    hide_index=True,
+                                    key=f'scoring_editor_{profile_id}'
+                                    )
+
+        colA, colB, colC, colD = st.columns([1,1,1,1])
+        with colA:
+            USE_profile_button = st.form_submit_button(":material/check_circle: Use for this table")
+        with colB:
+            SAVE_profile_button = st.form_submit_button(":material/save: Save")
+        with colC:
+            NEW_profile_button = st.form_submit_button(":material/add_circle: Save as New")
+        with colD:
+            SIMULATE_profile_button = st.form_submit_button(":material/casino: Simulate")
+
+        try:
+            if USE_profile_button:
+                set_session_profile(db, session_id, profile_id)
+                st.success(f'This table now uses {profiles[profile_id][1]}. Balances recomputed.')
+            if SAVE_profile_button:
+                save_profile(db, profile_name, scoring_df.dropna(), multiplier, profile_id)
+                st.success(f'Profile {profile_name} saved.')
+            if NEW_profile_button:
+                save_profile(db, profile_name, scoring_df.dropna(), multiplier)
+                st.success(f'Profile {profile_name} created.')
+        except Exception as e:
+            st.error(f"Error saving profile: {e}")
+
+        if SIMULATE_profile_button:
+            simulation_view({active_profile[1]: (get_profile_scoring(db, active_profile[0]), active_profile[2]),
+                             f'{profile_name} (as edited)': (scoring_df.dropna(), multiplier)})
+
+    st.divider()
+    st.write("Balance Ledger")
+    with st.form("ledger_form"):
+        colA, colB = st.columns([1,1])
+        with colA:
+            VERIFY_ledger_button = st.form_submit_button(":material/fact_check: Verify")
+        with colB:
+            REBUILD_ledger_button = st.form_submit_button(":material/build: Rebuild")
+
+        if VERIFY_ledger_button:
+            drift = verify_ledger(db, st.session_state['session_id'])
+            if len(drift) > 0:
+                st.error(f'Ledger has drifted for {len(drift)} player(s).')
+                st.write(pd.DataFrame(drift))
+            else:
+                st.success('Ledger matches the game log.')
 
+        if REBUILD_ledger_button:
+            rebuild_ledger(db, st.session_state['session_id'])
+            st.success('Ledger rebuilt from the game log.')
+
+    st.divider()
+    st.write("Import / Export")
+    with st.form("import_form", clear_on_submit=True):
+        uploaded_file = st.file_uploader("Hand results (CSV or Parquet)", type=['csv', 'parquet'])
+        IMPORT_button = st.form_submit_button(":material/upload: Import")
+
+        if IMPORT_button and uploaded_file is not None:
+            source = uploaded_file
+            if not uploaded_file.name.lower().endswith('.parquet'):
+                source = io.TextIOWrapper(uploaded_file, encoding='utf-8-sig', newline='')
+            try:
+                imported, errors = import_games(db, st.session_state['session_id'], source)
+                st.success(f'Imported {imported:,} games.')
+                if len(errors) > 0 and errors[-1][1].startswith('Import stopped'):
+                    st.error(f'Import stopped at row {errors[-1][0]:,}; import the rest of the file from that row.')
+                if len(errors) > 0:
+                    st.error(f'{len(errors):,} rows skipped.')
+                    st.dataframe(pd.DataFrame(errors[:1000], columns=['Row', 'Error']), hide_index=True)
+            except Exception as e:
+                st.error(f"Error importing file: {e}")
+
+    def export_csv():
+        # download_button takes no generator; whatever this returns is read into one bytes object. Streaming
+        # the chunks to a temporary file keeps that the only full copy, where a StringIO held the text as well.
+        fd, path = tempfile.mkstemp(suffix='.csv')
+        os.close(fd)
+        try:
+            export_games(db, path, session_id=session_id, format='csv')
+            with open(path, 'rb') as f:
+                return f.read()
+        finally:
+            os.remove(path)
+
+    st.download_button(":material/download: Export CSV",
+                       data=export_csv,
+                       file_name='game_log.csv',
+                       mime='text/csv',
+                       on_click='ignore'
+                       )
+
+@instrument.profiled
 def page_awards():
     st.title(":material/crown: Awards")
     st.divider()
+    session_id = st.session_state['session_id']
+    try:
+        awards, fresh = get_awards(session_id)
+    except Exception as e:
+        st.error(f"Error computing awards: {e}")
+        return
+    updating_notice(('awards', session_id), fresh)
+    if awards is None:
+        return
 
     #Innocent Bystander
     st.subheader(':material/assist_walker: Innocent Bystander')
-    try:
-        max_self_draw_loss_count, max_self_draw_loss_name_list = award_innocent_bystander(conn)
-        max_self_draw_loss_name = ''
-        for x in range(0,len(max_self_draw_loss_name_list)):
-            if x == 0:
-                max_self_draw_loss_name = max_self_draw_loss_name_list[x]
-            else:
-                max_self_draw_loss_name += f', {max_self_draw_loss_name_list[x]}'
-        st.write(f'Number of Games: {max_self_draw_loss_count} | Players: {max_self_draw_loss_name}')
-    except:
+    max_self_draw_loss_count, max_self_draw_loss_name_list = awards['innocent_bystander']
+    if max_self_draw_loss_name_list:
+        st.write(f'Number of Games: {max_self_draw_loss_count} | Players: {", ".join(max_self_draw_loss_name_list)}')
+    else:
         st.error('No data')
     st.divider()
 
     #Arch Nemesis
     st.subheader(':material/sports_kabaddi: Arch Nemesis')
-    try:
-        max_arch_nemesis_count, max_arch_nemesis_name_list = award_arch_nemesis(conn)
-        max_arch_nemesis_name = ''
-        for x in range(0,len(max_arch_nemesis_name_list)):
-            if x == 0:
-                max_arch_nemesis_name = max_arch_nemesis_name_list[x]
-            else:
-                max_arch_nemesis_name += f', {max_arch_nemesis_name_list[x]}'   
-        st.write(f'Number of Games: {max_arch_nemesis_count} | Players: {max_arch_nemesis_name}')
-    except:
+    max_arch_nemesis_count, max_arch_nemesis_name_list = awards['arch_nemesis']
+    if max_arch_nemesis_name_list:
+        st.write(f'Number of Games: {max_arch_nemesis_count} | Players: {", ".join(max_arch_nemesis_name_list)}')
+    else:
         st.error('No data')
     st.divider()
 
     #Go Big or Go Home
     st.subheader(':material/trending_up: Go Big or Go Home')
-    try:
-        big_boy_count, big_boy_name_list = award_big(conn)
-        big_boy_name = ''
-        for x in range(0,len(big_boy_name_list)):
-            if x == 0:
-                big_boy_name = big_boy_name_list[x]
-            else:
-                big_boy_name += f', {big_boy_name_list[x]}'   
-        st.write(f'Average Points: {big_boy_count:,.2f} | Players: {big_boy_name}')
-    except:
+    big_boy_count, big_boy_name_list = awards['big']
+    if big_boy_name_list:
+        st.write(f'Average Points: {big_boy_count:,.2f} | Players: {", ".join(big_boy_name_list)}')
+    else:
         st.error('No data')
     st.divider()
 
     #Charity Champion
     st.subheader(':material/volunteer_activism: Charity Champion')
-    try:
-        charity_count, charity_name_list = award_charity(conn)
-        charity_name = ''
-        for x in range(0,len(charity_name_list)):
-            if x == 0:
-                charity_name = charity_name_list[x]
-            else:
-                charity_name += f', {charity_name_list[x]}'   
-        st.write(f'Games donated: {charity_count:,.2f} | Players: {charity_name}')   
-    except:
+    charity_count, charity_name_list = awards['charity']
+    if charity_name_list:
+        st.write(f'Games donated: {charity_count:,.2f} | Players: {", ".join(charity_name_list)}')
+    else:
         st.error('No data')
     st.divider()
 
     #Self Draw King/Queen
     st.subheader(':material/self_improvement: Self Draw King/Queen')
+    self_draw_count, self_draw_name_list = awards['selfdraw']
+    if self_draw_name_list:
+        st.write(f'Games won: {self_draw_count:,.2f} | Players: {", ".join(self_draw_name_list)}')
+    else:
+        st.error('No data')
+    st.divider()
+
+    league_standings(session_id)
+
+
+
+
+
+@instrument.profiled
+def page_stats():
+    st.title(":material/monitoring: Stats")
+    st.divider()
+    session_id = st.session_state['session_id']
     try:
-        self_draw_count, self_draw_name_list = award_selfdraw(conn)
-        self_draw_name = ''
-        for x in range(0,len(self_draw_name_list)):
-            if x == 0:
-                self_draw_name = self_draw_name_list[x]
+        stats_df, fresh = get_stats(session_id)
+    except Exception as e:
+        st.error(f"Error computing stats: {e}")
+        return
+    updating_notice(('stats', session_id), fresh)
+    if stats_df is None:
+        return
+    if len(stats_df) == 0:
+        st.success('No games recorded')
+        return
+
+    player = st.selectbox("Player", stats_df['Player'])
+    row = stats_df.set_index('Player').to_dict('index')[player]
+    col1, col2, col3, col4 = st.columns([1,1,1,1])
+    col1.metric("Hands", f"{row['Hands']:,}")
+    col2.metric("Wins", f"{row['Wins']:,}", f"{row['WinRate']:.1%}", delta_color='off')
+    col3.metric("Average Points", '-' if pd.isna(row['AveragePoints']) else f"{row['AveragePoints']:,.2f}")
+    col4.metric("Deal-ins", f"{row['DealIns']:,}")
+    st.write(f"Wins: 自摸 {row['SelfDrawWins']:,} | 包自摸 {row['FullSelfDrawWins']:,} | 出銃 {row['OutRightWins']:,}")
+    st.write(f"Losses: 自摸 {row['SelfDrawLosses']:,} | 包自摸 {row['FullSelfDrawLosses']:,} | 出銃 {row['OutRightLosses']:,}")
+
+    st.divider()
+    st.dataframe(stats_df, hide_index=True)
+
+    st.divider()
+    st.write("Balance over Hands")
+    series_df = get_balance_series(db, session_id)
+    chart = alt.Chart(series_df).mark_line(interpolate='step-after').encode(
+        x=alt.X('Hand:Q', title='Hand ID'),
+        y=alt.Y('Amount:Q', title='Balance ($)'),
+        color='Player:N',
+        tooltip=['Player', 'Hand', 'Amount']
+    )
+    st.altair_chart(chart, width='stretch')
+
+    st.write("Balance between Hands")
+    with st.form("balance_range_form"):
+        col1, col2, col3 = st.columns([1,1,2])
+        with col1:
+            first_hand = st.number_input("From hand ID", min_value=1, value=1, step=1)
+        with col2:
+            last_hand = st.number_input("To hand ID", min_value=1, value=int(series_df['Hand'].max()), step=1)
+        with col3:
+            dates = st.date_input("Or between dates", value=[])
+        RANGE_button = st.form_submit_button(":material/date_range: Show")
+
+        if RANGE_button:
+            if len(dates) == 2:
+                change = balance_change_between(db, session_id, dates[0].isoformat(),
+                                                (dates[1] + pd.Timedelta(days=1)).isoformat())
             else:
-                self_draw_name += f', {self_draw_name_list[x]}'   
-        st.write(f'Games won: {self_draw_count:,.2f} | Players: {self_draw_name}')   
-    except:
-        st.error('No data')
+                change = balance_change(db, session_id, int(first_hand), int(last_hand))
+            if len(change) > 0:
+                st.dataframe(pd.DataFrame(change), hide_index=True)
+            else:
+                st.error('No hands in that range')
 
+    st.divider()
+    st.write("Balances as Recorded")
+    with st.form("balance_asof_form"):
+        col1, col2 = st.columns([1,1])
+        with col1:
+            asof_date = st.date_input("Date (UTC)", value=datetime.now(timezone.utc).date())
+        with col2:
+            asof_time = st.time_input("Time (UTC)", value=datetime.now(timezone.utc).time().replace(second=0, microsecond=0))
+        ASOF_button = st.form_submit_button(":material/history: Show")
+
+        if ASOF_button:
+            try:
+                state = get_state_at(db, session_id, recorded=datetime.combine(asof_date, asof_time).strftime('%Y-%m-%d %H:%M:59'))
+                if len(state) > 0:
+                    st.dataframe(state, hide_index=True)
+                else:
+                    st.error('No hands recorded by then')
+            except Exception as e:
+                st.error(f"Error replaying events: {e}")
+
+    with st.expander("Event Log"):
+        st.dataframe(get_events(db, session_id), hide_index=True)
+
+
+@instrument.profiled
+def page_rivalry():
+    st.title(":material/sports_kabaddi: Rivalry")
+    st.divider()
+    session_id = st.session_state['session_id']
+    matrix = get_head_to_head(db, session_id)
+    if len(matrix.names) < 2:
+        st.success('No games recorded')
+        return
+
+    nemesis_count, nemesis_names = arch_nemesis(matrix)
+    if nemesis_names:
+        st.write(f'Arch Nemesis: {", ".join(nemesis_names)} | Number of Games: {nemesis_count}')
 
+    col1, col2 = st.columns([1,1])
+    with col1:
+        measure = st.pills("Show", ['Net $', 'Hands', '出銃/包自摸'], default='Net $', width='stretch')
+    top = len(matrix.names)
+    if top > 2:
+        with col2:
+            top = st.slider("Most active players", 2, top, min(12, top))
+
+    # Keep the busiest players so the heatmap stays readable with a large roster.
+    activity = matrix.hands.sum(0) + matrix.hands.sum(1)
+    keep = np.sort(np.argsort(-activity, kind='stable')[:top])
+    if measure == 'Hands':
+        values = matrix.hands
+    elif measure == '出銃/包自摸':
+        values = matrix.deal_ins
+    else:
+        values = (matrix.points - matrix.points.T)*get_session_profile(db, session_id)[2]
+    values = values[np.ix_(keep, keep)]
+    names = [matrix.names[x] for x in keep]
+    heatmap_df = pd.DataFrame({'Winner': np.repeat(names, len(names)),
+                               'Loser': np.tile(names, len(names)),
+                               'Value': values.ravel().round(2)})
+    chart = alt.Chart(heatmap_df).mark_rect().encode(
+        x=alt.X('Loser:N', sort=names),
+        y=alt.Y('Winner:N', sort=names),
+        color=alt.Color('Value:Q', scale=alt.Scale(scheme='redyellowgreen' if measure == 'Net $' else 'greens')),
+        tooltip=['Winner', 'Loser', 'Value']
+    )
+    st.altair_chart(chart, width='stretch')
+    st.caption('Rows are the winner, columns the loser. Net $ is what the row player won from the column player, less what they lost to them.')
 
 
+# --- DEBUG PANEL ---
+def debug_panel(recorder):
+    with st.expander(":material/speed: Rerun timings"):
+        st.write(f'Total: {recorder.total*1000:,.1f} ms')
+        summary = pd.DataFrame(recorder.summary())
+        if len(summary) > 0:
+            summary['ms'] = (summary.pop('seconds')*1000).round(2)
+        st.dataframe(summary, hide_index=True)
+
 
 # --- MAIN APP ---
 def main():
     selected = option_menu(
         menu_title=None,
-        options=["Calc", "User", "Menu", "Award"],
-        icons=["calculator", "person", "gear", "award"],
+        options=["Calc", "User", "Menu", "Award", "Stats", "Rival"],
+        icons=["calculator", "person", "gear", "award", "bar-chart", "grid-3x3"],
         menu_icon="cast",
         default_index=0,
         orientation="horizontal",
@@ -640,29 +965,31 @@ def main():
         page_awards()
         st.divider()
         st.caption('V1.1.0 © Nelvin Tam')
+    elif selected == "Stats":
+        page_stats()
+        st.divider()
+        st.caption('V1.1.0 © Nelvin Tam')
+    elif selected == "Rival":
+        page_rivalry()
+        st.divider()
+        st.caption('V1.1.0 © Nelvin Tam')
     
 
 if __name__ == "__main__":
     #Set up session state tables
     if 'base_player_list_dedup' not in st.session_state:
-        st.session_state['base_player_list_dedup'] = get_player(conn2)
+        st.session_state['base_player_list_dedup'] = get_player(db)
     if 'base_player_list' not in st.session_state:
-        st.session_state['base_player_list'] = get_player(conn2)
-    if 'game_master' not in st.session_state:
-        st.session_state['game_master'] = []  
-    if 'multipler' not in st.session_state:
-        st.session_state['multipler'] = 0.15
-    if 'calculator_master' not in st.session_state:
-        st.session_state['calculator_master'] = []  
-
-
-
-    #Default scoring system
-    default_scoring = {
-        "Points": [3,4,5,6,7,8,9,10],
-        "SelfDraw": [4,8,12,16,24,32,48,64],
-        "OutRight": [8,16,24,32,48,64,96,128]
-    }
-    default_scoring_df = pd.DataFrame(default_scoring)
-
-    main()
+        st.session_state['base_player_list'] = get_player(db)
+    if 'session_id' not in st.session_state:
+        st.session_state['session_id'] = get_active_session(db)
+
+    if instrument.ENABLED:
+        recorder = instrument.Recorder('rerun')
+        with instrument.recording(recorder):
+            main()
+        recorder.finish()
+        instrument.write_log(recorder)
+        debug_panel(recorder)
+    else:
+        main()
@@ -0,0 +1,53 @@
+import os
+import sys
+from contextlib import contextmanager
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mahjong_calculator import open_database  # noqa: E402
+from mahjong_calculator.database import create_session  # noqa: E402
+from mahjong_calculator.transfer import import_records  # noqa: E402
+from mahjong_calculator.workload import generate_games  # noqa: E402
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = open_database(str(tmp_path / 'test.db'))
+    yield db
+    db.close()
+
+
+@pytest.fixture
+def session_id(db):
+    session_id = create_session(db, 'test')
+    import_records(db, session_id, generate_games(300, seed=1).drop(columns='ID').to_dict('records'))
+    return session_id
+
+
+@pytest.fixture
+def query_plans(db):
+    """query_plans(call) runs call() and returns {SELECT statement: [plan lines]} for the reads it made."""
+    def run(call):
+        statements = []
+        read = db.read
+
+        @contextmanager
+        def traced():
+            with read() as conn:
+                conn.set_trace_callback(statements.append)
+                try:
+                    yield conn
+                finally:
+                    conn.set_trace_callback(None)
+
+        db.read = traced
+        try:
+            call()
+        finally:
+            db.read = read
+        with db.read() as conn:
+            return {statement: [row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + statement)]
+                    for statement in statements if statement.lstrip().upper().startswith('SELECT')}
+    return run
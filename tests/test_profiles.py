@@ -0,0 +1,21 @@
+# Compiled payoff tables are kept per profile, latest revision only, so
+# editing a profile over and over does not grow the cache.
+from mahjong_calculator.database import save_profile
+from mahjong_calculator.profiles import COMPILED, get_session_payoffs, session_payoffs
+from mahjong_calculator.schema import PROFILE_TABLE
+from mahjong_calculator.settlement import DEFAULT_SCORING
+
+
+def test_edits_replace_the_compiled_table(db, session_id):
+    profile_id = save_profile(db, 'House', DEFAULT_SCORING, 1)
+    size = len(COMPILED)
+    for step in range(1, 6):
+        scoring = DEFAULT_SCORING.assign(OutRight=DEFAULT_SCORING['OutRight'] + step)
+        save_profile(db, 'House', scoring, 1, profile_id)
+        with db.read() as conn:
+            revision = conn.execute(f"SELECT Revision FROM {PROFILE_TABLE} WHERE ID = ?", (profile_id,)).fetchone()[0]
+        assert len(COMPILED) == size
+        assert COMPILED[profile_id][0] == revision
+        assert list(COMPILED[profile_id][1].scoring['OutRight']) == list(scoring['OutRight'])
+    with db.read() as conn:
+        assert session_payoffs(conn, session_id) is get_session_payoffs(db, session_id)
@@ -0,0 +1,68 @@
+# EXPLAIN QUERY PLAN checks for the reads the pages make on every rerun.
+#
+# Each test runs the real function against a small session with a trace on
+# the reader connections, then asserts on the plan of every SELECT it ran.
+from datetime import date
+
+from mahjong_calculator import load_awards
+from mahjong_calculator.database import get_history_page
+from mahjong_calculator.rivalry import get_head_to_head
+from mahjong_calculator.rollups import get_leaderboard
+from mahjong_calculator.schema import GAME_TABLE
+from mahjong_calculator.series import balance_change_between
+from mahjong_calculator.simulation import get_frequencies
+
+
+def plan_lines(plans):
+    return [line for lines in plans.values() for line in lines]
+
+
+def test_awards_search_derived_tables(db, session_id, query_plans):
+    plans = plan_lines(query_plans(lambda: load_awards(db, session_id)))
+    assert any(line.startswith('SEARCH s USING') and '(SessionID=?)' in line for line in plans)
+    assert 'SEARCH head_to_head USING PRIMARY KEY (SessionID=?)' in plans
+    assert not any(GAME_TABLE in line or line.startswith('SCAN') for line in plans)
+
+
+def test_head_to_head_searches_primary_key(db, session_id, query_plans):
+    plans = plan_lines(query_plans(lambda: get_head_to_head(db, session_id)))
+    assert 'SEARCH head_to_head USING PRIMARY KEY (SessionID=?)' in plans
+    assert not any(line.startswith('SCAN') for line in plans)
+
+
+def test_history_page_uses_session_index(db, session_id, query_plans):
+    plans = plan_lines(query_plans(lambda: get_history_page(db, session_id, 25, before_id=100)))
+    assert 'SEARCH g USING INDEX idx_game_log_session (SessionID=? AND ID<?)' in plans
+    assert not any(line.startswith('SCAN') or 'TEMP B-TREE' in line for line in plans)
+
+
+def test_history_win_type_filter_uses_wintype_index(db, session_id, query_plans):
+    plans = plan_lines(query_plans(lambda: get_history_page(db, session_id, 25, win_type='自摸')))
+    assert 'SEARCH g USING INDEX idx_game_log_session_wintype (SessionID=? AND WinType=?)' in plans
+
+
+def test_balance_between_dates_uses_played_index(db, session_id, query_plans):
+    plans = plan_lines(query_plans(lambda: balance_change_between(db, session_id, '2020-01-01', '2030-01-01')))
+    assert any('idx_game_log_session_played (SessionID=? AND Played>?)' in line for line in plans)
+    assert any('idx_game_log_session_played (SessionID=? AND Played<?)' in line for line in plans)
+    assert not any(line.startswith(f'SCAN {GAME_TABLE}') for line in plans)
+
+
+def test_simulation_frequencies_use_session_indexes(db, session_id, query_plans):
+    plans = plan_lines(query_plans(lambda: get_frequencies(db, session_id)))
+    assert 'SEARCH game_log USING INDEX idx_game_log_session_wintype (SessionID=?)' in plans
+    assert not any(line.startswith(f'SCAN {GAME_TABLE}') for line in plans)
+
+
+def test_leaderboard_reads_rollups_not_hands(db, session_id, query_plans):
+    plans = plan_lines(query_plans(lambda: get_leaderboard(db, date(2026, 1, 1), date(2026, 12, 31), session_id)))
+    assert any(line.startswith('SEARCH r USING') and 'Grain=? AND Bucket=?' in line for line in plans)
+    assert not any(GAME_TABLE in line for line in plans)
+
+
+def test_unused_seat_indexes_are_dropped(db):
+    with db.read() as conn:
+        indexes = {x[0] for x in conn.execute(f"SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = '{GAME_TABLE}'")}
+    assert f'idx_{GAME_TABLE}_session_loser1' not in indexes
+    assert f'idx_{GAME_TABLE}_session_winner_loser1' not in indexes
+    assert {f'idx_{GAME_TABLE}_session', f'idx_{GAME_TABLE}_session_wintype', f'idx_{GAME_TABLE}_session_played'} <= indexes
@@ -0,0 +1,63 @@
+# rescore_session() rebuilds from one read of the hands and one of the events;
+# with the profile unchanged it must land on what the triggers maintained.
+from mahjong_calculator.database import (clear_session, correct_game, get_games, remove_last_game, rescore_session,
+                                         void_game)
+from mahjong_calculator.events import (combine, empty_state, hand_totals, record_events, signed_hands, state_at,
+                                       stored_state)
+from mahjong_calculator.profiles import session_payoffs
+from mahjong_calculator.schema import (BALANCE_TABLE, EVENT_TABLE, GAME_TABLE, MATRIX_TABLE, PLAYER_TABLE, ROLLUP_TABLE,
+                                       SERIES_TABLE, STATS_COLUMNS)
+from mahjong_calculator.transfer import import_records
+from mahjong_calculator.workload import generate_games
+
+DERIVED = [BALANCE_TABLE, MATRIX_TABLE, SERIES_TABLE, ROLLUP_TABLE]
+
+
+def derived(db, session_id):
+    with db.read() as conn:
+        return {table: sorted(conn.execute(f"SELECT * FROM {table} WHERE SessionID = ?", (session_id,)).fetchall())
+                for table in DERIVED}
+
+
+def test_rescore_matches_triggers(db, session_id):
+    ids = list(get_games(db, session_id)['ID'])
+    void_game(db, session_id, int(ids[3]))
+    correct_game(db, session_id, int(ids[10]), 'P001', 'P002', 'P003', 'P004', '自摸', 5)
+    correct_game(db, session_id, int(ids[10]), 'P002', 'P001', None, None, '出銃', 6)
+    remove_last_game(db, session_id)
+    before = derived(db, session_id)
+    db.write(lambda conn: rescore_session(conn, session_id))
+    assert derived(db, session_id) == before
+
+
+def test_rescored_snapshots_replay_events(db, session_id):
+    import_records(db, session_id, generate_games(400, seed=2).drop(columns='ID').to_dict('records'))
+    clear_session(db, session_id)
+    import_records(db, session_id, generate_games(700, seed=3).drop(columns='ID').to_dict('records'))
+    ids = list(get_games(db, session_id)['ID'])
+    void_game(db, session_id, int(ids[0]))
+    correct_game(db, session_id, int(ids[1]), 'P003', 'P004', None, None, '包自摸', 4)
+    db.write(lambda conn: rescore_session(conn, session_id))
+    with db.read() as conn:
+        scoring = session_payoffs(conn, session_id)
+        events = [x[0] for x in conn.execute(f"SELECT EventID FROM {EVENT_TABLE} WHERE SessionID = ? ORDER BY EventID",
+                                             (session_id,))]
+        cleared = conn.execute(f"SELECT MAX(EventID) FROM {EVENT_TABLE} WHERE SessionID = ? AND Kind = 'clear'",
+                               (session_id,)).fetchone()[0]
+        for event_id in [x for x in events if x > cleared][::97]:
+            replayed = combine(empty_state(), hand_totals(signed_hands(conn, session_id, cleared, event_id), scoring))
+            assert state_at(conn, session_id, event_id).sort_index().equals(replayed.sort_index())
+
+
+def test_null_win_type_counts_no_win(db, session_id):
+    # Old rows can have no WinType; the stats triggers count such a hand as no win of any kind, and so must the replay.
+    def job(conn):
+        game_id = conn.execute(f"INSERT INTO {GAME_TABLE} (SessionID, WinnerID, Loser1ID, WinType, Points) "
+                               f"SELECT ?, MIN(ID), MAX(ID), NULL, 5 FROM {PLAYER_TABLE}", (session_id,)).lastrowid
+        record_events(conn, 'add', 'g.ID = ?', (game_id,))
+    db.write(job)
+    db.write(lambda conn: rescore_session(conn, session_id))
+    with db.read() as conn:
+        replayed = state_at(conn, session_id)[STATS_COLUMNS].sort_index()
+        stored = stored_state(conn, session_id)[STATS_COLUMNS].sort_index()
+    assert replayed.equals(stored)
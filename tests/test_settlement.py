@@ -0,0 +1,31 @@
+# settle() must agree with the loop it replaced on every win type and points
+# value, with a multiplier that is not 1.
+import itertools
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from mahjong_calculator.benchmarks import legacy_calculator
+from mahjong_calculator.settlement import DEFAULT_SCORING, SELF_DRAW, WIN_TYPES, settle
+from mahjong_calculator.workload import generate_games
+
+SCORINGS = [DEFAULT_SCORING, DEFAULT_SCORING.assign(SelfDraw=DEFAULT_SCORING['SelfDraw'] + 1,
+                                                    OutRight=DEFAULT_SCORING['OutRight'] * 3)]
+
+
+@pytest.mark.parametrize('scoring', SCORINGS)
+@pytest.mark.parametrize('multiplier', [0.15, 1.35])
+def test_settle_matches_legacy_loop(scoring, multiplier):
+    games = generate_games(2000, seed=7, scoring=scoring)
+    # Every win type at every points value, on top of the generated mix.
+    combos = pd.DataFrame(list(itertools.product(WIN_TYPES, scoring['Points'])), columns=['WinType', 'Points'])
+    rows = games[games['WinType'] == SELF_DRAW].iloc[:len(combos)].reset_index(drop=True)
+    rows[['WinType', 'Points']] = combos
+    rows.loc[rows['WinType'] != SELF_DRAW, ['Loser2', 'Loser3']] = None
+    games = pd.concat([games, rows], ignore_index=True)
+
+    legacy = legacy_calculator(games, multiplier, scoring)
+    batch = settle(games, multiplier, scoring)
+    assert batch['Player'].tolist() == legacy['Player'].tolist()
+    np.testing.assert_allclose(batch['Amount'], legacy['Amount'], rtol=0, atol=1e-9)
@@ -0,0 +1,50 @@
+# Many threads writing at once go through the single writer and lose nothing;
+# python -m mahjong_calculator.stress is the same check at a larger scale.
+import random
+import threading
+
+from mahjong_calculator.database import add_game, add_player, create_session
+from mahjong_calculator.ledger import verify_ledger
+from mahjong_calculator.schema import GAME_TABLE, PLAYER_TABLE
+from mahjong_calculator.settlement import OUT_RIGHT, SELF_DRAW
+
+WRITERS = 8
+HANDS = 40
+
+
+def test_concurrent_writers(db):
+    session_ids = [create_session(db, f'stress {x}') for x in range(WRITERS)]
+    with db.read() as conn:
+        players_before = conn.execute(f"SELECT COUNT(*) FROM {PLAYER_TABLE}").fetchone()[0]
+    errors = []
+
+    def writer(n, session_id):
+        # Each writer seats two players of its own and two shared with every other writer.
+        rng = random.Random(n)
+        table = [f'Writer {n} A', f'Writer {n} B', 'Shared C', 'Shared D']
+        try:
+            for x in range(HANDS):
+                rng.shuffle(table)
+                if x % 2:
+                    add_game(db, session_id, *table, SELF_DRAW, rng.randint(3, 10))
+                else:
+                    add_game(db, session_id, table[0], table[1], None, None, OUT_RIGHT, rng.randint(3, 10))
+                if x == HANDS // 2:
+                    add_player(db, f'Bench {n}')
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=writer, args=(n, session_id)) for n, session_id in enumerate(session_ids)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    with db.read() as conn:
+        counts = dict(conn.execute(f"SELECT SessionID, COUNT(*) FROM {GAME_TABLE} GROUP BY SessionID"))
+        players = conn.execute(f"SELECT COUNT(*) FROM {PLAYER_TABLE}").fetchone()[0]
+    assert counts == {session_id: HANDS for session_id in session_ids}
+    assert players == players_before + 3*WRITERS + 2
+    for session_id in session_ids:
+        assert verify_ledger(db, session_id) == []
@@ -0,0 +1,80 @@
+# Imports update the derived tables from each chunk in memory; they must
+# agree with a recount of game_log, across chunks and with hands already there.
+from mahjong_calculator import transfer
+from mahjong_calculator.database import add_game, void_game
+from mahjong_calculator.events import verify_events
+from mahjong_calculator.ledger import verify_ledger
+from mahjong_calculator.rollups import verify_rollups
+from mahjong_calculator.schema import GAME_TABLE, SERIES_TABLE, series_backfill
+from mahjong_calculator.stats import verify_stats
+from mahjong_calculator.transfer import import_records, validate_row
+from mahjong_calculator.workload import generate_games
+
+
+def test_chunked_import_matches_recount(db, session_id):
+    add_game(db, session_id, 'P001', 'P002', None, None, '出銃', 5)
+    void_game(db, session_id, 1)
+    records = generate_games(500, seed=4).drop(columns='ID').to_dict('records')
+    for record in records[::3]:
+        record['Played'] = None
+    imported, errors = import_records(db, session_id, records, chunk_size=120)
+    assert (imported, errors) == (500, [])
+    assert verify_ledger(db, session_id) == []
+    assert verify_stats(db, session_id) == []
+    assert verify_events(db, session_id) == []
+    assert verify_rollups(db, session_id) == []
+    with db.read() as conn:
+        assert conn.execute(f"SELECT COUNT(*) FROM {GAME_TABLE} WHERE SessionID = ? AND Played IS NULL",
+                            (session_id,)).fetchone()[0] == 0
+        stored = sorted(conn.execute(f"SELECT * FROM {SERIES_TABLE} WHERE SessionID = ?", (session_id,)))
+        conn.execute('SAVEPOINT recount')
+        conn.execute(f"DELETE FROM {SERIES_TABLE} WHERE SessionID = ?", (session_id,))
+        conn.execute(series_backfill(f'g.SessionID = {session_id}'))
+        recounted = sorted(conn.execute(f"SELECT * FROM {SERIES_TABLE} WHERE SessionID = ?", (session_id,)))
+        conn.execute('ROLLBACK TO recount')
+        conn.execute('RELEASE recount')
+    assert stored == recounted
+
+
+def test_fractional_points_are_rejected(db, session_id):
+    records = [{'Winner': 'P001', 'Loser1': 'P002', 'WinType': '出銃', 'Points': points}
+               for points in (5.7, '6.5', 5.0, '7', 'x')]
+    imported, errors = import_records(db, session_id, records)
+    assert imported == 2
+    assert errors == [(1, 'Points must be a whole number, got 5.7'), (2, 'Points must be a whole number, got 6.5'),
+                      (5, 'Points must be a number, got x')]
+
+
+def test_played_with_offset_is_stored_in_utc():
+    row = {'Winner': 'P001', 'Loser1': 'P002', 'WinType': '出銃', 'Points': 5}
+    played = [validate_row(dict(row, Played=x), {5})[0][-1]
+              for x in ('2024-01-01T23:30:00-05:00', '2024-01-01T23:30:00Z', '2024-01-01 23:30:00')]
+    assert played == ['2024-01-02 04:30:00', '2024-01-01 23:30:00', '2024-01-01 23:30:00']
+
+
+def test_failed_chunk_stops_import_and_reports_progress(db, session_id, monkeypatch):
+    calls = []
+    add_stats = transfer.add_stats
+
+    def failing(conn, session_id, entries):
+        # The third chunk's write job fails; the first two are already committed.
+        calls.append(session_id)
+        if len(calls) == 3:
+            raise RuntimeError('disk full')
+        add_stats(conn, session_id, entries)
+
+    monkeypatch.setattr(transfer, 'add_stats', failing)
+    records = generate_games(400, seed=5).drop(columns='ID').to_dict('records')
+    records[50]['Points'] = 0.5
+    records[260]['Points'] = 0.5
+    with db.read() as conn:
+        before = conn.execute(f"SELECT COUNT(*) FROM {GAME_TABLE} WHERE SessionID = ?", (session_id,)).fetchone()[0]
+    imported, errors = import_records(db, session_id, records, chunk_size=100)
+    assert imported == 200
+    assert errors == [(51, 'Points must be a whole number, got 0.5'),
+                      (202, 'Import stopped; this row and the rows after it were not written: disk full')]
+    with db.read() as conn:
+        assert conn.execute(f"SELECT COUNT(*) FROM {GAME_TABLE} WHERE SessionID = ?",
+                            (session_id,)).fetchone()[0] == before + 200
+    assert verify_ledger(db, session_id) == []
+    assert verify_stats(db, session_id) == []